@@ -0,0 +1,547 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+from catalog import DataCatalog
+from dedup import UpdateDeduplicator
+from logs import log_context
+from middleware import Pipeline
+from journal import WriteJournal, OfflineWrites, journal_path
+from intake import UpdateIntake, parse_priorities, DEFAULT_TENANT, QUEUE_SIZE, WORKERS
+from sessions import SessionStore, MAX_SESSIONS
+
+logger = logging.getLogger(__name__)
+
+# Пауза между повторными попытками подключиться к БД после ошибки (секунды)
+DB_RETRY_INTERVAL = 30
+
+# Приложение, обрабатывающее обновление в текущем потоке, и приложение по
+# умолчанию для однопользовательского запуска
+_current = threading.local()
+_default = None
+
+
+def current_app():
+    """Приложение текущего потока или приложение по умолчанию"""
+    return getattr(_current, 'app', None) or _default
+
+
+def set_default_app(application):
+    global _default
+    _default = application
+
+
+class CurrentApplication:
+    """Прокси для обработчиков: атрибуты берутся у current_app().
+
+    Обработчики общие для всех ботов процесса и обращаются к app.db,
+    app.bot и т.д.; каждый бот выполняет диспетчеризацию внутри
+    Application.activate(), поэтому прокси указывает на нужное приложение.
+    """
+
+    def __getattr__(self, name):
+        application = current_app()
+        if application is None:
+            raise RuntimeError("Приложение не создано, вызовите create_app()")
+        return getattr(application, name)
+
+
+class StartupReport:
+    """Замеры времени импорта и инициализации компонентов при старте"""
+
+    def __init__(self):
+        self.timings = []
+
+    def record(self, name, seconds):
+        self.timings.append((name, seconds))
+
+    @contextmanager
+    def measure(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def total(self):
+        return sum(seconds for _, seconds in self.timings)
+
+    def format(self):
+        lines = ["⏱ Время запуска:"]
+        for name, seconds in self.timings:
+            lines.append(f"   • {name}: {seconds * 1000:.1f} мс")
+        lines.append(f"   • всего: {self.total() * 1000:.1f} мс")
+        return "\n".join(lines)
+
+
+class Application:
+    """Контейнер зависимостей бота с ленивой инициализацией.
+
+    Конструктор только запоминает настройки и не выполняет ввода-вывода:
+    база данных, каталог данных и клиент Telegram создаются при первом
+    обращении к соответствующему свойству.
+
+    В многопользовательском режиме (tenants.py) несколько приложений делят
+    переданные intake и dedup, а queue_limit, max_sessions и
+    snapshot_interval задают лимиты ресурсов конкретного бота.
+
+    middleware - шаги конвейера вокруг обработчиков сообщений
+    (middleware.py), по умолчанию учет пользователя, лог запроса, замер
+    времени и обработка ошибок.
+
+    jobs=False откладывает фоновые задачи (обновление снимка аналитики,
+    снимки диалогов, обслуживание, резервные копии и мониторинг БД) до start_jobs(): так работает резервная реплика,
+    пока лидер не потеряет аренду (leader.py).
+    """
+
+    def __init__(self, token=None, data_folder='data', db_path='gameboard_bot.db',
+                 handlers=(), report=None, name=DEFAULT_TENANT, intake=None, dedup=None,
+                 queue_limit=None, max_sessions=MAX_SESSIONS, snapshot_interval=None,
+                 jobs=True, middleware=None):
+        self.token = token
+        self.data_folder = data_folder
+        self.db_path = db_path
+        self.handlers = list(handlers)
+        self.report = report or StartupReport()
+        self.name = name
+        self.dedup = dedup or UpdateDeduplicator()
+        self.queue_limit = queue_limit
+        self.max_sessions = max_sessions
+        self.snapshot_interval = snapshot_interval
+        self.jobs = jobs
+        self.pipeline = Pipeline(middleware)
+
+        self._lock = threading.RLock()
+        self._db = None
+        self._db_error = None
+        self._db_failed_at = None
+        self._bot = None
+        self._catalog = None
+        self._search = None
+        self._faq = None
+        self._sessions = None
+        self._exports = None
+        self._intake = intake
+        self._owns_intake = intake is None
+        self._snapshot = None
+        self._maintenance = None
+        self._backups = None
+        self._journal = None
+        self._offline = None
+        self._health = None
+
+    @contextmanager
+    def activate(self):
+        """Сделать приложение текущим для обработчиков в этом потоке"""
+        previous = getattr(_current, 'app', None)
+        _current.app = self
+        try:
+            yield self
+        finally:
+            _current.app = previous
+
+    # ---------- База данных ----------
+
+    @property
+    def db(self):
+        """DatabaseManager или None, если БД недоступна"""
+        if self._db is None:
+            self._init_db()
+        return self._db
+
+    @property
+    def db_available(self):
+        return self.db is not None
+
+    @property
+    def db_error(self):
+        return self._db_error
+
+    @property
+    def journal(self):
+        """Журнал записей на время недоступности БД (WRITE_JOURNAL или файл рядом с БД)"""
+        if self._journal is None:
+            with self._lock:
+                if self._journal is None:
+                    self._journal = WriteJournal(self._journal_path())
+        return self._journal
+
+    def _journal_path(self):
+        path = os.getenv('WRITE_JOURNAL')
+        if not path:
+            return journal_path(self.db_path)
+        if self.name != DEFAULT_TENANT:
+            # Журнал воспроизводится в БД своего бота, поэтому у каждого бота
+            # свой файл: gameboard_bot.journal -> gameboard_bot.shop2.journal
+            root, ext = os.path.splitext(path)
+            path = f"{root}.{self.name}{ext}"
+        return path
+
+    @property
+    def writes(self):
+        """Получатель записей (пользователи, лог запросов, заказы): DatabaseManager
+        или, пока БД не удалось открыть, журнал с теми же методами"""
+        db = self.db
+        if db is not None:
+            return db
+        if self._offline is None:
+            self._offline = OfflineWrites(self.journal)
+        return self._offline
+
+    def check_db(self):
+        """Открыть БД, если она еще не открыта, и проверить запись в нее"""
+        if self._db is None:
+            with self._lock:
+                self._db_failed_at = None
+            self._init_db()
+            if self._db is not None:
+                # Задачи, не созданные при запуске без БД, запускаются сейчас,
+                # а не при первой команде администратора
+                self.snapshot
+                self.maintenance
+                self.backups
+        db = self._db
+        return db is not None and db.check_health()
+
+    def _init_db(self):
+        with self._lock:
+            if self._db is not None:
+                return
+            if self._db_failed_at is not None and \
+                    time.monotonic() - self._db_failed_at < DB_RETRY_INTERVAL:
+                return
+            try:
+                with self.report.measure('init database'):
+                    from database import DatabaseManager
+                    self._db = DatabaseManager(self.db_path, journal=self.journal, jobs=self.jobs)
+                self._db_error = None
+                self._db_failed_at = None
+                logger.info("✅ База данных подключена успешно")
+            except Exception as e:
+                self._db_error = e
+                self._db_failed_at = time.monotonic()
+                logger.error(f"❌ Ошибка инициализации БД: {e}")
+
+    def close(self):
+        """Дописать отложенные записи и освободить ресурсы"""
+        if self._intake is not None and self._owns_intake:
+            self._intake.stop()
+        if self._snapshot:
+            self._snapshot.stop()
+        if self._maintenance:
+            self._maintenance.stop()
+        if self._backups:
+            self._backups.stop()
+        if self._health:
+            self._health.stop()
+        if self._db is not None:
+            if self._sessions is not None:
+                self._sessions.stop_snapshots(self._db)
+            self._db.close()
+
+    # ---------- Фоновые задачи ----------
+
+    def start_jobs(self):
+        """Запустить фоновые задачи (реплика стала лидером)"""
+        with self._lock:
+            self.jobs = True
+            # Диалоги пересоздаются из снимка, сохраненного прежним лидером
+            self._sessions = None
+            if self._snapshot:
+                self._snapshot.start()
+            if self._maintenance:
+                self._maintenance.start()
+            if self._backups:
+                self._backups.start()
+            if self._health:
+                self._health.start()
+        if self._db is not None:
+            self._db.start_jobs()
+        self.snapshot
+        self.maintenance
+        self.backups
+        self.health
+
+    def stop_jobs(self):
+        """Остановить фоновые задачи (реплика потеряла лидерство)"""
+        with self._lock:
+            self.jobs = False
+            if self._snapshot:
+                self._snapshot.stop()
+            if self._maintenance:
+                self._maintenance.stop()
+            if self._backups:
+                self._backups.stop()
+            if self._health:
+                self._health.stop()
+            if self._sessions is not None:
+                # Снимок диалогов теперь ведет новый лидер, не перезаписываем его
+                self._sessions.stop_snapshots(self._db, save=False)
+                self._sessions = None
+
+    # ---------- Обслуживание БД ----------
+
+    @property
+    def maintenance(self):
+        """MaintenanceScheduler или None (БД недоступна или MAINTENANCE_INTERVAL=0)"""
+        if self._maintenance is None and self.db is not None:
+            with self._lock:
+                if self._maintenance is None:
+                    self._maintenance = self._create_maintenance()
+        return self._maintenance or None
+
+    def _create_maintenance(self):
+        from maintenance import MaintenanceScheduler, CHECK_INTERVAL, LOW_TRAFFIC_RATE
+
+        interval = float(os.getenv('MAINTENANCE_INTERVAL', CHECK_INTERVAL))
+        if interval <= 0:
+            return False
+        maintenance = MaintenanceScheduler(
+            self.db_path,
+            traffic=self._accepted_updates,
+            check_interval=interval,
+            low_traffic_rate=float(os.getenv('MAINTENANCE_LOW_TRAFFIC', LOW_TRAFFIC_RATE))
+        )
+        if self.jobs:
+            maintenance.start()
+        return maintenance
+
+    def _accepted_updates(self):
+        """Сколько обновлений этого бота принято в очередь с запуска"""
+        tenant = self._intake.tenants.get(self.name) if self._intake is not None else None
+        return tenant.accepted if tenant is not None else 0
+
+    # ---------- Мониторинг БД ----------
+
+    @property
+    def health(self):
+        """HealthMonitor; HEALTH_CHECK_INTERVAL <= 0 не принимается.
+
+        В отличие от остальных фоновых задач создается и без открытой БД:
+        именно монитор открывает ее, когда она станет доступна.
+        """
+        if self._health is None:
+            with self._lock:
+                if self._health is None:
+                    self._health = self._create_health()
+        return self._health
+
+    def _create_health(self):
+        from health import HealthMonitor, HEALTH_CHECK_INTERVAL
+
+        interval = float(os.getenv('HEALTH_CHECK_INTERVAL', HEALTH_CHECK_INTERVAL))
+        if interval <= 0:
+            # Без монитора журнал не воспроизводится, а degraded не сбрасывается
+            logger.error("❌ HEALTH_CHECK_INTERVAL должен быть больше 0, "
+                         f"используется {HEALTH_CHECK_INTERVAL} с")
+            interval = HEALTH_CHECK_INTERVAL
+        health = HealthMonitor(self.check_db, interval=interval)
+        if self.jobs:
+            health.start()
+        return health
+
+    # ---------- Резервные копии ----------
+
+    @property
+    def backups(self):
+        """BackupManager или None (БД недоступна или BACKUP_INTERVAL=0)"""
+        if self._backups is None and self.db is not None:
+            with self._lock:
+                if self._backups is None:
+                    self._backups = self._create_backups()
+        return self._backups or None
+
+    def _create_backups(self):
+        from backup import BackupManager, parse_retention, BACKUP_INTERVAL
+
+        interval = float(os.getenv('BACKUP_INTERVAL', BACKUP_INTERVAL))
+        if interval <= 0:
+            return False
+        folder = os.getenv('BACKUP_DIR')
+        if folder and self.name != DEFAULT_TENANT:
+            # Копии ботов с одинаковым именем файла БД не должны смешиваться
+            folder = os.path.join(folder, self.name)
+        backups = BackupManager(
+            self.db_path,
+            folder=folder,
+            interval=interval,
+            retention=parse_retention(os.getenv('BACKUP_RETENTION'))
+        )
+        if self.jobs:
+            backups.start()
+        return backups
+
+    # ---------- Снимок для аналитики ----------
+
+    @property
+    def snapshot(self):
+        """AnalyticsSnapshot или None, если снимки отключены (SNAPSHOT_INTERVAL=0)"""
+        if self._snapshot is None and self.db is not None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = self._create_snapshot()
+        return self._snapshot or None
+
+    def _create_snapshot(self):
+        from snapshot import AnalyticsSnapshot, parse_freshness, SNAPSHOT_INTERVAL
+
+        interval = self.snapshot_interval
+        if interval is None:
+            interval = float(os.getenv('SNAPSHOT_INTERVAL', SNAPSHOT_INTERVAL))
+        if interval <= 0:
+            return False
+        snapshot = AnalyticsSnapshot(
+            self.db_path,
+            interval=interval,
+            freshness=parse_freshness(os.getenv('SNAPSHOT_FRESHNESS'))
+        )
+        if self.jobs:
+            snapshot.start()
+        return snapshot
+
+    def analytics(self, command):
+        """Источник для тяжелой команды: снимок, если он достаточно свежий, иначе рабочая БД"""
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.is_fresh(command):
+            return snapshot.reader
+        return self.db
+
+    # ---------- Каталог данных ----------
+
+    @property
+    def catalog(self):
+        if self._catalog is None:
+            with self._lock:
+                if self._catalog is None:
+                    self._catalog = DataCatalog(self.data_folder)
+        return self._catalog
+
+    @property
+    def search(self):
+        """Индекс inline-поиска по каталогу"""
+        if self._search is None:
+            with self._lock:
+                if self._search is None:
+                    from search import CatalogSearch
+                    self._search = CatalogSearch(self.catalog)
+        return self._search
+
+    @property
+    def faq(self):
+        """Ответы на свободные вопросы по данным каталога"""
+        if self._faq is None:
+            with self._lock:
+                if self._faq is None:
+                    from faq import FaqEngine
+                    self._faq = FaqEngine(self.catalog)
+        return self._faq
+
+    # ---------- Выгрузки ----------
+
+    @property
+    def exports(self):
+        """Ограничение /export: EXPORT_COOLDOWN на пользователя и EXPORT_CONCURRENCY всего"""
+        if self._exports is None:
+            with self._lock:
+                if self._exports is None:
+                    from export import ExportLimiter, EXPORT_COOLDOWN, EXPORT_CONCURRENCY
+                    self._exports = ExportLimiter(
+                        cooldown=float(os.getenv('EXPORT_COOLDOWN', EXPORT_COOLDOWN)),
+                        concurrency=int(os.getenv('EXPORT_CONCURRENCY', EXPORT_CONCURRENCY))
+                    )
+        return self._exports
+
+    # ---------- Диалоги ----------
+
+    @property
+    def sessions(self):
+        """Хранилище диалогов; снимки в БД включаются SESSION_SNAPSHOT_INTERVAL"""
+        if self._sessions is None:
+            with self._lock:
+                if self._sessions is None:
+                    self._sessions = self._create_sessions()
+        return self._sessions
+
+    def _create_sessions(self):
+        sessions = SessionStore(maxsize=self.max_sessions)
+        interval = float(os.getenv('SESSION_SNAPSHOT_INTERVAL', '0'))
+        if self.jobs and interval > 0 and self.db is not None:
+            sessions.restore(self.db)
+            sessions.start_snapshots(self.db, interval)
+        return sessions
+
+    # ---------- Клиент Telegram ----------
+
+    @property
+    def bot(self):
+        if self._bot is None:
+            with self._lock:
+                if self._bot is None:
+                    self._bot = self._create_bot()
+        return self._bot
+
+    def stop_polling(self):
+        if self._bot is not None:
+            self._bot.stop_polling()
+
+    @property
+    def intake(self):
+        """Очередь входящих обновлений (создается вместе с ботом)"""
+        self.bot
+        return self._intake
+
+    def intake_stats(self):
+        """Метрики очереди по обновлениям этого бота"""
+        return self.intake.stats(self.name)
+
+    def _create_bot(self):
+        with self.report.measure('import telebot'):
+            import telebot
+        with self.report.measure('init bot'):
+            token = self.token or os.getenv('BOT_TOKEN') or "ВАШ_ТОКЕН_ЗДЕСЬ"
+            # Другой сервер Bot API: локальный telegram-bot-api или заглушка
+            # fake_api.py для сквозных и нагрузочных тестов
+            api_url = os.getenv('TELEGRAM_API_URL')
+            if api_url:
+                telebot.apihelper.API_URL = api_url.rstrip('/') + '/bot{0}/{1}'
+                telebot.apihelper.FILE_URL = api_url.rstrip('/') + '/file/bot{0}/{1}'
+            # Обработчики выполняются в потоках UpdateIntake, а не в
+            # неограниченном пуле telebot
+            bot = telebot.TeleBot(token, threaded=False)
+            for kind, func, kwargs in self.handlers:
+                # Учет пользователя, лог запроса, замер времени и ошибки -
+                # один раз на сообщение в конвейере middleware
+                if kind == 'message':
+                    func = self.pipeline.wrap(self, func)
+                getattr(bot, f'register_{kind}_handler')(func, **kwargs)
+
+            # Диспетчеризация идет в потоках очереди, общих для всех ботов,
+            # поэтому каждый бот делает себя текущим приложением, а записи
+            # лога получают имя бота и update_id обрабатываемого обновления
+            process_new_updates = bot.process_new_updates
+
+            def process_in_context(updates):
+                with self.activate():
+                    for update in updates:
+                        with log_context(tenant=self.name, update_id=update.update_id):
+                            process_new_updates([update])
+
+            bot.process_new_updates = process_in_context
+
+            # polling -> дедупликация -> очередь с приоритетами -> обработчики
+            if self._intake is None:
+                self._intake = UpdateIntake(
+                    priorities=parse_priorities(os.getenv('INTAKE_PRIORITIES')),
+                    maxsize=int(os.getenv('INTAKE_QUEUE_SIZE', QUEUE_SIZE)),
+                    workers=int(os.getenv('INTAKE_WORKERS', WORKERS))
+                )
+            self._intake.install(
+                bot,
+                tenant=self.name,
+                in_dialog=lambda user_id: user_id in self.sessions,
+                limit=self.queue_limit
+            )
+            self.dedup.install(bot, tenant=self.name)
+        return bot
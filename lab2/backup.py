@@ -0,0 +1,412 @@
+import os
+import sys
+import gzip
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Как часто снимать резервную копию (секунды) и куда ее класть
+BACKUP_INTERVAL = 6 * 60 * 60
+BACKUP_DIR = 'backups'
+# Сколько страниц копировать за шаг backup API и пауза между шагами:
+# между шагами поток записи свободно работает с БД
+PAGES_PER_STEP = 256
+STEP_SLEEP = 0.01
+# Запись в БД из другого соединения перезапускает пошаговое копирование с
+# первой страницы; после стольких перезапусков попытка прекращается
+MAX_RESTARTS = 5
+CHUNK_SIZE = 1024 * 1024
+
+# Политика хранения: последние N копий, плюс самая свежая копия за каждый
+# из N последних дней и за каждую из N последних недель
+RETENTION = {
+    'recent': 4,
+    'daily': 7,
+    'weekly': 4,
+}
+
+NAME_FORMAT = '%Y%m%d-%H%M%S'
+SUFFIX = '.db.gz'
+CHECKSUM_SUFFIX = '.sha256'
+# Таблицы, без которых копия не годится для восстановления
+REQUIRED_TABLES = ('users', 'user_requests', 'orders')
+
+
+def parse_retention(value):
+    """Разбор строки вида "recent:8,daily:14,weekly:8" из переменной окружения"""
+    retention = dict(RETENTION)
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        rule, _, count = item.partition(':')
+        rule = rule.strip()
+        if rule not in RETENTION:
+            logger.error(f"Неизвестное правило хранения копий: {item}")
+            continue
+        try:
+            retention[rule] = max(int(count), 0)
+        except ValueError:
+            logger.error(f"Неверное правило хранения копий: {item}")
+    return retention
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BackupError(Exception):
+    """Копию не удалось снять, или она повреждена и не подходит для восстановления"""
+
+
+def copy_database(source_path, target_path, pages=PAGES_PER_STEP, sleep=STEP_SLEEP,
+                  max_restarts=MAX_RESTARTS):
+    """Пошаговая копия БД через sqlite3 backup API в файл без WAL.
+
+    Перезапуск копирования виден по тому, что число оставшихся страниц
+    снова растет. Если БД постоянно меняется и копирование перезапускается
+    больше max_restarts раз, бросает BackupError вместо бесконечного цикла.
+    Возвращает число перезапусков.
+    """
+    state = {'remaining': None, 'restarts': 0}
+
+    def progress(status, remaining, total):
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > max_restarts:
+                raise BackupError(f"БД менялась во время копирования, "
+                                  f"перезапусков больше {max_restarts}")
+        state['remaining'] = remaining
+
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target, pages=pages, progress=progress, sleep=sleep)
+        # Копия должна открываться без файла -wal
+        target.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        target.close()
+        source.close()
+    return state['restarts']
+
+
+class BackupInfo:
+    """Файл резервной копии и время ее создания (UTC, из имени файла)"""
+
+    __slots__ = ('path', 'created_at', 'size')
+
+    def __init__(self, path, created_at, size):
+        self.path = path
+        self.created_at = created_at
+        self.size = size
+
+    @property
+    def checksum_path(self):
+        return self.path + CHECKSUM_SUFFIX
+
+
+class BackupManager:
+    """Онлайн-копии рабочей БД: сжатые, с контрольной суммой и ротацией.
+
+    Копия снимается через sqlite3 backup API по PAGES_PER_STEP страниц с
+    паузой STEP_SLEEP между шагами, поэтому бот продолжает писать в БД.
+    Результат сжимается gzip, рядом кладется файл .sha256 в формате
+    sha256sum, а старые копии удаляются по политике RETENTION.
+    """
+
+    def __init__(self, db_path, folder=None, interval=BACKUP_INTERVAL, retention=None):
+        self.db_path = db_path
+        self.folder = folder or os.path.join(os.path.dirname(os.path.abspath(db_path)), BACKUP_DIR)
+        self.interval = interval
+        self.retention = retention if retention is not None else dict(RETENTION)
+        self.prefix = os.path.splitext(os.path.basename(db_path))[0] + '-'
+        self.backups_made = 0
+        self.last_duration = None
+        self.last_error = None
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---------- Список копий ----------
+
+    def list(self):
+        """Копии этой БД, от старых к новым"""
+        if not os.path.isdir(self.folder):
+            return []
+        backups = []
+        for name in os.listdir(self.folder):
+            if not (name.startswith(self.prefix) and name.endswith(SUFFIX)):
+                continue
+            try:
+                created_at = datetime.strptime(name[len(self.prefix):-len(SUFFIX)], NAME_FORMAT)
+            except ValueError:
+                continue
+            path = os.path.join(self.folder, name)
+            backups.append(BackupInfo(path, created_at.replace(tzinfo=timezone.utc),
+                                      os.path.getsize(path)))
+        return sorted(backups, key=lambda backup: backup.created_at)
+
+    def age(self):
+        """Возраст последней копии в секундах или None, если копий нет"""
+        backups = self.list()
+        if not backups:
+            return None
+        return time.time() - backups[-1].created_at.timestamp()
+
+    # ---------- Создание ----------
+
+    def create(self):
+        """Снять копию, сжать ее, записать контрольную сумму и применить ротацию.
+
+        Если копирование не завершилось из-за постоянных записей, бросает
+        BackupError; следующая попытка - через interval или по /backup run.
+        """
+        with self._lock:
+            started = time.perf_counter()
+            os.makedirs(self.folder, exist_ok=True)
+            stamp = datetime.now(timezone.utc).strftime(NAME_FORMAT)
+            path = os.path.join(self.folder, f"{self.prefix}{stamp}{SUFFIX}")
+            raw_path = path + '.raw.tmp'
+            tmp_path = path + '.tmp'
+            try:
+                restarts = copy_database(self.db_path, raw_path)
+
+                with open(raw_path, 'rb') as raw, gzip.open(tmp_path, 'wb') as compressed:
+                    shutil.copyfileobj(raw, compressed, CHUNK_SIZE)
+                checksum = file_sha256(tmp_path)
+                os.replace(tmp_path, path)
+                with open(path + CHECKSUM_SUFFIX, 'w') as f:
+                    f.write(f"{checksum}  {os.path.basename(path)}\n")
+            finally:
+                for leftover in (raw_path, tmp_path):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+
+            self.backups_made += 1
+            self.last_duration = time.perf_counter() - started
+            logger.info(f"💾 Резервная копия {os.path.basename(path)} создана "
+                        f"за {self.last_duration * 1000:.0f} мс ({os.path.getsize(path)} байт, "
+                        f"перезапусков: {restarts})")
+            self.prune()
+            return path
+
+    # ---------- Ротация ----------
+
+    def select_kept(self, backups):
+        """Копии, которые оставляет политика хранения"""
+        newest = sorted(backups, key=lambda backup: backup.created_at, reverse=True)
+        kept = set(backup.path for backup in newest[:self.retention['recent']])
+        for rule, period in (('daily', lambda d: d.date()),
+                             ('weekly', lambda d: d.isocalendar()[:2])):
+            periods = set()
+            for backup in newest:
+                key = period(backup.created_at)
+                if key in periods:
+                    continue
+                if len(periods) >= self.retention[rule]:
+                    break
+                periods.add(key)
+                kept.add(backup.path)
+        return kept
+
+    def prune(self):
+        """Удалить копии, которые не нужны по политике хранения"""
+        backups = self.list()
+        kept = self.select_kept(backups)
+        removed = 0
+        for backup in backups:
+            if backup.path in kept:
+                continue
+            for path in (backup.path, backup.checksum_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            removed += 1
+        if removed:
+            logger.info(f"🗑 Удалено старых резервных копий: {removed}")
+        return removed
+
+    # ---------- Проверка и восстановление ----------
+
+    def _check_checksum(self, path):
+        checksum_path = path + CHECKSUM_SUFFIX
+        if not os.path.exists(checksum_path):
+            raise BackupError(f"нет файла контрольной суммы {os.path.basename(checksum_path)}")
+        with open(checksum_path) as f:
+            expected = f.read().split()[:1]
+        if [file_sha256(path)] != expected:
+            raise BackupError("контрольная сумма не совпадает")
+
+    def _unpack(self, path, target_path):
+        """Распаковать копию и проверить целостность БД"""
+        self._check_checksum(path)
+        try:
+            with gzip.open(path, 'rb') as compressed, open(target_path, 'wb') as raw:
+                shutil.copyfileobj(compressed, raw, CHUNK_SIZE)
+        except (OSError, EOFError) as e:
+            raise BackupError(f"архив поврежден: {e}")
+
+        conn = sqlite3.connect(f'file:{target_path}?mode=ro', uri=True)
+        try:
+            problems = [row[0] for row in conn.execute('PRAGMA integrity_check(10)')]
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            counts = {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                      for table in REQUIRED_TABLES if table in tables}
+        except sqlite3.DatabaseError as e:
+            raise BackupError(f"файл не является БД SQLite: {e}")
+        finally:
+            conn.close()
+        if problems != ['ok']:
+            raise BackupError("integrity_check: " + '; '.join(problems))
+        missing = [table for table in REQUIRED_TABLES if table not in tables]
+        if missing:
+            raise BackupError(f"нет таблиц: {', '.join(missing)}")
+        return counts
+
+    def verify(self, path):
+        """Проверить копию: контрольная сумма, распаковка, integrity_check.
+
+        Возвращает число строк в основных таблицах или бросает BackupError.
+        """
+        fd, tmp_path = tempfile.mkstemp(suffix='.db', dir=os.path.dirname(os.path.abspath(path)))
+        os.close(fd)
+        try:
+            return self._unpack(path, tmp_path)
+        finally:
+            os.remove(tmp_path)
+
+    def restore(self, path, target_path=None):
+        """Восстановить БД из копии; бот в это время должен быть остановлен.
+
+        Копия сначала распаковывается и проверяется рядом с целевым файлом
+        и только потом атомарно его подменяет. Прежняя БД сохраняется с
+        суффиксом .before-restore, а ее файлы -wal и -shm удаляются, чтобы
+        SQLite не применил чужой журнал к восстановленной БД.
+        """
+        target_path = target_path or self.db_path
+        tmp_path = target_path + '.restore.tmp'
+        try:
+            counts = self._unpack(path, tmp_path)
+            if os.path.exists(target_path):
+                # Дописать журнал прежней БД, чтобы ее копия была целой
+                conn = sqlite3.connect(target_path)
+                try:
+                    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                finally:
+                    conn.close()
+                shutil.copy2(target_path, target_path + '.before-restore')
+            os.replace(tmp_path, target_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(target_path + suffix):
+                os.remove(target_path + suffix)
+        logger.info(f"♻️ БД {target_path} восстановлена из {os.path.basename(path)}")
+        return counts
+
+    # ---------- Фоновые копии ----------
+
+    def start(self):
+        """Снимать копии каждые interval секунд, считая от последней копии"""
+        if self._thread is not None:
+            return
+
+        def loop():
+            while True:
+                age = self.age()
+                if age is None or age >= self.interval:
+                    try:
+                        self.create()
+                        self.last_error = None
+                    except Exception as e:
+                        self.last_error = e
+                        logger.error(f"❌ Ошибка резервного копирования БД: {e}")
+                    age = 0
+                if self._stop.wait(self.interval - age):
+                    return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name='db-backup', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+
+def resolve(manager, name):
+    """Путь к копии по имени файла, пути или слову latest"""
+    if name == 'latest':
+        backups = manager.list()
+        if not backups:
+            raise BackupError(f"в {manager.folder} нет резервных копий")
+        return backups[-1].path
+    if os.path.exists(name):
+        return name
+    return os.path.join(manager.folder, name)
+
+
+def main():
+    """Резервные копии из командной строки:
+
+    python backup.py create                 - снять копию сейчас
+    python backup.py list                   - список копий
+    python backup.py verify [копия|latest|all]
+    python backup.py restore копия|latest   - восстановить (бот остановлен)
+
+    Путь к БД и папка копий берутся из DB_PATH и BACKUP_DIR.
+    """
+    args = sys.argv[1:]
+    if not args or args[0] not in ('create', 'list', 'verify', 'restore'):
+        print(main.__doc__)
+        sys.exit(2)
+    command = args[0]
+    manager = BackupManager(os.getenv('DB_PATH', 'gameboard_bot.db'), folder=os.getenv('BACKUP_DIR'),
+                            retention=parse_retention(os.getenv('BACKUP_RETENTION')))
+    try:
+        if command == 'create':
+            print(f"✅ Копия создана: {manager.create()}")
+        elif command == 'list':
+            for backup in manager.list():
+                print(f"{backup.created_at:%Y-%m-%d %H:%M:%S} UTC  {backup.size:>10} байт  "
+                      f"{os.path.basename(backup.path)}")
+        elif command == 'verify':
+            target = args[1] if len(args) > 1 else 'latest'
+            paths = [backup.path for backup in manager.list()] if target == 'all' \
+                else [resolve(manager, target)]
+            failed = 0
+            for path in paths:
+                try:
+                    counts = manager.verify(path)
+                    print(f"✅ {os.path.basename(path)}: "
+                          + ', '.join(f"{table}={count}" for table, count in counts.items()))
+                except BackupError as e:
+                    failed += 1
+                    print(f"❌ {os.path.basename(path)}: {e}")
+            if failed:
+                sys.exit(1)
+        else:
+            if len(args) < 2:
+                print("Укажите копию: python backup.py restore <файл|latest>")
+                sys.exit(2)
+            counts = manager.restore(resolve(manager, args[1]))
+            print(f"✅ БД {manager.db_path} восстановлена: "
+                  + ', '.join(f"{table}={count}" for table, count in counts.items()))
+    except BackupError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
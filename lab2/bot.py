@@ -1,74 +1,81 @@
+import time
+_import_started = time.perf_counter()
+
 import os
-import json
+import shlex
+import atexit
+import hashlib
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-import telebot
-from telebot import types
-
-# Попробуем импортировать базу данных
-try:
-    from database import DatabaseManager
-    db = DatabaseManager()
-    DB_AVAILABLE = True
-    print("✅ База данных подключена успешно")
-except ImportError as e:
-    print(f"❌ Ошибка импорта database: {e}")
-    DB_AVAILABLE = False
-except Exception as e:
-    print(f"❌ Ошибка инициализации БД: {e}")
-    DB_AVAILABLE = False
-
-# Загрузка переменных окружения
-load_dotenv()
-
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+
+from application import Application, CurrentApplication, set_default_app
+from logs import setup_logging
+from middleware import note
+from sessions import OrderSession, STEP_CUSTOMER, STEP_PRODUCT, STEP_QUANTITY, STEP_CONFIRM
+
+IMPORT_TIME = time.perf_counter() - _import_started
+
 logger = logging.getLogger(__name__)
 
 # Константы
-BOT_TOKEN = os.getenv('BOT_TOKEN') or "ВАШ_ТОКЕН_ЗДЕСЬ"
 DATA_FOLDER = 'data'
+DB_PATH = 'gameboard_bot.db'
 
-# Файлы для хранения данных
-CONTACTS_FILE = os.path.join(DATA_FOLDER, 'contacts.json')
-EVENTS_FILE = os.path.join(DATA_FOLDER, 'events.json')
-COMPANY_INFO_FILE = os.path.join(DATA_FOLDER, 'company_info.json')
-PRODUCTS_FILE = os.path.join(DATA_FOLDER, 'products.json')
+# Зарегистрированные обработчики: (тип обновления, функция, параметры фильтра telebot).
+# Клиент бота создается лениво, поэтому декоратор только запоминает обработчик,
+# а регистрация в telebot происходит в Application при создании бота.
+HANDLERS = []
 
-# Создаем папку для данных, если её нет
-os.makedirs(DATA_FOLDER, exist_ok=True)
+# Приложение, обрабатывающее текущее обновление: единственное, созданное
+# через create_app(), или бот из TenantRuntime в многопользовательском режиме
+app = CurrentApplication()
 
-# Создаем объект бота
-bot = telebot.TeleBot(BOT_TOKEN)
 
-def load_json(file_path):
-    """Загрузка данных из JSON файла"""
-    try:
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
-    except Exception as e:
-        logger.error(f"Error loading {file_path}: {e}")
-        return {}
+def handler(error=None, **kwargs):
+    """Аналог bot.message_handler, не требующий готового объекта бота.
+
+    error - ответ пользователю, если обработчик завершился исключением.
+    """
+    def decorator(func):
+        if error is not None:
+            func.error_reply = error
+        HANDLERS.append(('message', func, kwargs))
+        return func
+    return decorator
+
+
+def inline_handler(**kwargs):
+    """Аналог bot.inline_handler"""
+    def decorator(func):
+        HANDLERS.append(('inline', func, kwargs))
+        return func
+    return decorator
+
+
+def create_app(token=None, data_folder=DATA_FOLDER, db_path=None, jobs=True):
+    """Фабрика приложения: собирает зависимости без ввода-вывода.
+
+    Путь к БД по умолчанию берется из DB_PATH (в Docker - файл в
+    смонтированной папке, см. docker-compose.yml).
+    """
+    application = Application(
+        token=token,
+        data_folder=data_folder,
+        db_path=db_path or os.getenv('DB_PATH', DB_PATH),
+        handlers=HANDLERS,
+        jobs=jobs
+    )
+    application.report.record('import bot.py', IMPORT_TIME)
+    set_default_app(application)
+    return application
 
 # ========== ОСНОВНЫЕ КОМАНДЫ ==========
 
-@bot.message_handler(commands=['start'])
+@handler(commands=['start'])
 def send_welcome(message):
     """Обработчик команды /start"""
-    if DB_AVAILABLE:
-        db.add_user(
-            message.from_user.id,
-            message.from_user.username,
-            message.from_user.first_name,
-            message.from_user.last_name
-        )
-        db.log_request(message.from_user.id, "/start", "Приветственное сообщение", "start")
+    note("Приветственное сообщение")
     
     welcome_text = f"""
 Привет, {message.from_user.first_name}! 👋
@@ -94,13 +101,12 @@ def send_welcome(message):
 
 Просто напишите вопрос, и я постараюсь помочь!
     """
-    bot.reply_to(message, welcome_text)
+    app.bot.reply_to(message, welcome_text)
 
-@bot.message_handler(commands=['help'])
+@handler(commands=['help'])
 def send_help(message):
     """Обработчик команды /help"""
-    if DB_AVAILABLE:
-        db.log_request(message.from_user.id, "/help", "Справка по командам", "help")
+    note("Справка по командам")
     
     help_text = """
 📋 **Доступные команды:**
@@ -113,33 +119,42 @@ def send_help(message):
 /products - Товары и цены
 /digest - Ежедневный дайджест
 /about - О компании
+💡 В любом чате: @бот и запрос - быстрый поиск товаров, акций и контактов
 
 🗃️ **Команды базы данных:**
 /stats - Статистика бота и заказов
+/sales - Продажи по дням, неделям и месяцам
 /my_requests - История ваших запросов
-/add_order - Добавить новый заказ
+/export - Выгрузить историю или заказы файлом CSV/XLSX
+/add_order - Добавить новый заказ (пошагово)
+/cancel - Отменить оформление заказа
 /orders - Список всех заказов
 /order - Детали заказа (например: /order 1)
+/order_status - Сменить статус заказов (например: /order_status 1 в работе)
 /find_order - Поиск заказов по клиенту  🆕
 /recent_orders - Свежие заказы (7 дней)  🆕
 /tasks - Задачи команды
+/my_tasks - Мои открытые задачи
+/overdue - Просроченные задачи
+/week_tasks - Задачи на эту неделю
 /add_test_task - Добавить тестовую задачу
 
 🔧 **Технические команды:**
 /debug - Отладочная информация
+/maintenance - Обслуживание БД (для администраторов)
+/backup - Резервные копии БД (для администраторов)
     """
-    bot.reply_to(message, help_text)
+    app.bot.reply_to(message, help_text)
 
-@bot.message_handler(commands=['contacts'])
+@handler(commands=['contacts'])
 def send_contacts(message):
     """Показать контакты коллег"""
-    if DB_AVAILABLE:
-        db.log_request(message.from_user.id, "/contacts", "Показаны контакты", "contacts")
+    note("Показаны контакты")
     
-    contacts_data = load_json(CONTACTS_FILE)
+    contacts_data = app.catalog.contacts
     
     if not contacts_data:
-        bot.reply_to(message, "📞 Контакты пока не добавлены.")
+        app.bot.reply_to(message, "📞 Контакты пока не добавлены.")
         return
     
     response = "📞 **Контакты команды GameBored:**\n\n"
@@ -150,57 +165,52 @@ def send_contacts(message):
         response += f"   📧 Email: {info.get('email', 'Не указан')}\n"
         response += f"   💬 {info.get('comment', 'Нет комментария')}\n\n"
     
-    bot.reply_to(message, response)
+    app.bot.reply_to(message, response)
 
-@bot.message_handler(commands=['events'])
+@handler(commands=['events'], error="❌ Ошибка при загрузке событий.")
 def send_events(message):
     """Показать события и акции"""
-    if DB_AVAILABLE:
-        db.log_request(message.from_user.id, "/events", "Показаны события", "events")
+    note("Показаны события")
     
-    try:
-        events_data = load_json(EVENTS_FILE)
-        
-        if not events_data:
-            bot.reply_to(message, "📅 Акций и событий на ближайшее время нет.")
-            return
-        
-        today = datetime.now().date()
-        response = "📅 **Текущие акции и события:**\n\n"
-        
-        for event_name, event_info in events_data.items():
-            try:
-                event_date = datetime.strptime(event_info['date'], '%Y-%m-%d').date()
-                days_left = (event_date - today).days
-                
-                status_icon = "🟢" if days_left >= 0 else "🔴"
-                days_text = f"через {days_left} дн." if days_left > 0 else "сегодня" if days_left == 0 else f"прошло {-days_left} дн. назад"
-                
-                response += f"{status_icon} **{event_name}**\n"
-                response += f"   📅 {event_info['date']} ({days_text})\n"
-                response += f"   🏷 {event_info['type']}\n"
-                response += f"   📝 {event_info['description']}\n"
-                response += f"   📊 {event_info.get('status', 'активно')}\n\n"
-                
-            except Exception as e:
-                logger.error(f"Error processing event {event_name}: {e}")
-                continue
-        
-        bot.reply_to(message, response)
-        
-    except Exception as e:
-        logger.error(f"Error in events command: {e}")
-        bot.reply_to(message, "❌ Ошибка при загрузке событий.")
-@bot.message_handler(commands=['find_order'])
+    events_data = app.catalog.events
+    
+    if not events_data:
+        app.bot.reply_to(message, "📅 Акций и событий на ближайшее время нет.")
+        return
+    
+    today = datetime.now().date()
+    response = "📅 **Текущие акции и события:**\n\n"
+    
+    for event_name, event_info in events_data.items():
+        try:
+            event_date = datetime.strptime(event_info['date'], '%Y-%m-%d').date()
+            days_left = (event_date - today).days
+            
+            status_icon = "🟢" if days_left >= 0 else "🔴"
+            days_text = f"через {days_left} дн." if days_left > 0 else "сегодня" if days_left == 0 else f"прошло {-days_left} дн. назад"
+            
+            response += f"{status_icon} **{event_name}**\n"
+            response += f"   📅 {event_info['date']} ({days_text})\n"
+            response += f"   🏷 {event_info['type']}\n"
+            response += f"   📝 {event_info['description']}\n"
+            response += f"   📊 {event_info.get('status', 'активно')}\n\n"
+            
+        except Exception as e:
+            logger.error(f"Error processing event {event_name}: {e}")
+            continue
+    
+    app.bot.reply_to(message, response)
+
+@handler(commands=['find_order'], error="❌ Произошла ошибка при поиске заказов")
 def find_order(message):
     """Поиск заказов по имени клиента"""
-    if not DB_AVAILABLE:
-        bot.reply_to(message, "❌ База данных временно недоступна")
+    if not app.db_available:
+        app.bot.reply_to(message, "❌ База данных временно недоступна")
         return
 
     args = message.text.split()[1:]
     if not args:
-        bot.reply_to(message,
+        app.bot.reply_to(message,
             "🔍 **Поиск заказов по клиенту**\n\n"
             "📝 **Использование:**\n"
             "`/find_order [имя_клиента]`\n\n"
@@ -211,134 +221,113 @@ def find_order(message):
         )
         return
 
-    try:
-        customer_name = ' '.join(args)
-        orders = db.find_orders_by_customer(customer_name)
+    customer_name = ' '.join(args)
+    orders = app.analytics('find_order').find_orders_by_customer(customer_name)
 
-        if not orders:
-            bot.reply_to(message, f"🔍 Заказы для клиента '{customer_name}' не найдены")
-            return
+    if not orders:
+        app.bot.reply_to(message, f"🔍 Заказы для клиента '{customer_name}' не найдены")
+        return
 
-        response = f"🔍 **Найдено заказов для '{customer_name}': {len(orders)}**\n\n"
-        
-        for order in orders[:10]:  # Ограничиваем вывод
-            order_id, cust_name, product, quantity, price, status, created_at, notes = order
-            
-            status_icons = {'новый': '🟡', 'в работе': '🟠', 'выполнен': '🟢', 'отменен': '🔴'}
-            
-            response += f"{status_icons.get(status, '⚪')} **Заказ #{order_id}**\n"
-            response += f"👤 **{cust_name}**\n"
-            response += f"🛍️ {product} (x{quantity})\n"
-            response += f"💰 {price} руб.\n"
-            response += f"📅 {created_at[:16]}\n"
-            if notes:
-                response += f"📝 {notes}\n"
-            response += "\n"
-
-        if len(orders) > 10:
-            response += f"💡 Показано 10 из {len(orders)} заказов\n"
-
-        bot.reply_to(message, response)
-        db.log_request(message.from_user.id, f"/find_order {customer_name}", 
-                       f"Найдено {len(orders)} заказов", "find_order")
+    response = f"🔍 **Найдено заказов для '{customer_name}': {len(orders)}**\n\n"
+    
+    for order in orders[:10]:  # Ограничиваем вывод
+        status_icons = {'новый': '🟡', 'в работе': '🟠', 'выполнен': '🟢', 'отменен': '🔴'}
+        
+        response += f"{status_icons.get(order.status, '⚪')} **Заказ #{order.id}**\n"
+        response += f"👤 **{order.customer_name}**\n"
+        response += f"🛍️ {order.product_name} (x{order.quantity})\n"
+        response += f"💰 {format_money(order.total_kopecks)} руб.\n"
+        response += f"📅 {format_timestamp(order.created_ts)}\n"
+        if order.notes:
+            response += f"📝 {order.notes}\n"
+        response += "\n"
 
-    except Exception as e:
-        logger.error(f"Error in find_order command: {e}")
-        bot.reply_to(message, "❌ Произошла ошибка при поиске заказов")
-@bot.message_handler(commands=['recent_orders'])
+    if len(orders) > 10:
+        response += f"💡 Показано 10 из {len(orders)} заказов\n"
+
+    app.bot.reply_to(message, response)
+    note(f"Найдено {len(orders)} заказов")
+
+@handler(commands=['recent_orders'], error="❌ Произошла ошибка при получении заказов")
 def recent_orders(message):
     """Показать свежие заказы (за последние 7 дней)"""
-    if not DB_AVAILABLE:
-        bot.reply_to(message, "❌ База данных временно недоступна")
+    if not app.db_available:
+        app.bot.reply_to(message, "❌ База данных временно недоступна")
         return
 
-    try:
-        # Заказы за последние 7 дней
-        from datetime import datetime, timedelta
-        week_ago = datetime.now() - timedelta(days=7)
+    # Заказы за последние 7 дней
+    from datetime import datetime, timedelta
+    week_ago = datetime.now() - timedelta(days=7)
 
-        orders = db.get_orders_since(week_ago)
+    orders = app.analytics('recent_orders').get_orders_since(week_ago)
 
-        if not orders:
-            bot.reply_to(message,
-                "📅 **Свежие заказы**\n\n"
-                "За последние 7 дней заказов нет.\n\n"
-                "💡 Используйте `/add_order` чтобы добавить новый заказ!"
-            )
-            return
+    if not orders:
+        app.bot.reply_to(message,
+            "📅 **Свежие заказы**\n\n"
+            "За последние 7 дней заказов нет.\n\n"
+            "💡 Используйте `/add_order` чтобы добавить новый заказ!"
+        )
+        return
 
-        response = f"📅 **Свежие заказы (последние 7 дней): {len(orders)}**\n\n"
-        
-        for order in orders[:15]:  # Ограничиваем вывод
-            order_id, cust_name, product, quantity, price, status, created_at, notes = order
-            
-            status_icons = {'новый': '🟡', 'в работе': '🟠', 'выполнен': '🟢', 'отменен': '🔴'}
-            
-            response += f"{status_icons.get(status, '⚪')} **Заказ #{order_id}**\n"
-            response += f"👤 **{cust_name}**\n"
-            response += f"🛍️ {product} (x{quantity})\n"
-            response += f"💰 {price} руб.\n"
-            response += f"📅 {created_at[:16]}\n"
-            if notes:
-                response += f"📝 {notes}\n"
-            response += "\n"
-
-        if len(orders) > 15:
-            response += f"💡 Показано 15 из {len(orders)} заказов\n"
-
-        bot.reply_to(message, response)
-        db.log_request(message.from_user.id, "/recent_orders", 
-                       f"Показано {len(orders)} заказов", "recent_orders")
+    response = f"📅 **Свежие заказы (последние 7 дней): {len(orders)}**\n\n"
+    
+    for order in orders[:15]:  # Ограничиваем вывод
+        status_icons = {'новый': '🟡', 'в работе': '🟠', 'выполнен': '🟢', 'отменен': '🔴'}
+        
+        response += f"{status_icons.get(order.status, '⚪')} **Заказ #{order.id}**\n"
+        response += f"👤 **{order.customer_name}**\n"
+        response += f"🛍️ {order.product_name} (x{order.quantity})\n"
+        response += f"💰 {format_money(order.total_kopecks)} руб.\n"
+        response += f"📅 {format_timestamp(order.created_ts)}\n"
+        if order.notes:
+            response += f"📝 {order.notes}\n"
+        response += "\n"
 
-    except Exception as e:
-        logger.error(f"Error in recent_orders command: {e}")
-        bot.reply_to(message, "❌ Произошла ошибка при получении заказов")
+    if len(orders) > 15:
+        response += f"💡 Показано 15 из {len(orders)} заказов\n"
+
+    app.bot.reply_to(message, response)
+    note(f"Показано {len(orders)} заказов")
 
-@bot.message_handler(commands=['products'])
+
+@handler(commands=['products'], error="❌ Ошибка при загрузке товаров.")
 def send_products(message):
     """Показать товары и цены"""
-    if DB_AVAILABLE:
-        db.log_request(message.from_user.id, "/products", "Показаны товары", "products")
+    note("Показаны товары")
     
-    try:
-        products_data = load_json(PRODUCTS_FILE)
-        
-        if not products_data or 'products' not in products_data:
-            bot.reply_to(message, "🎲 Информация о товарах временно недоступна.")
-            return
-        
-        response = "🎲 **Наши товары и цены:**\n\n"
-        
-        for product_key, product in products_data['products'].items():
-            response += f"🎯 **{product['name']}**\n"
-            response += f"   💰 Цена: {product['price']} руб.\n"
-            if product.get('original_price'):
-                response += f"   🔥 Было: {product['original_price']} руб. (скидка {product.get('discount', '')})\n"
-            response += f"   📝 {product['description']}\n"
-            response += f"   ⏱ Срок: {product['delivery_time']}\n\n"
-        
-        # Акции
-        if products_data.get('current_promotions'):
-            response += "🎁 **Акции:**\n"
-            for promotion in products_data['current_promotions']:
-                response += f"   • {promotion}\n"
-        
-        bot.reply_to(message, response)
-        
-    except Exception as e:
-        logger.error(f"Error in products command: {e}")
-        bot.reply_to(message, "❌ Ошибка при загрузке товаров.")
+    products_data = app.catalog.products
+    
+    if not products_data or 'products' not in products_data:
+        app.bot.reply_to(message, "🎲 Информация о товарах временно недоступна.")
+        return
+    
+    response = "🎲 **Наши товары и цены:**\n\n"
+    
+    for product_key, product in products_data['products'].items():
+        response += f"🎯 **{product['name']}**\n"
+        response += f"   💰 Цена: {product['price']} руб.\n"
+        if product.get('original_price'):
+            response += f"   🔥 Было: {product['original_price']} руб. (скидка {product.get('discount', '')})\n"
+        response += f"   📝 {product['description']}\n"
+        response += f"   ⏱ Срок: {product['delivery_time']}\n\n"
+    
+    # Акции
+    if products_data.get('current_promotions'):
+        response += "🎁 **Акции:**\n"
+        for promotion in products_data['current_promotions']:
+            response += f"   • {promotion}\n"
+    
+    app.bot.reply_to(message, response)
 
-@bot.message_handler(commands=['digest'])
+@handler(commands=['digest'])
 def send_digest(message):
     """Ежедневный дайджест"""
-    if DB_AVAILABLE:
-        db.log_request(message.from_user.id, "/digest", "Показан дайджест", "digest")
+    note("Показан дайджест")
     
-    contacts_data = load_json(CONTACTS_FILE)
-    events_data = load_json(EVENTS_FILE)
-    company_info = load_json(COMPANY_INFO_FILE)
-    products_data = load_json(PRODUCTS_FILE)
+    contacts_data = app.catalog.contacts
+    events_data = app.catalog.events
+    company_info = app.catalog.company_info
+    products_data = app.catalog.products
     
     today = datetime.now().date()
     
@@ -372,15 +361,14 @@ def send_digest(message):
     
     digest_text += "\nХорошего дня! 🚀"
     
-    bot.reply_to(message, digest_text)
+    app.bot.reply_to(message, digest_text)
 
-@bot.message_handler(commands=['about'])
+@handler(commands=['about'])
 def send_about(message):
     """Информация о компании"""
-    if DB_AVAILABLE:
-        db.log_request(message.from_user.id, "/about", "Информация о компании", "about")
+    note("Информация о компании")
     
-    company_info = load_json(COMPANY_INFO_FILE)
+    company_info = app.catalog.company_info
     
     if not company_info:
         default_info = """
@@ -400,7 +388,7 @@ def send_about(message):
 
 📞 **Контакты:** gamebored@yandex.ru
         """
-        bot.reply_to(message, default_info)
+        app.bot.reply_to(message, default_info)
     else:
         response = f"""
 🏢 **{company_info.get('name', 'GameBored')}**
@@ -416,268 +404,579 @@ Email: {company_info.get('email', 'gamebored@yandex.ru')}
 
 🎯 **Миссия:** {company_info.get('mission', '')}
         """
-        bot.reply_to(message, response)
+        app.bot.reply_to(message, response)
+
+# Сколько секунд Telegram может кэшировать ответ на inline-запрос у себя;
+# каталог меняется редко, поэтому ответ общий для всех пользователей
+INLINE_CACHE_TIME = 300
+
+
+@inline_handler(func=lambda query: True)
+def answer_inline_query(query):
+    """Inline-поиск по товарам, событиям и контактам: @бот мафия"""
+    from telebot import types
+
+    try:
+        results = [
+            types.InlineQueryResultArticle(
+                id=item.id,
+                title=item.title,
+                description=item.description,
+                input_message_content=types.InputTextMessageContent(item.text)
+            )
+            for item in app.search.search(query.query)
+        ]
+        app.bot.answer_inline_query(query.id, results, cache_time=INLINE_CACHE_TIME, is_personal=False)
+    except Exception as e:
+        logger.error(f"Error in inline query: {e}")
 
 # ========== КОМАНДЫ БАЗЫ ДАННЫХ ==========
 
-@bot.message_handler(commands=['stats'])
+@handler(commands=['stats'], error="❌ Ошибка при получении статистики")
 def send_stats(message):
     """Статистика бота и заказов"""
-    if not DB_AVAILABLE:
-        bot.reply_to(message, "❌ База данных временно недоступна")
+    if not app.db_available:
+        app.bot.reply_to(message, "❌ База данных временно недоступна")
         return
         
-    try:
-        db.add_user(
-            message.from_user.id,
-            message.from_user.username,
-            message.from_user.first_name,
-            message.from_user.last_name
-        )
-        
-        bot_stats = db.get_bot_stats()
-        orders_stats = db.get_order_stats()
-        
-        response = "📊 **Статистика GameBored Bot**\n\n"
-        
-        response += "👥 **Пользователи бота:**\n"
-        response += f"   • Всего пользователей: {bot_stats.get('total_users', 0)}\n"
-        response += f"   • Всего запросов: {bot_stats.get('total_requests', 0)}\n"
-        response += f"   • Последняя активность: {bot_stats.get('last_activity', 'неизвестно')}\n\n"
-        
-        response += "🛒 **Статистика заказов:**\n"
-        response += f"   • Всего заказов: {orders_stats.get('total_orders', 0)}\n"
-        response += f"   • Уникальных клиентов: {orders_stats.get('unique_customers', 0)}\n"
-        response += f"   • Общая выручка: {orders_stats.get('total_revenue', 0):.2f} руб.\n\n"
-        
-        status_stats = orders_stats.get('status_stats', [])
-        if status_stats:
-            response += "📈 **Заказы по статусам:**\n"
-            for status, count in status_stats:
-                response += f"   • {status}: {count}\n"
+    source = app.analytics('stats')
+    bot_stats = source.get_bot_stats()
+    orders_stats = source.get_order_stats()
+    
+    response = "📊 **Статистика GameBored Bot**\n\n"
+    
+    response += "👥 **Пользователи бота:**\n"
+    response += f"   • Всего пользователей: {bot_stats.get('total_users', 0)}\n"
+    response += f"   • Всего запросов: {bot_stats.get('total_requests', 0)}\n"
+    response += f"   • Последняя активность: {bot_stats.get('last_activity', 'неизвестно')}\n\n"
+    
+    response += "🛒 **Статистика заказов:**\n"
+    response += f"   • Всего заказов: {orders_stats.get('total_orders', 0)}\n"
+    response += f"   • Уникальных клиентов: {orders_stats.get('unique_customers', 0)}\n"
+    response += f"   • Общая выручка: {format_money(orders_stats.get('total_kopecks', 0))} руб.\n\n"
+    
+    status_stats = orders_stats.get('status_stats', [])
+    if status_stats:
+        response += "📈 **Заказы по статусам:**\n"
+        for status, count in status_stats:
+            response += f"   • {status}: {count}\n"
+    else:
+        response += "📈 Заказов пока нет\n"
+
+    if source is not app.db:
+        response += f"\n🕒 Данные на {app.snapshot.age():.0f} с назад\n"
+    
+    app.bot.reply_to(message, response)
+    note("Показана статистика")
+    
+
+# Синонимы аргументов /sales
+SALES_PERIOD_ALIASES = {
+    'day': 'day', 'день': 'day', 'дни': 'day',
+    'week': 'week', 'неделя': 'week', 'недели': 'week',
+    'month': 'month', 'месяц': 'month', 'месяцы': 'month',
+}
+SALES_BREAKDOWN_ALIASES = {
+    'product': 'product', 'товар': 'product', 'товары': 'product',
+    'status': 'status', 'статус': 'status', 'статусы': 'status',
+}
+SALES_DEFAULT_DAYS = {'day': 30, 'week': 90, 'month': 365}
+SALES_MAX_LINES = 40
+# Самый длинный период в днях; больше timedelta может и не вместить
+SALES_MAX_DAYS = 10 * 366
+
+SALES_HELP = (
+    "📈 **Продажи по периодам**\n\n"
+    "📝 **Использование:**\n"
+    "`/sales [день|неделя|месяц] [дней | с по] [товар|статус]`\n\n"
+    "💡 **Примеры:**\n"
+    "`/sales` - по дням за 30 дней\n"
+    "`/sales неделя 90`\n"
+    "`/sales месяц 365 товар`\n"
+    "`/sales день 2025-01-01 2025-01-31 статус`"
+)
+
+
+def parse_sales_args(args):
+    """Разбор аргументов /sales: (период, первый день, последний день, разрез).
+
+    Неверные аргументы - ValueError, на который /sales отвечает справкой.
+    """
+    period = 'day'
+    breakdown = None
+    dates = []
+    days = None
+    for arg in args:
+        lowered = arg.lower()
+        if lowered in SALES_PERIOD_ALIASES:
+            period = SALES_PERIOD_ALIASES[lowered]
+        elif lowered in SALES_BREAKDOWN_ALIASES:
+            breakdown = SALES_BREAKDOWN_ALIASES[lowered]
+        elif lowered.isdigit():
+            days = int(lowered)
+            if days > SALES_MAX_DAYS:
+                raise ValueError(f"период больше {SALES_MAX_DAYS} дней")
         else:
-            response += "📈 Заказов пока нет\n"
-        
-        bot.reply_to(message, response)
-        db.log_request(message.from_user.id, "/stats", "Показана статистика", "stats")
-        
-    except Exception as e:
-        logger.error(f"Error in stats command: {e}")
-        bot.reply_to(message, "❌ Ошибка при получении статистики")
+            dates.append(datetime.strptime(arg, '%Y-%m-%d').date())
+    if len(dates) > 2:
+        raise ValueError("больше двух дат")
+
+    # Агрегаты хранятся по датам UTC, как и CURRENT_TIMESTAMP в SQLite
+    today = datetime.now(timezone.utc).date()
+    if len(dates) == 2:
+        start, end = sorted(dates)
+    elif len(dates) == 1:
+        start, end = dates[0], today
+    else:
+        start = today - timedelta(days=(days or SALES_DEFAULT_DAYS[period]) - 1)
+        end = today
+    return period, start.isoformat(), end.isoformat(), breakdown
+
+
+@handler(commands=['sales'], error="❌ Ошибка при получении статистики продаж")
+def send_sales(message):
+    """Продажи по дням, неделям и месяцам из предагрегированных данных"""
+    if not app.db_available:
+        app.bot.reply_to(message, "❌ База данных временно недоступна")
+        return
+
+    try:
+        period, start, end, breakdown = parse_sales_args(message.text.split()[1:])
+    except ValueError:
+        app.bot.reply_to(message, SALES_HELP)
+        return
+
+    rows = app.db.get_sales(start, end, period=period, breakdown=breakdown)
+    if not rows:
+        app.bot.reply_to(message, f"📈 За период {start} - {end} продаж нет")
+        return
 
-@bot.message_handler(commands=['my_requests'])
+    period_names = {'day': 'дням', 'week': 'неделям', 'month': 'месяцам'}
+    response = f"📈 **Продажи по {period_names[period]}: {start} - {end}**\n\n"
+    total_orders = total_quantity = total_revenue = 0
+    for i, (bucket, key, orders, quantity, revenue) in enumerate(rows):
+        total_orders += orders
+        total_quantity += quantity
+        total_revenue += revenue
+        if i < SALES_MAX_LINES:
+            label = f"{bucket} · {key}" if key else bucket
+            response += f"📅 {label}: {orders} зак., {quantity} шт., {format_money(revenue)} руб.\n"
+    if len(rows) > SALES_MAX_LINES:
+        response += f"... и еще {len(rows) - SALES_MAX_LINES} строк\n"
+
+    response += f"\n🧾 **Итого:** {total_orders} зак., {total_quantity} шт., {format_money(total_revenue)} руб."
+
+    app.bot.reply_to(message, response)
+    note("Показаны продажи")
+
+
+@handler(commands=['my_requests'], error="❌ Ошибка при получении истории запросов")
 def send_my_requests(message):
     """История запросов пользователя"""
-    if not DB_AVAILABLE:
-        bot.reply_to(message, "❌ База данных временно недоступна")
+    if not app.db_available:
+        app.bot.reply_to(message, "❌ База данных временно недоступна")
         return
         
-    try:
-        db.add_user(
-            message.from_user.id,
-            message.from_user.username,
-            message.from_user.first_name,
-            message.from_user.last_name
+    user_requests = app.db.get_recent_requests(message.from_user.id)
+    
+    if not user_requests:
+        app.bot.reply_to(message, "📝 У вас еще нет истории запросов.")
+        return
+    
+    response = "📝 **Ваши последние запросы:**\n\n"
+    for i, request in enumerate(user_requests, 1):
+        request_text = request.request_text or ''
+        short_request = request_text[:50] + "..." if len(request_text) > 50 else request_text
+        response += f"{i}. **{short_request}**\n"
+        response += f"   Команда: {request.command_used or 'текст'}\n"
+        response += f"   Время: {request.created_at[:16]}\n\n"
+    
+    app.bot.reply_to(message, response)
+    note("Показана история")
+    
+
+# Колонки выгрузок /export
+EXPORT_HISTORY_COLUMNS = ('Время', 'Команда', 'Запрос', 'Ответ')
+EXPORT_ORDER_COLUMNS = ('Номер', 'Клиент', 'Товар', 'Количество', 'Сумма, руб.', 'Статус',
+                        'Создан', 'Обновлен', 'Примечание')
+
+
+def export_history_rows(requests):
+    for request in requests:
+        yield request.created_at, request.command_used, request.request_text, request.response_text
+
+
+def export_order_rows(orders):
+    for order in orders:
+        yield (order.id, order.customer_name, order.product_name, order.quantity,
+               order.total_kopecks / 100 if order.total_kopecks is not None else None,
+               order.status, format_timestamp(order.created_ts), format_timestamp(order.updated_ts),
+               order.notes)
+
+
+@handler(commands=['export'], error="❌ Ошибка при выгрузке")
+def send_export(message):
+    """Выгрузка всей истории запросов или заказов файлом: /export [history|orders] [csv|xlsx]"""
+    if not app.db_available:
+        app.bot.reply_to(message, "❌ База данных временно недоступна")
+        return
+
+    from telebot import types
+    from export import export_rows, ExportTooLarge, EXPORT_FORMATS
+
+    args = [arg.lower() for arg in split_args(message.text)]
+    fmt = next((arg for arg in args if arg in EXPORT_FORMATS), 'csv')
+    kinds = [arg for arg in args if arg not in EXPORT_FORMATS]
+    kind = kinds[0] if kinds else 'history'
+    if kind not in ('history', 'orders') or len(kinds) > 1:
+        app.bot.reply_to(
+            message,
+            "📤 **Выгрузка в файл:**\n"
+            "`/export history [csv|xlsx]` - вся история ваших запросов\n"
+            "`/export orders [csv|xlsx]` - заказы (ваши; администраторам - все)"
         )
-        
-        user_requests = db.get_user_requests(message.from_user.id, limit=5)
-        
-        if not user_requests:
-            bot.reply_to(message, "📝 У вас еще нет истории запросов.")
-            return
-        
-        response = "📝 **Ваши последние запросы:**\n\n"
-        for i, (request_text, command_used, created_at) in enumerate(user_requests, 1):
-            short_request = request_text[:50] + "..." if len(request_text) > 50 else request_text
-            response += f"{i}. **{short_request}**\n"
-            response += f"   Команда: {command_used or 'текст'}\n"
-            response += f"   Время: {created_at[:16]}\n\n"
-        
-        bot.reply_to(message, response)
-        db.log_request(message.from_user.id, "/my_requests", "Показана история", "my_requests")
-        
-    except Exception as e:
-        logger.error(f"Error in my_requests command: {e}")
-        bot.reply_to(message, "❌ Ошибка при получении истории запросов")
+        return
 
-@bot.message_handler(commands=['add_order'])
-def add_order_command(message):
-    """Добавление нового заказа"""
-    if not DB_AVAILABLE:
-        bot.reply_to(message, "❌ База данных временно недоступна")
+    user_id = message.from_user.id
+    wait = app.exports.acquire(user_id)
+    if wait:
+        app.bot.reply_to(message, f"⏳ Выгрузку можно повторить через {wait:.0f} с")
+        note("Выгрузка отклонена лимитом")
         return
-        
+
     try:
-        db.add_user(
-            message.from_user.id,
-            message.from_user.username,
-            message.from_user.first_name,
-            message.from_user.last_name
-        )
-        
-        args = message.text.split()[1:]
-        if len(args) < 3:
-            help_text = (
-                "❌ **Неверный формат команды!**\n\n"
-                "✅ **Правильное использование:**\n"
-                "`/add_order [имя_клиента] [товар] [количество]`\n\n"
-                "📝 **Пример:**\n"
-                "`/add_order Иван Мафия 1`\n"
-                "`/add_order \"Иван Петров\" \"Персонализированная Мафия\" 2`\n\n"
-                "🎲 **Доступные товары:**\n"
-                "• Мафия (1790 руб.)\n• Мемо (1990 руб.)\n• Элиас (2500 руб.)"
-            )
-            bot.reply_to(message, help_text)
+        # Выгрузка читает курсор порциями и пишет во временный файл, который
+        # остается в памяти только до SPOOL_SIZE байт
+        source = app.analytics('export')
+        if kind == 'orders':
+            records = source.iter_orders(user_id=None if is_admin(user_id) else user_id)
+            columns, rows = EXPORT_ORDER_COLUMNS, export_order_rows(records)
+        else:
+            records = source.iter_requests(user_id)
+            columns, rows = EXPORT_HISTORY_COLUMNS, export_history_rows(records)
+        try:
+            file, count = export_rows(columns, rows, fmt)
+        except ExportTooLarge as e:
+            app.bot.reply_to(message, f"❌ Слишком большая выгрузка: {e}")
             return
-        
-        customer_name = args[0].replace('"', '')
-        product_name = args[1].replace('"', '')
-        
+        finally:
+            # Соединение для чтения закрывается, даже если выгрузка прервана
+            records.close()
+
+        with file:
+            if not count:
+                app.bot.reply_to(message, "📭 Выгружать пока нечего")
+                note("Выгрузка пуста")
+                return
+            file_name = f"{kind}_{datetime.now():%Y%m%d_%H%M}.{fmt}"
+            app.bot.send_document(
+                message.chat.id, file, visible_file_name=file_name,
+                caption=f"📤 Строк: {count}",
+                reply_parameters=types.ReplyParameters(message.message_id)
+            )
+        note(f"Выгружено {count} строк ({fmt})")
+    finally:
+        app.exports.release()
+
+
+# Цены для товаров без числовой цены в каталоге и для товаров не из каталога
+DEFAULT_PRICES = {
+    'мафия': 1790,
+    'мемо': 1990, 
+    'элиас': 2500
+}
+DEFAULT_PRICE = 2000
+
+CONFIRM_YES = '✅ Да'
+CONFIRM_NO = '❌ Нет'
+
+
+def split_args(text):
+    """Аргументы команды с поддержкой кавычек: "Иван Петров" - один аргумент"""
+    try:
+        return shlex.split(text)[1:]
+    except ValueError:
+        return text.split()[1:]
+
+
+def find_product(text):
+    """Товар каталога по номеру в списке, ключу или названию: (ключ, товар)"""
+    products = app.catalog.products.get('products', {})
+    text = text.strip()
+    if text.isdigit():
+        index = int(text) - 1
+        keys = list(products)
+        if 0 <= index < len(keys):
+            return keys[index], products[keys[index]]
+        return None, None
+
+    lowered = text.lower()
+    for key, product in products.items():
+        if lowered in (key.lower(), str(product.get('name', '')).lower()):
+            return key, product
+    for key, product in products.items():
+        if key.lower() in lowered:
+            return key, product
+    return None, None
+
+
+def product_price(product_key, product=None):
+    """Цена за единицу в копейках: из каталога, если она числовая, иначе по умолчанию"""
+    price = product.get('price') if product else None
+    if not isinstance(price, (int, float)):
+        price = DEFAULT_PRICES.get(product_key.lower(), DEFAULT_PRICE)
+    return round(price * 100)
+
+
+def format_money(kopecks):
+    """Сумма в копейках для вывода: 3580 или 3580.50"""
+    if kopecks is None:
+        return "—"
+    rubles, kopecks = divmod(int(kopecks), 100)
+    return f"{rubles}.{kopecks:02d}" if kopecks else str(rubles)
+
+
+def format_timestamp(ts):
+    """Время epoch для вывода в формате ГГГГ-ММ-ДД ЧЧ:ММ"""
+    if ts is None:
+        return "—"
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M')
+
+
+def order_idempotency_key(message, customer_name, product_name, quantity):
+    """Ключ идемпотентности заказа: чат, сообщение и содержимое заказа"""
+    content = f"{message.chat.id}:{message.message_id}:{customer_name}:{product_name}:{quantity}"
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def create_order(message, customer_name, product_name, quantity, total_kopecks):
+    """Запись заказа в БД (или в журнал, если БД недоступна) и ответ пользователю"""
+    from telebot import types
+    from journal import ORDER_PENDING
+
+    order_id = app.writes.add_order(
+        message.from_user.id,
+        customer_name,
+        product_name,
+        quantity,
+        total_kopecks,
+        idempotency_key=order_idempotency_key(message, customer_name, product_name, quantity)
+    )
+
+    if order_id == ORDER_PENDING:
+        response = "✅ **Заказ принят!**\n\n"
+        response += f"👤 **Клиент:** {customer_name}\n"
+        response += f"🎯 **Товар:** {product_name}\n"
+        response += f"📦 **Количество:** {quantity}\n"
+        response += f"💰 **Сумма:** {format_money(total_kopecks)} руб.\n\n"
+        response += "⚠️ База данных временно недоступна: заказ сохранен и будет записан "
+        response += "автоматически, номер появится в /orders после восстановления."
+
+        app.bot.reply_to(message, response, reply_markup=types.ReplyKeyboardRemove())
+        note("Заказ записан в журнал", "add_order")
+    elif order_id:
+        response = f"✅ **Заказ успешно добавлен!**\n\n"
+        response += f"📋 **ID заказа:** #{order_id}\n"
+        response += f"👤 **Клиент:** {customer_name}\n"
+        response += f"🎯 **Товар:** {product_name}\n"
+        response += f"📦 **Количество:** {quantity}\n"
+        response += f"💰 **Сумма:** {format_money(total_kopecks)} руб.\n"
+        response += f"📊 **Статус:** новый\n\n"
+        response += f"💡 Заказ будет обработан в течение 24 часов."
+
+        app.bot.reply_to(message, response, reply_markup=types.ReplyKeyboardRemove())
+        note(f"Заказ добавлен ID: {order_id}", "add_order")
+    else:
+        app.bot.reply_to(message, "❌ Ошибка при добавлении заказа в базу данных",
+                         reply_markup=types.ReplyKeyboardRemove())
+
+
+def ask_order_step(message, session):
+    """Вопрос для текущего шага диалога оформления заказа"""
+    from telebot import types
+
+    if session.step == STEP_CUSTOMER:
+        app.bot.reply_to(message,
+            "🛒 **Новый заказ**\n\n"
+            "👤 Введите имя клиента (можно с фамилией).\n"
+            "❌ Отменить: /cancel",
+            reply_markup=types.ReplyKeyboardRemove()
+        )
+    elif session.step == STEP_PRODUCT:
+        products = app.catalog.products.get('products', {})
+        markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+        response = f"👤 Клиент: **{session.customer_name}**\n\n🎲 Выберите товар:\n"
+        for i, (key, product) in enumerate(products.items(), 1):
+            response += f"{i}. {product.get('name', key)} - {format_money(product_price(key, product))} руб.\n"
+            markup.add(types.KeyboardButton(key))
+        response += "\n❌ Отменить: /cancel"
+        app.bot.reply_to(message, response, reply_markup=markup)
+    elif session.step == STEP_QUANTITY:
+        markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, row_width=5)
+        markup.add(*[types.KeyboardButton(str(i)) for i in range(1, 6)])
+        app.bot.reply_to(message, "📦 Укажите количество:", reply_markup=markup)
+    elif session.step == STEP_CONFIRM:
+        products = app.catalog.products.get('products', {})
+        product = products.get(session.product_key, {})
+        total_kopecks = session.quantity * product_price(session.product_key, product)
+        markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, row_width=2)
+        markup.add(types.KeyboardButton(CONFIRM_YES), types.KeyboardButton(CONFIRM_NO))
+        app.bot.reply_to(message,
+            "📋 **Проверьте заказ:**\n\n"
+            f"👤 **Клиент:** {session.customer_name}\n"
+            f"🎯 **Товар:** {product.get('name', session.product_key)}\n"
+            f"📦 **Количество:** {session.quantity}\n"
+            f"💰 **Сумма:** {format_money(total_kopecks)} руб.\n\n"
+            "Оформить заказ?",
+            reply_markup=markup
+        )
+
+
+def next_order_step(session):
+    """Первый незаполненный шаг диалога"""
+    if not session.customer_name:
+        return STEP_CUSTOMER
+    if not session.product_key:
+        return STEP_PRODUCT
+    if not session.quantity:
+        return STEP_QUANTITY
+    return STEP_CONFIRM
+
+
+@handler(commands=['add_order'], error="❌ Произошла ошибка при добавлении заказа")
+def add_order_command(message):
+    """Добавление нового заказа: одной строкой или пошаговым диалогом.
+
+    Работает и без БД: заказ тогда сохраняется в журнал (journal.py).
+    """
+    args = split_args(message.text)
+    if len(args) >= 3:
+        customer_name = args[0]
+        product_name = ' '.join(args[1:-1])
+
         try:
-            quantity = int(args[2])
+            quantity = int(args[-1])
             if quantity <= 0:
                 raise ValueError
         except ValueError:
-            bot.reply_to(message, "❌ Количество должно быть положительным числом!")
+            app.bot.reply_to(message, "❌ Количество должно быть положительным числом!")
             return
-        
-        prices = {
-            'мафия': 1790,
-            'мемо': 1990, 
-            'элиас': 2500
-        }
-        
-        product_lower = product_name.lower()
-        price_per_item = prices.get(product_lower, 2000)
-        total_price = quantity * price_per_item
-        
-        order_id = db.add_order(
-            message.from_user.id,
-            customer_name,
-            product_name,
-            quantity,
-            total_price
-        )
-        
-        if order_id:
-            response = f"✅ **Заказ успешно добавлен!**\n\n"
-            response += f"📋 **ID заказа:** #{order_id}\n"
-            response += f"👤 **Клиент:** {customer_name}\n"
-            response += f"🎯 **Товар:** {product_name}\n"
-            response += f"📦 **Количество:** {quantity}\n"
-            response += f"💰 **Сумма:** {total_price} руб.\n"
-            response += f"📊 **Статус:** новый\n\n"
-            response += f"💡 Заказ будет обработан в течение 24 часов."
-            
-            bot.reply_to(message, response)
-            db.log_request(message.from_user.id, f"/add_order {customer_name} {product_name} {quantity}", 
-                          f"Заказ добавлен ID: {order_id}", "add_order")
+
+        product_key, product = find_product(product_name)
+        if product:
+            product_name = product.get('name', product_key)
+            price_per_item = product_price(product_key, product)
         else:
-            bot.reply_to(message, "❌ Ошибка при добавлении заказа в базу данных")
-            
-    except Exception as e:
-        logger.error(f"Error in add_order command: {e}")
-        bot.reply_to(message, "❌ Произошла ошибка при добавлении заказа")
+            price_per_item = product_price(product_name)
+        create_order(message, customer_name, product_name, quantity, quantity * price_per_item)
+        return
 
-@bot.message_handler(commands=['orders'])
-def send_orders(message):
-    """Показать список заказов"""
-    if not DB_AVAILABLE:
-        bot.reply_to(message, "❌ База данных временно недоступна")
+    # Недостающие данные спрашиваем по шагам
+    session = OrderSession()
+    if args:
+        session.customer_name = args[0]
+    if len(args) > 1:
+        session.product_key, _ = find_product(args[1])
+    session.step = next_order_step(session)
+    app.sessions.save(message.from_user.id, session)
+    ask_order_step(message, session)
+
+@handler(commands=['cancel'])
+def cancel_command(message):
+    """Отмена пошагового оформления заказа"""
+    from telebot import types
+
+    if app.sessions.discard(message.from_user.id):
+        app.bot.reply_to(message, "🚫 Оформление заказа отменено",
+                         reply_markup=types.ReplyKeyboardRemove())
+    else:
+        app.bot.reply_to(message, "Нечего отменять 🙂")
+
+def in_order_dialog(message):
+    """Сообщение является ответом на шаг диалога /add_order"""
+    return (message.text is not None and not message.text.startswith('/')
+            and message.from_user.id in app.sessions)
+
+@handler(func=in_order_dialog, error="❌ Произошла ошибка при добавлении заказа")
+def handle_order_step(message):
+    """Обработка ответа на текущий шаг диалога оформления заказа"""
+    user_id = message.from_user.id
+    session = app.sessions.get(user_id)
+    if session is None:
+        handle_all_messages(message)
         return
-        
-    try:
-        db.add_user(
-            message.from_user.id,
-            message.from_user.username,
-            message.from_user.first_name,
-            message.from_user.last_name
-        )
-        
-        orders = db.get_orders(limit=10)
-        
-        if not orders:
-            bot.reply_to(message, 
-                "🛒 **Заказов пока нет**\n\n"
-                "💡 Чтобы добавить заказ, используйте команду:\n"
-                "`/add_order [клиент] [товар] [количество]`\n\n"
-                "📝 Пример: `/add_order Иван Мафия 1`"
-            )
+
+    text = message.text.strip()
+
+    if session.step == STEP_CUSTOMER:
+        if not text:
+            app.bot.reply_to(message, "❌ Имя клиента не может быть пустым")
             return
-        
-        response = f"🛒 **Последние заказы ({len(orders)}):**\n\n"
-        
-        for order in orders:
-            order_id, customer_name, product_name, quantity, total_price, status, created_at, notes = order
-            
-            status_icons = {
-                'новый': '🆕',
-                'в работе': '🔄',
-                'выполнен': '✅',
-                'отменен': '❌'
-            }
-            
-            response += f"{status_icons.get(status, '📦')} **Заказ #{order_id}**\n"
-            response += f"   👤 {customer_name}\n"
-            response += f"   🎯 {product_name} (x{quantity})\n"
-            response += f"   💰 {total_price} руб.\n"
-            response += f"   📊 {status}\n"
-            response += f"   📅 {created_at[:16]}\n\n"
-        
-        response += "💡 Для подробной информации используйте `/order [номер]`"
-        
-        bot.reply_to(message, response)
-        db.log_request(message.from_user.id, "/orders", f"Показано {len(orders)} заказов", "orders")
-        
-    except Exception as e:
-        logger.error(f"Error in orders command: {e}")
-        bot.reply_to(message, "❌ Ошибка при получении списка заказов")
+        session.customer_name = text
 
-@bot.message_handler(commands=['order'])
-def send_order_detail(message):
-    """Показать детали конкретного заказа"""
-    if not DB_AVAILABLE:
-        bot.reply_to(message, "❌ База данных временно недоступна")
-        return
-        
-    try:
-        db.add_user(
-            message.from_user.id,
-            message.from_user.username,
-            message.from_user.first_name,
-            message.from_user.last_name
-        )
-        
-        args = message.text.split()[1:]
-        if len(args) < 1:
-            bot.reply_to(message, 
-                "❌ **Укажите номер заказа!**\n\n"
-                "✅ Использование: `/order [номер]`\n"
-                "📝 Пример: `/order 1`\n\n"
-                "💡 Список заказов: `/orders`"
-            )
+    elif session.step == STEP_PRODUCT:
+        product_key, _ = find_product(text)
+        if not product_key:
+            app.bot.reply_to(message, "❌ Такого товара нет в каталоге. Выберите из списка.")
             return
-        
+        session.product_key = product_key
+
+    elif session.step == STEP_QUANTITY:
         try:
-            order_id = int(args[0])
+            quantity = int(text)
+            if quantity <= 0:
+                raise ValueError
         except ValueError:
-            bot.reply_to(message, "❌ Номер заказа должен быть числом!")
+            app.bot.reply_to(message, "❌ Количество должно быть положительным числом!")
             return
-        
-        orders = db.get_orders(limit=50)
-        target_order = None
-        
-        for order in orders:
-            if order[0] == order_id:
-                target_order = order
-                break
-        
-        if not target_order:
-            bot.reply_to(message, f"❌ Заказ #{order_id} не найден!")
+        session.quantity = quantity
+
+    elif session.step == STEP_CONFIRM:
+        answer = text.lower()
+        if answer in (CONFIRM_NO.lower(), 'нет', 'no'):
+            cancel_command(message)
             return
+        if answer not in (CONFIRM_YES.lower(), 'да', 'yes'):
+            app.bot.reply_to(message, "Ответьте «Да» или «Нет»")
+            return
+        app.sessions.discard(user_id)
+        products = app.catalog.products.get('products', {})
+        product = products.get(session.product_key, {})
+        create_order(
+            message,
+            session.customer_name,
+            product.get('name', session.product_key),
+            session.quantity,
+            session.quantity * product_price(session.product_key, product)
+        )
+        return
+
+    session.step = next_order_step(session)
+    app.sessions.save(user_id, session)
+    ask_order_step(message, session)
+
+
+@handler(commands=['orders'], error="❌ Ошибка при получении списка заказов")
+def send_orders(message):
+    """Показать список заказов"""
+    if not app.db_available:
+        app.bot.reply_to(message, "❌ База данных временно недоступна")
+        return
         
-        order_id, customer_name, product_name, quantity, total_price, status, created_at, notes = target_order
-        
+    orders = app.analytics('orders').get_orders(limit=10)
+    
+    if not orders:
+        app.bot.reply_to(message, 
+            "🛒 **Заказов пока нет**\n\n"
+            "💡 Чтобы добавить заказ, используйте команду:\n"
+            "`/add_order [клиент] [товар] [количество]`\n\n"
+            "📝 Пример: `/add_order Иван Мафия 1`"
+        )
+        return
+    
+    response = f"🛒 **Последние заказы ({len(orders)}):**\n\n"
+    
+    for order in orders:
         status_icons = {
             'новый': '🆕',
             'в работе': '🔄',
@@ -685,217 +984,594 @@ def send_order_detail(message):
             'отменен': '❌'
         }
         
-        response = f"{status_icons.get(status, '📦')} **Заказ #{order_id}**\n\n"
-        response += f"👤 **Клиент:** {customer_name}\n"
-        response += f"🎯 **Товар:** {product_name}\n"
-        response += f"📦 **Количество:** {quantity}\n"
-        response += f"💰 **Сумма:** {total_price} руб.\n"
-        response += f"📊 **Статус:** {status}\n"
-        response += f"📅 **Создан:** {created_at[:16]}\n"
-        
-        if notes:
-            response += f"📝 **Примечания:** {notes}\n"
-        
-        bot.reply_to(message, response)
-        db.log_request(message.from_user.id, f"/order {order_id}", f"Показан заказ #{order_id}", "order")
-        
-    except Exception as e:
-        logger.error(f"Error in order command: {e}")
-        bot.reply_to(message, "❌ Ошибка при получении информации о заказе")
+        response += f"{status_icons.get(order.status, '📦')} **Заказ #{order.id}**\n"
+        response += f"   👤 {order.customer_name}\n"
+        response += f"   🎯 {order.product_name} (x{order.quantity})\n"
+        response += f"   💰 {format_money(order.total_kopecks)} руб.\n"
+        response += f"   📊 {order.status}\n"
+        response += f"   📅 {format_timestamp(order.created_ts)}\n\n"
+    
+    response += "💡 Для подробной информации используйте `/order [номер]`"
+    
+    app.bot.reply_to(message, response)
+    note(f"Показано {len(orders)} заказов")
 
-@bot.message_handler(commands=['tasks'])
-def send_tasks(message):
-    """Показать задачи команды"""
-    if not DB_AVAILABLE:
-        bot.reply_to(message, "❌ База данных временно недоступна")
+@handler(commands=['order'], error="❌ Ошибка при получении информации о заказе")
+def send_order_detail(message):
+    """Показать детали конкретного заказа"""
+    if not app.db_available:
+        app.bot.reply_to(message, "❌ База данных временно недоступна")
         return
         
+    args = message.text.split()[1:]
+    if len(args) < 1:
+        app.bot.reply_to(message, 
+            "❌ **Укажите номер заказа!**\n\n"
+            "✅ Использование: `/order [номер]`\n"
+            "📝 Пример: `/order 1`\n\n"
+            "💡 Список заказов: `/orders`"
+        )
+        return
+    
+    try:
+        order_id = int(args[0])
+    except ValueError:
+        app.bot.reply_to(message, "❌ Номер заказа должен быть числом!")
+        return
+    
+    order = app.db.get_order(order_id)
+    
+    if not order:
+        app.bot.reply_to(message, f"❌ Заказ #{order_id} не найден!")
+        return
+    
+    status_icons = {
+        'новый': '🆕',
+        'в работе': '🔄',
+        'выполнен': '✅',
+        'отменен': '❌'
+    }
+    
+    response = f"{status_icons.get(order.status, '📦')} **Заказ #{order.id}**\n\n"
+    response += f"👤 **Клиент:** {order.customer_name}\n"
+    response += f"🎯 **Товар:** {order.product_name}\n"
+    response += f"📦 **Количество:** {order.quantity}\n"
+    response += f"💰 **Сумма:** {format_money(order.total_kopecks)} руб.\n"
+    response += f"📊 **Статус:** {order.status}\n"
+    response += f"📅 **Создан:** {format_timestamp(order.created_ts)}\n"
+    
+    if order.notes:
+        response += f"📝 **Примечания:** {order.notes}\n"
+    response += f"🔄 **Обновлен:** {format_timestamp(order.updated_ts)}\n"
+    
+    app.bot.reply_to(message, response)
+    note(f"Показан заказ #{order_id}")
+    
+
+
+def take_status(args, statuses):
+    """Статус заказа в начале списка слов: (статус, остаток) или (None, args)"""
+    for status in sorted(statuses, key=len, reverse=True):
+        words = status.split()
+        if [arg.lower() for arg in args[:len(words)]] == words:
+            return status, args[len(words):]
+    return None, args
+
+
+def parse_status_command(args, statuses):
+    """Разбор аргументов /order_status: (выборка для update_order_status, статус).
+
+    Выборка - номер заказа, диапазон "10-40" или текущий статус (или "все")
+    с необязательным "старше N" (дней); все остальное - новый статус.
+    Бросает ValueError с текстом ошибки для пользователя.
+    """
+    if not args:
+        raise ValueError("Укажите заказы и новый статус")
+    selection = {}
+    first = args[0]
+    if first.isdigit():
+        selection['order_ids'] = [int(first)]
+        args = args[1:]
+    elif first.count('-') == 1 and all(part.isdigit() for part in first.split('-')):
+        start, end = map(int, first.split('-'))
+        if start > end:
+            raise ValueError("Начало диапазона больше конца")
+        selection['id_range'] = (start, end)
+        args = args[1:]
+    else:
+        if first.lower() == 'все':
+            args = args[1:]
+        else:
+            current, args = take_status(args, statuses)
+            if current is None:
+                raise ValueError(f"Не понял, какие заказы менять: {first}")
+            selection['current_status'] = current
+        if args[:1] and args[0].lower() == 'старше':
+            if len(args) < 2 or not args[1].isdigit():
+                raise ValueError("После \"старше\" укажите число дней")
+            selection['older_than_days'] = int(args[1])
+            args = args[2:]
+        if not selection:
+            raise ValueError("Для всех заказов укажите возраст: все старше N")
+
+    status, rest = take_status(args, statuses)
+    if status is None or rest:
+        raise ValueError(f"Неизвестный статус: {' '.join(args) or 'не указан'}")
+    return selection, status
+
+
+@handler(commands=['order_status'], error="❌ Ошибка при изменении статуса")
+def send_order_status(message):
+    """Смена статуса заказов: одного, диапазона номеров или по фильтру"""
+    if not app.db_available:
+        app.bot.reply_to(message, "❌ База данных временно недоступна")
+        return
+
+    from database import ORDER_STATUSES
+
     try:
-        db.add_user(
-            message.from_user.id,
-            message.from_user.username,
-            message.from_user.first_name,
-            message.from_user.last_name
+        selection, status = parse_status_command(split_args(message.text), ORDER_STATUSES)
+    except ValueError as e:
+        app.bot.reply_to(message,
+            f"❌ {e}\n\n"
+            "✅ Использование:\n"
+            "`/order_status 12 в работе` - один заказ\n"
+            "`/order_status 10-40 выполнен` - диапазон номеров\n"
+            "`/order_status новый старше 3 отменен` - по статусу и возрасту (дней)\n\n"
+            f"📊 Статусы: {', '.join(ORDER_STATUSES)}"
         )
-        
-        tasks = db.get_tasks()
-        
-        if not tasks:
-            bot.reply_to(message, 
-                "✅ **Активных задач нет**\n\n"
-                "💡 Хотите добавить тестовую задачу?\n"
-                "Используйте команду:\n"
-                "`/add_test_task`"
-            )
+        return
+
+    # Массовые изменения - только для администраторов, а остальные
+    # пользователи меняют статус только своих заказов
+    admin = is_admin(message.from_user.id)
+    if not admin:
+        if 'order_ids' not in selection:
+            app.bot.reply_to(message, "⛔ Массовая смена статуса доступна только администраторам (ADMIN_IDS).")
             return
+        selection['user_id'] = message.from_user.id
+
+    result = app.db.update_order_status(status, **selection)
+    if result is None:
+        app.bot.reply_to(message, "❌ Ошибка при изменении статуса")
+        return
+    if not admin and not result['updated'] and not result['skipped']:
+        app.bot.reply_to(message, f"❌ Заказ #{selection['order_ids'][0]} не найден среди ваших заказов")
+        return
+
+    response = f"✅ Статус «{status}» установлен заказам: {result['updated']}"
+    if result['skipped']:
+        response += "\n\n⏭ Пропущены (переход недопустим):\n"
+        response += "\n".join(f"• {current}: {count}" for current, count in result['skipped'].items())
+    app.bot.reply_to(message, response)
+    note(f"Изменен статус {result['updated']} заказов")
+
+def format_task(task):
+    """Карточка задачи для списков задач"""
+    priority_icons = {
+        'высокий': '🔴',
+        'средний': '🟡', 
+        'низкий': '🟢'
+    }
+    
+    status_icons = {
+        'к выполнению': '⏳',
+        'в работе': '🔄', 
+        'выполнено': '✅'
+    }
+    
+    response = f"{priority_icons.get(task.priority, '⚪')} **{task.title}**\n"
+    response += f"   {status_icons.get(task.status, '📝')} Статус: {task.status}\n"
+    response += f"   👤 Ответственный: {task.assigned_to or 'не назначен'}\n"
+    response += f"   🏷 Приоритет: {task.priority}\n"
+    if task.due_date:
+        response += f"   📅 Срок: {task.due_date}\n"
+    if task.description:
+        response += f"   📝 {task.description}\n"
+    response += f"   🆔 ID: #{task.id}\n\n"
+    return response
+
+def reply_with_tasks(message, tasks, title, empty_text):
+    """Ответ списком задач и запись в историю запросов"""
+    if not tasks:
+        app.bot.reply_to(message, empty_text)
+        return
+
+    response = f"{title}\n\n"
+    for task in tasks:
+        response += format_task(task)
+
+    app.bot.reply_to(message, response)
+    note(f"Показано {len(tasks)} задач")
+
+@handler(commands=['tasks'], error="❌ Ошибка при получении задач")
+def send_tasks(message):
+    """Показать незавершенные задачи команды"""
+    if not app.db_available:
+        app.bot.reply_to(message, "❌ База данных временно недоступна")
+        return
         
-        response = "📋 **Задачи команды GameBored:**\n\n"
-        for task in tasks:
-            task_id, title, description, assigned_to, priority, status, due_date, created_at = task
-            
-            priority_icons = {
-                'высокий': '🔴',
-                'средний': '🟡', 
-                'низкий': '🟢'
-            }
-            
-            status_icons = {
-                'к выполнению': '⏳',
-                'в работе': '🔄', 
-                'выполнено': '✅'
-            }
-            
-            response += f"{priority_icons.get(priority, '⚪')} **{title}**\n"
-            response += f"   {status_icons.get(status, '📝')} Статус: {status}\n"
-            response += f"   👤 Ответственный: {assigned_to or 'не назначен'}\n"
-            response += f"   🏷 Приоритет: {priority}\n"
-            if due_date:
-                response += f"   📅 Срок: {due_date}\n"
-            if description:
-                response += f"   📝 {description}\n"
-            response += f"   🆔 ID: #{task_id}\n\n"
-        
-        bot.reply_to(message, response)
-        db.log_request(message.from_user.id, "/tasks", f"Показано {len(tasks)} задач", "tasks")
-        
-    except Exception as e:
-        logger.error(f"Error in tasks command: {e}")
-        bot.reply_to(message, "❌ Ошибка при получении задач")
+    reply_with_tasks(
+        message,
+        app.db.get_tasks(),
+        "📋 **Задачи команды GameBored:**",
+        "✅ **Активных задач нет**\n\n"
+        "💡 Хотите добавить тестовую задачу?\n"
+        "Используйте команду:\n"
+        "`/add_test_task`"
+    )
+
+@handler(commands=['my_tasks'], error="❌ Ошибка при получении задач")
+def send_my_tasks(message):
+    """Незавершенные задачи пользователя или указанного исполнителя"""
+    if not app.db_available:
+        app.bot.reply_to(message, "❌ База данных временно недоступна")
+        return
+
+    assignee = ' '.join(message.text.split()[1:])
+    if assignee:
+        assignees = [assignee]
+    else:
+        user = message.from_user
+        full_name = ' '.join(filter(None, [user.first_name, user.last_name]))
+        assignees = [name for name in (full_name, user.username and f"@{user.username}",
+                                       user.username) if name]
+
+    reply_with_tasks(
+        message,
+        app.db.get_assigned_tasks(assignees),
+        f"👤 **Открытые задачи: {', '.join(assignees)}**",
+        "✅ Открытых задач нет\n\n💡 Задачи другого исполнителя: `/my_tasks [имя]`"
+    )
+
+
+@handler(commands=['overdue'], error="❌ Ошибка при получении задач")
+def send_overdue_tasks(message):
+    """Просроченные незавершенные задачи"""
+    if not app.db_available:
+        app.bot.reply_to(message, "❌ База данных временно недоступна")
+        return
+
+    today = datetime.now().date().isoformat()
+    reply_with_tasks(
+        message,
+        app.db.get_overdue_tasks(today),
+        "⏰ **Просроченные задачи:**",
+        "✅ Просроченных задач нет"
+    )
+
+
+@handler(commands=['week_tasks'], error="❌ Ошибка при получении задач")
+def send_week_tasks(message):
+    """Незавершенные задачи со сроком на этой неделе"""
+    if not app.db_available:
+        app.bot.reply_to(message, "❌ База данных временно недоступна")
+        return
+
+    today = datetime.now().date()
+    sunday = today + timedelta(days=6 - today.weekday())
+    reply_with_tasks(
+        message,
+        app.db.get_tasks_due_between(today.isoformat(), sunday.isoformat()),
+        f"🗓 **Задачи на неделю (до {sunday.isoformat()}):**",
+        "✅ На этой неделе сроков нет"
+    )
 
-@bot.message_handler(commands=['add_test_task'])
+
+@handler(commands=['add_test_task'], error="❌ Ошибка при добавлении тестовой задачи")
 def add_test_task(message):
     """Добавить тестовую задачу (для демонстрации)"""
-    if not DB_AVAILABLE:
-        bot.reply_to(message, "❌ База данных временно недоступна")
+    if not app.db_available:
+        app.bot.reply_to(message, "❌ База данных временно недоступна")
         return
         
-    try:
-        task_id = db.add_task(
-            title="Обновить ассортимент товаров",
-            description="Добавить новые темы для кастомизации игр",
-            assigned_to="Менеджер по продукту",
-            priority="средний",
-            due_date="2024-12-20"
+    task_id = app.db.add_task(
+        title="Обновить ассортимент товаров",
+        description="Добавить новые темы для кастомизации игр",
+        assigned_to="Менеджер по продукту",
+        priority="средний",
+        due_date="2024-12-20"
+    )
+    
+    if task_id:
+        response = (
+            "✅ **Тестовая задача добавлена!**\n\n"
+            f"📋 ID задачи: #{task_id}\n"
+            "💡 Теперь используйте команду `/tasks` чтобы увидеть все задачи."
         )
-        
-        if task_id:
-            response = (
-                "✅ **Тестовая задача добавлена!**\n\n"
-                f"📋 ID задачи: #{task_id}\n"
-                "💡 Теперь используйте команду `/tasks` чтобы увидеть все задачи."
-            )
-            bot.reply_to(message, response)
-            db.log_request(message.from_user.id, "/add_test_task", f"Добавлена задача ID: {task_id}", "add_test_task")
-        else:
-            bot.reply_to(message, "❌ Ошибка при добавлении тестовой задачи")
-            
-    except Exception as e:
-        logger.error(f"Error in add_test_task command: {e}")
-        bot.reply_to(message, "❌ Ошибка при добавлении тестовой задачи")
+        app.bot.reply_to(message, response)
+        note(f"Добавлена задача ID: {task_id}")
+    else:
+        app.bot.reply_to(message, "❌ Ошибка при добавлении тестовой задачи")
+
+def format_writer_stats():
+    """Строка со статистикой потока записи для /debug"""
+    if not app.db_available:
+        return ""
+    stats = app.db.writer.stats()
+    return (f"✍️ **Запись в БД:** очередь {stats['queue_depth']}, "
+            f"команд {stats['commands']}, транзакций {stats['batches']}, "
+            f"макс. пакет {stats['largest_batch']}")
+
+def format_journal_stats():
+    """Строка о состоянии записи в БД и журнале для /debug"""
+    journal = app.journal
+    db = app.db
+    state = "✅ в норме" if db is not None and not db.degraded else "⚠️ работа через журнал"
+    pending = ", есть неперенесенные записи" if journal.pending else ""
+    return (f"🩺 **Запись в БД:** {state}; журнал: записано {journal.appended}, "
+            f"перенесено в БД {journal.replayed}{pending}")
+
+def format_snapshot_stats():
+    """Строка о снимке аналитики для /debug"""
+    snapshot = app.snapshot
+    if snapshot is None:
+        return "📸 **Снимок аналитики:** отключен"
+    age = snapshot.age()
+    if age is None:
+        if snapshot.last_error is not None:
+            return f"📸 **Снимок аналитики:** не создан, ошибка: {snapshot.last_error}"
+        return "📸 **Снимок аналитики:** еще не создан"
+    line = f"📸 **Снимок аналитики:** возраст {age:.0f} с, обновлений {snapshot.refreshes}"
+    if snapshot.last_error is not None:
+        line += f", последняя ошибка: {snapshot.last_error}"
+    return line
+
+def format_intake_stats():
+    """Строка с метриками очереди входящих обновлений для /debug"""
+    stats = app.intake_stats()
+    depth = ', '.join(f"{name} {count}" for name, count in stats['depth'].items())
+    shed = ', '.join(f"{name} {count}" for name, count in stats['shed'].items())
+    waits = ', '.join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in stats['wait_p95'].items())
+    return (f"📥 **Очередь обновлений:** {depth}\n"
+            f"🚫 **Сброшено при перегрузке:** {shed}\n"
+            f"⏳ **Ожидание p95:** {waits or 'нет данных'}")
+
+def format_pipeline_stats():
+    """Строка с метриками обработки сообщений для /debug"""
+    stats = app.pipeline.stats()
+    if 'handled' not in stats:
+        return "⚙️ **Обработка сообщений:** нет данных"
+    return (f"⚙️ **Обработка сообщений:** {stats['handled']}, ошибок {stats['errors']}, "
+            f"медленных {stats['slow']}\n"
+            f"⏱ **Время обработки:** в среднем {stats['avg_ms']:.0f} мс, "
+            f"максимум {stats['max_ms']:.0f} мс")
+
+def is_admin(user_id):
+    """Администраторы задаются списком Telegram ID в ADMIN_IDS через запятую"""
+    admins = {part.strip() for part in os.getenv('ADMIN_IDS', '').split(',')}
+    return str(user_id) in admins
+
+
+def format_maintenance_report(maintenance, results=None):
+    """Отчет планировщика обслуживания БД для /maintenance"""
+    rate = maintenance.traffic_rate()
+    rate_text = f"{rate:.1f} обн/мин" if rate is not None else "еще оценивается"
+    due = maintenance.due_tasks()
+    lines = [
+        "🧹 **Обслуживание БД:**",
+        f"📈 Нагрузка: {rate_text} (тихо ниже {maintenance.low_traffic_rate:g})",
+        f"⏳ Ожидают: {', '.join(due) if due else 'нет'}",
+    ]
+    history = results if results is not None else list(maintenance.history)[-10:]
+    if history:
+        lines.append("")
+        lines.append("📋 **Запуск сейчас:**" if results is not None else "📋 **Последние запуски:**")
+        for result in history:
+            lines.append(f"{'✅' if result.done else '⏸'} {format_timestamp(result.started_at)} "
+                         f"{result.task} ({result.duration * 1000:.0f} мс): {result.details}")
+    else:
+        lines.append("Задачи еще не запускались.")
+    return "\n".join(lines)
+
 
-@bot.message_handler(commands=['debug'])
+@handler(commands=['maintenance'], error="❌ Ошибка обслуживания БД")
+def send_maintenance(message):
+    """Отчет об обслуживании БД; /maintenance run - выполнить все задачи сейчас"""
+    if not is_admin(message.from_user.id):
+        app.bot.reply_to(message, "⛔ Команда доступна только администраторам (ADMIN_IDS).")
+        return
+    maintenance = app.maintenance
+    if maintenance is None:
+        app.bot.reply_to(message, "❌ Обслуживание БД отключено или база данных недоступна")
+        return
+    results = None
+    if split_args(message.text)[:1] == ['run']:
+        results = maintenance.run_due(force=True)
+    app.bot.reply_to(message, format_maintenance_report(maintenance, results))
+
+
+def format_backups_report(backups):
+    """Список резервных копий для /backup"""
+    items = backups.list()
+    lines = [
+        "💾 **Резервные копии БД:**",
+        f"📁 Папка: {backups.folder}",
+        f"⏱ Интервал: {backups.interval / 3600:g} ч, хранение: "
+        + ', '.join(f"{rule} {count}" for rule, count in backups.retention.items()),
+    ]
+    if backups.last_error is not None:
+        lines.append(f"❌ Последняя ошибка: {backups.last_error}")
+    if not items:
+        lines.append("Копий пока нет.")
+    for backup in reversed(items[-10:]):
+        lines.append(f"• {backup.created_at:%d.%m.%Y %H:%M} UTC - {backup.size / 1024:.0f} КБ")
+    return "\n".join(lines)
+
+
+@handler(commands=['backup'], error="❌ Ошибка резервного копирования")
+def send_backup(message):
+    """Резервные копии БД; /backup run - снять копию, /backup verify - проверить последнюю"""
+    if not is_admin(message.from_user.id):
+        app.bot.reply_to(message, "⛔ Команда доступна только администраторам (ADMIN_IDS).")
+        return
+    backups = app.backups
+    if backups is None:
+        app.bot.reply_to(message, "❌ Резервное копирование отключено или база данных недоступна")
+        return
+    from backup import BackupError
+
+    action = split_args(message.text)[:1]
+    if action == ['run']:
+        try:
+            backups.create()
+            backups.last_error = None
+        except BackupError as e:
+            backups.last_error = e
+            app.bot.reply_to(message, f"❌ Копия не создана: {e}")
+            return
+    elif action == ['verify']:
+        items = backups.list()
+        if not items:
+            app.bot.reply_to(message, "❌ Копий для проверки нет")
+            return
+        try:
+            counts = backups.verify(items[-1].path)
+            status = "✅ Последняя копия цела: " + ', '.join(
+                f"{table} {count}" for table, count in counts.items())
+        except BackupError as e:
+            status = f"❌ Последняя копия повреждена: {e}"
+        app.bot.reply_to(message, status)
+        return
+    app.bot.reply_to(message, format_backups_report(backups))
+
+@handler(commands=['debug'], error="❌ Ошибка отладки")
 def send_debug(message):
     """Отладочная информация"""
-    try:
-        events_exists = os.path.exists(EVENTS_FILE)
-        contacts_exists = os.path.exists(CONTACTS_FILE)
-        company_exists = os.path.exists(COMPANY_INFO_FILE)
-        products_exists = os.path.exists(PRODUCTS_FILE)
-        db_exists = os.path.exists('gameboard_bot.db')
-        
-        events_data = load_json(EVENTS_FILE)
-        contacts_data = load_json(CONTACTS_FILE)
-        company_data = load_json(COMPANY_INFO_FILE)
-        products_data = load_json(PRODUCTS_FILE)
-        
-        response = f"""🔧 **Отладочная информация:**
+    events_exists = app.catalog.exists('events')
+    contacts_exists = app.catalog.exists('contacts')
+    company_exists = app.catalog.exists('company_info')
+    products_exists = app.catalog.exists('products')
+    db_exists = os.path.exists(app.db_path)
+    
+    events_data = app.catalog.events
+    contacts_data = app.catalog.contacts
+    company_data = app.catalog.company_info
+    products_data = app.catalog.products
+    
+    response = f"""🔧 **Отладочная информация:**
 
 📁 **Файлы данных:**
 • events.json: {'✅' if events_exists else '❌'} ({len(events_data) if events_data else 0} событий)
 • contacts.json: {'✅' if contacts_exists else '❌'} ({len(contacts_data) if contacts_data else 0} контактов)
 • company_info.json: {'✅' if company_exists else '❌'}
 • products.json: {'✅' if products_exists else '❌'}
+• catalog.pack: {app.catalog.version or 'нет, данные читаются из JSON'}
 • gameboard_bot.db: {'✅' if db_exists else '❌'}
 
-🤖 **База данных:** {'✅ Доступна' if DB_AVAILABLE else '❌ Недоступна'}
+🤖 **База данных:** {'✅ Доступна' if app.db_available else '❌ Недоступна'}
+🏷 **Бот:** {app.name}
+⏱ **Запуск:** {app.report.total() * 1000:.0f} мс
+{format_writer_stats()}
+{format_journal_stats()}
+{format_snapshot_stats()}
+{format_intake_stats()}
+{format_pipeline_stats()}
 
 🤖 Бот активен! 🚀
-        """
-        
-        bot.reply_to(message, response)
-        if DB_AVAILABLE:
-            db.log_request(message.from_user.id, "/debug", "Показана отладочная информация", "debug")
-        
-    except Exception as e:
-        bot.reply_to(message, f"❌ Ошибка отладки: {e}")
+    """
+    
+    app.bot.reply_to(message, response)
+    note("Показана отладочная информация")
 
-@bot.message_handler(func=lambda message: True)
+QUESTION_WORDS = ('как', 'сколько', 'где', 'когда', 'что', 'какой', 'какая', 'какие',
+                  'можно', 'есть ли', 'почему', 'зачем', 'кто', 'чем', 'подойдет')
+
+
+def is_question(text):
+    """Похоже ли сообщение на вопрос, а не на запрос раздела"""
+    return text.rstrip().endswith('?') or text.startswith(QUESTION_WORDS)
+
+
+@handler(func=lambda message: True)
 def handle_all_messages(message):
     """Обработка всех текстовых сообщений"""
-    try:
-        if DB_AVAILABLE:
-            db.add_user(
-                message.from_user.id,
-                message.from_user.username,
-                message.from_user.first_name,
-                message.from_user.last_name
-            )
-        
-        user_message = message.text.lower()
-        response_text = ""
-        command_used = "text_message"
-        
-        if any(word in user_message for word in ['компани', 'о компани', 'организац']):
-            send_about(message)
-            response_text = "Информация о компании"
-        elif any(word in user_message for word in ['контакт', 'телефон', 'email', 'коллег']):
-            send_contacts(message)
-            response_text = "Контакты команды"
-        elif any(word in user_message for word in ['событи', 'акци', 'встреч', 'мероприят']):
-            send_events(message)
-            response_text = "События и акции"
-        elif any(word in user_message for word in ['товар', 'игр', 'цен', 'стоит', 'купить']):
-            send_products(message)
-            response_text = "Товары и цены"
-        elif any(word in user_message for word in ['дайджест', 'итог', 'сводк']):
-            send_digest(message)
-            response_text = "Ежедневный дайджест"
-        elif any(word in user_message for word in ['статистик', 'статус', 'отчет']):
-            send_stats(message)
-            response_text = "Статистика бота"
-        elif any(word in user_message for word in ['заказ', 'заказы', 'покуп']):
-            send_orders(message)
-            response_text = "Список заказов"
-        elif any(word in user_message for word in ['задач', 'todo', 'дело']):
-            send_tasks(message)
-            response_text = "Задачи команды"
-        elif any(word in user_message for word in ['истори', 'мои запрос']):
-            send_my_requests(message)
-            response_text = "История запросов"
-        elif any(word in user_message for word in ['привет', 'здравств', 'hello', 'hi']):
-            bot.reply_to(message, "Привет! Чем могу помочь? 😊")
-            response_text = "Приветствие"
+    user_message = message.text.lower()
+    response_text = ""
+    # Вопросы сначала ищутся в FAQ и данных каталога, остальной текст -
+    # по ключевым словам, а FAQ остается запасным вариантом
+    answer = app.faq.answer(message.text) if is_question(user_message) else None
+    
+    if answer:
+        app.bot.reply_to(message, answer)
+        response_text = "Ответ из FAQ"
+    elif any(word in user_message for word in ['компани', 'о компани', 'организац']):
+        send_about(message)
+        response_text = "Информация о компании"
+    elif any(word in user_message for word in ['контакт', 'телефон', 'email', 'коллег']):
+        send_contacts(message)
+        response_text = "Контакты команды"
+    elif any(word in user_message for word in ['событи', 'акци', 'встреч', 'мероприят']):
+        send_events(message)
+        response_text = "События и акции"
+    elif any(word in user_message for word in ['товар', 'игр', 'цен', 'стоит', 'купить']):
+        send_products(message)
+        response_text = "Товары и цены"
+    elif any(word in user_message for word in ['дайджест', 'итог', 'сводк']):
+        send_digest(message)
+        response_text = "Ежедневный дайджест"
+    elif any(word in user_message for word in ['статистик', 'статус', 'отчет']):
+        send_stats(message)
+        response_text = "Статистика бота"
+    elif any(word in user_message for word in ['заказ', 'заказы', 'покуп']):
+        send_orders(message)
+        response_text = "Список заказов"
+    elif any(word in user_message for word in ['задач', 'todo', 'дело']):
+        send_tasks(message)
+        response_text = "Задачи команды"
+    elif any(word in user_message for word in ['истори', 'мои запрос']):
+        send_my_requests(message)
+        response_text = "История запросов"
+    elif any(word in user_message for word in ['привет', 'здравств', 'hello', 'hi']):
+        app.bot.reply_to(message, "Привет! Чем могу помочь? 😊")
+        response_text = "Приветствие"
+    else:
+        answer = app.faq.answer(message.text)
+        if answer:
+            app.bot.reply_to(message, answer)
+            response_text = "Ответ из FAQ"
         else:
-            bot.reply_to(message, "Я пока не знаю ответ на этот вопрос. Попробуйте использовать команды из /help")
+            app.bot.reply_to(message, "Я пока не знаю ответ на этот вопрос. Попробуйте использовать команды из /help")
             response_text = "Неизвестный запрос"
-        
-        if DB_AVAILABLE:
-            db.log_request(
-                message.from_user.id,
-                message.text,
-                response_text,
-                command_used
-            )
-        
-    except Exception as e:
-        logger.error(f"Error handling message: {e}")
-        bot.reply_to(message, "❌ Произошла ошибка при обработке запроса")
+    
+    note(response_text)
+
+def main():
+    # Загрузка переменных окружения и настройка логирования до создания компонентов
+    load_dotenv()
+    atexit.register(setup_logging().stop)
+
+    # Несколько ботов в одном процессе, если задан файл конфигурации
+    if os.getenv('TENANTS_CONFIG'):
+        from tenants import TenantRuntime
+        runtime = TenantRuntime.from_env(HANDLERS)
+        print(f"🤖 Запуск ботов: {', '.join(runtime.apps)}")
+        runtime.run()
+        return
+
+    # Реплика с выбором лидера: polling и фоновые задачи только у лидера
+    if os.getenv('LEADER_ELECTION'):
+        from leader import LeaderLease, ReplicaRunner, LEASE_TTL
+        application = create_app(jobs=False)
+        lease = LeaderLease(application.db_path, ttl=float(os.getenv('LEADER_LEASE_TTL', LEASE_TTL)))
+        print(f"🤖 Реплика {lease.holder} запущена, ожидание аренды лидера")
+        ReplicaRunner(application, lease).run()
+        return
+
+    application = create_app()
+    # Компоненты создаются здесь явно, чтобы отчет о запуске учитывал их стоимость
+    application.catalog
+    application.db
+    application.snapshot
+    application.maintenance
+    application.backups
+    application.health
+    application.bot
 
-if __name__ == '__main__':
     logger.info("Bot is starting...")
     print("=" * 50)
     print("🤖 GameBoard Bot запущен!")
-    print(f"📊 База данных: {'✅ Доступна' if DB_AVAILABLE else '❌ Недоступна'}")
+    print(f"📊 База данных: {'✅ Доступна' if application.db_available else '❌ Недоступна'}")
     print("✅ Доступные команды БД:")
     print("   /stats - статистика")
     print("   /my_requests - история запросов") 
@@ -904,5 +1580,12 @@ if __name__ == '__main__':
     print("   /order - детали заказа")
     print("   /tasks - задачи команды")
     print("   /add_test_task - тестовая задача")
+    print(application.report.format())
     print("=" * 50)
-    bot.infinity_polling()
+    try:
+        application.bot.infinity_polling()
+    finally:
+        application.close()
+
+if __name__ == '__main__':
+    main()
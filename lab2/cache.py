@@ -0,0 +1,140 @@
+import time
+import threading
+from collections import OrderedDict, deque
+
+
+class TTLCache:
+    """Потокобезопасный словарь с ограничением размера и временем жизни.
+
+    Записи упорядочены по последнему обращению: при превышении maxsize
+    вытесняется самая давняя, просроченные записи удаляются при чтении и
+    при вставке новых. Все операции выполняются за O(1) без обращения к диску.
+    """
+
+    def __init__(self, maxsize=1000, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        now = time.monotonic()
+        with self._lock:
+            self._data[key] = (now + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            self._evict(now)
+
+    def add(self, key, value=True, ttl=None):
+        """Вставить запись, только если ключа еще нет; True, если вставлена"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > now:
+                return False
+            self._data[key] = (now + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            self._evict(now)
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        if item is None or item[0] <= time.monotonic():
+            return default
+        return item[1]
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+    def items(self):
+        """Снимок живых записей: список (ключ, значение, оставшийся TTL)"""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value, expires_at - now)
+                    for key, (expires_at, value) in self._data.items()
+                    if expires_at > now]
+
+    def purge(self):
+        """Удалить все просроченные записи"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._data.items() if expires_at <= now]
+            for key in expired:
+                del self._data[key]
+        return len(expired)
+
+    def _evict(self, now):
+        # Сначала выбрасываем просроченные записи с "холодного" конца,
+        # затем самые давние, пока не уложимся в лимит
+        while self._data:
+            key, (expires_at, _) = next(iter(self._data.items()))
+            if expires_at > now and len(self._data) <= self.maxsize:
+                break
+            del self._data[key]
+            if expires_at > now:
+                self.evictions += 1
+
+
+_MISSING = object()
+
+
+class HistoryCache:
+    """Кольцевые буферы последних записей по пользователям.
+
+    Для каждого пользователя хранится не больше size записей (deque с
+    maxlen), а число пользователей ограничено max_users с вытеснением
+    давно не обращавшихся (LRU). append дописывает только в уже прогретый
+    буфер: холодный пользователь сначала загружается из БД через put.
+    """
+
+    def __init__(self, size=5, max_users=1000):
+        self.size = size
+        self.max_users = max_users
+        self.hits = 0
+        self.misses = 0
+        self._buffers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Записи пользователя от новых к старым или None, если буфер не прогрет"""
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            if buffer is None:
+                self.misses += 1
+                return None
+            self._buffers.move_to_end(user_id)
+            self.hits += 1
+            return list(reversed(buffer))
+
+    def put(self, user_id, items):
+        """Прогреть буфер записями от новых к старым"""
+        with self._lock:
+            self._buffers[user_id] = deque(reversed(items[:self.size]), maxlen=self.size)
+            self._buffers.move_to_end(user_id)
+            while len(self._buffers) > self.max_users:
+                self._buffers.popitem(last=False)
+
+    def append(self, user_id, item):
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            if buffer is not None:
+                buffer.append(item)
+
+    def __len__(self):
+        return len(self._buffers)
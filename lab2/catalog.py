@@ -0,0 +1,229 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import marshal
+import threading
+
+from schemas import SCHEMAS, validate
+
+logger = logging.getLogger(__name__)
+
+# Имя набора данных -> файл в папке data/
+DATA_FILES = {
+    'contacts': 'contacts.json',
+    'events': 'events.json',
+    'company_info': 'company_info.json',
+    'products': 'products.json',
+    'faq': 'faq.json',
+}
+
+# Скомпилированный снимок всех наборов: заголовок, sha256 содержимого и
+# словарь в формате marshal, который читается одним read() без разбора JSON
+PACK_FILE = 'catalog.pack'
+PACK_MAGIC = b'GBPACK1\n'
+PACK_FORMAT = 1
+
+
+def load_json(file_path):
+    """Загрузка данных из JSON файла"""
+    try:
+        if os.path.exists(file_path):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+    except Exception as e:
+        logger.error(f"Error loading {file_path}: {e}")
+        return {}
+
+
+def _source_key(stat):
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class DataError(Exception):
+    """Набор данных не прошел проверку при сборке снимка"""
+
+
+def build_pack(folder='data', pack_path=None):
+    """Проверить наборы данных по схемам и собрать снимок; возвращает версию.
+
+    Любой битый или не соответствующий схеме файл прерывает сборку с
+    DataError, поэтому плохие данные не доходят до выкладки.
+    """
+    if not os.path.isdir(folder):
+        raise DataError(f"Нет папки данных {folder}")
+    pack_path = pack_path or os.path.join(folder, PACK_FILE)
+    data, sources, errors = {}, {}, []
+    digest = hashlib.sha256()
+    for name, filename in DATA_FILES.items():
+        path = os.path.join(folder, filename)
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as f:
+            raw = f.read()
+        try:
+            value = json.loads(raw.decode('utf-8'))
+        except ValueError as e:
+            errors.append(f"{filename}: {e}")
+            continue
+        errors.extend(f"{filename}: {error}" for error in validate(value, SCHEMAS[name]))
+        data[name] = value
+        sources[name] = _source_key(os.stat(path))
+        digest.update(name.encode() + b'\0' + raw)
+    if errors:
+        raise DataError('\n'.join(errors))
+
+    version = digest.hexdigest()[:12]
+    payload = marshal.dumps({
+        'format': PACK_FORMAT,
+        'version': version,
+        'built_at': int(time.time()),
+        'sources': sources,
+        'data': data,
+    })
+    tmp_path = pack_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(PACK_MAGIC + hashlib.sha256(payload).digest() + payload)
+    os.replace(tmp_path, pack_path)
+    return version
+
+
+def load_pack(pack_path):
+    """Прочитать снимок; None, если его нет, он поврежден или другого формата"""
+    try:
+        with open(pack_path, 'rb') as f:
+            raw = f.read()
+    except OSError:
+        return None
+    header = len(PACK_MAGIC)
+    payload = raw[header + 32:]
+    if raw[:header] != PACK_MAGIC or raw[header:header + 32] != hashlib.sha256(payload).digest():
+        logger.error(f"Снимок данных {pack_path} поврежден, используются JSON-файлы")
+        return None
+    try:
+        pack = marshal.loads(payload)
+    except (ValueError, EOFError, TypeError) as e:
+        # marshal несовместим между версиями Python - снимок нужно пересобрать
+        logger.error(f"Снимок данных {pack_path} не читается: {e}")
+        return None
+    if pack.get('format') != PACK_FORMAT:
+        return None
+    return pack
+
+
+class DataCatalog:
+    """Ленивый кэш наборов данных из папки data/.
+
+    Если рядом лежит снимок catalog.pack (python catalog.py), все наборы
+    берутся из него одним чтением файла. Набор, чей JSON изменился после
+    сборки снимка (mtime или размер), читается из файла и проверяется по
+    схеме; при ошибках остается последняя корректная версия. Обработчики
+    не парсят JSON на каждый запрос: файл перечитывается только при
+    изменении.
+    """
+
+    def __init__(self, folder='data', pack_path=None):
+        self.folder = folder
+        self.pack_path = pack_path or os.path.join(folder, PACK_FILE)
+        self._cache = {}
+        self._pack = None
+        self._pack_mtime = None
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        """Полный путь к файлу набора данных"""
+        return os.path.join(self.folder, DATA_FILES[name])
+
+    @property
+    def version(self):
+        """Версия загруженного снимка данных или None"""
+        pack = self._load_pack()
+        return pack['version'] if pack else None
+
+    def _load_pack(self):
+        try:
+            mtime = os.stat(self.pack_path).st_mtime_ns
+        except OSError:
+            return None
+        if mtime != self._pack_mtime:
+            self._pack = load_pack(self.pack_path)
+            self._pack_mtime = mtime
+        return self._pack
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def get(self, name):
+        """Данные набора; пустой словарь, если файла нет или он битый"""
+        path = self.path(name)
+        try:
+            key = _source_key(os.stat(path))
+        except OSError:
+            return {}
+
+        cached = self._cache.get(name)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        with self._lock:
+            cached = self._cache.get(name)
+            if cached and cached[0] == key:
+                return cached[1]
+            pack = self._load_pack()
+            if pack and pack['sources'].get(name) == key:
+                data = pack['data'][name]
+            else:
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    errors = validate(data, SCHEMAS[name])
+                except (OSError, ValueError) as e:
+                    data, errors = {}, [str(e)]
+                if errors:
+                    logger.error(f"Ошибки в {DATA_FILES[name]}: {'; '.join(errors[:5])}")
+                    # Последняя корректная версия: из кэша этого процесса,
+                    # а в новом процессе - из снимка
+                    if cached:
+                        data = cached[1]
+                    elif pack and name in pack['data']:
+                        data = pack['data'][name]
+            self._cache[name] = (key, data)
+            return data
+
+    @property
+    def contacts(self):
+        return self.get('contacts')
+
+    @property
+    def events(self):
+        return self.get('events')
+
+    @property
+    def company_info(self):
+        return self.get('company_info')
+
+    @property
+    def products(self):
+        return self.get('products')
+
+    @property
+    def faq(self):
+        return self.get('faq') or []
+
+
+def main():
+    """Сборка снимка: python catalog.py [папка данных]"""
+    folder = sys.argv[1] if len(sys.argv) > 1 else 'data'
+    try:
+        version = build_pack(folder)
+    except DataError as e:
+        print(f"❌ Данные не прошли проверку:\n{e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"✅ Снимок данных {os.path.join(folder, PACK_FILE)} собран, версия {version}")
+
+
+if __name__ == '__main__':
+    main()
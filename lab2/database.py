@@ -1,143 +1,133 @@
+import time
+import heapq
 import sqlite3
 import logging
+import threading
 from datetime import datetime
+from itertools import islice
 import os
+from concurrent.futures import TimeoutError as WriteTimeout
+
+from cache import HistoryCache, TTLCache
+from journal import ORDER_PENDING, order_key
+from maintenance import convert_auto_vacuum
+from models import Order, Task, User, UserRequest
+from writer import DatabaseWriter
 
 logger = logging.getLogger(__name__)
 
-class DatabaseManager:
-    def __init__(self, db_path='gameboard_bot.db'):
-        self.db_path = db_path
-        logger.info(f"🔄 Инициализация БД по пути: {os.path.abspath(self.db_path)}")
-        self.init_db()
+# Сколько секунд ждать результата команды из очереди записи
+WRITE_TIMEOUT = 10
+# Сколько ждать пробной записи при проверке здоровья и пакета из журнала
+HEALTH_TIMEOUT = 5
+REPLAY_TIMEOUT = 60
 
-    def get_connection(self):
-        """Создание соединения с базой данных"""
-        logger.debug(f"📂 Подключение к БД: {self.db_path}")
-        return sqlite3.connect(self.db_path)
+# Ошибки, после которых записи уходят в журнал: БД заблокирована, диск
+# недоступен или поток записи не отвечает. Ошибки самих данных (например,
+# IntegrityError) в журнал не идут - они повторились бы при воспроизведении.
+DB_DOWN_ERRORS = (sqlite3.OperationalError, WriteTimeout)
 
-    def init_db(self):
-        """Инициализация базы данных и создание таблиц"""
-        try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
+# Размер порции и пауза между порциями фоновой миграции старых заказов
+MIGRATION_BATCH = 500
+MIGRATION_PAUSE = 0.05
 
-                # Таблица пользователей
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS users (
-                        user_id INTEGER PRIMARY KEY,
-                        username TEXT,
-                        first_name TEXT,
-                        last_name TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
+# Сколько ключей идемпотентности заказов держать в памяти и как долго (секунды)
+ORDER_KEYS_CACHE_SIZE = 10000
+ORDER_KEYS_TTL = 24 * 60 * 60
 
-                # Таблица истории запросов
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS user_requests (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER,
-                        request_text TEXT,
-                        response_text TEXT,
-                        command_used TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users (user_id)
-                    )
-                ''')
+# Сколько строк читать из курсора за раз при выгрузке всех строк
+ITER_BATCH = 500
 
-                # Таблица заказов
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS orders (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER,
-                        customer_name TEXT NOT NULL,
-                        product_name TEXT NOT NULL,
-                        quantity INTEGER DEFAULT 1,
-                        total_price DECIMAL(10, 2),
-                        status TEXT DEFAULT 'новый',
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        notes TEXT,
-                        FOREIGN KEY (user_id) REFERENCES users (user_id)
-                    )
-                ''')
+# Сколько интернированных текстов ответов и команд держать в памяти и как долго
+TEXT_CACHE_SIZE = 10000
+TEXT_CACHE_TTL = 24 * 60 * 60
 
-                # Таблица задач команды
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS tasks (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        title TEXT NOT NULL,
-                        description TEXT,
-                        assigned_to TEXT,
-                        priority TEXT DEFAULT 'средний',
-                        status TEXT DEFAULT 'к выполнению',
-                        due_date DATE,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
+# Сколько последних запросов помнить на пользователя и для скольких пользователей
+REQUEST_HISTORY_SIZE = 5
+REQUEST_HISTORY_USERS = 1000
 
-                conn.commit()
-                logger.info("✅ База данных успешно инициализирована")
+# Выражения для группировки дневных агрегатов по периодам
+SALES_PERIODS = {
+    'day': 'day',
+    'week': "date(day, 'weekday 0', '-6 days')",
+    'month': "strftime('%Y-%m', day)",
+}
+SALES_BREAKDOWNS = {
+    None: "''",
+    'product': 'product_name',
+    'status': 'status',
+}
 
-        except Exception as e:
-            logger.error(f"❌ Ошибка при инициализации БД: {e}")
-            raise
 
-    def add_user(self, user_id, username, first_name, last_name):
-        """Добавление/обновление пользователя"""
-        try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT OR REPLACE INTO users 
-                    (user_id, username, first_name, last_name, last_activity)
-                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-                ''', (user_id, username, first_name, last_name))
-                conn.commit()
-                logger.info(f"Пользователь {user_id} добавлен/обновлен")
-        except Exception as e:
-            logger.error(f"Ошибка при добавлении пользователя: {e}")
+def rollup_orders(conn, condition, params=(), sign=1):
+    """Добавить в дневные агрегаты заказы, подходящие под условие (sign=-1 - вычесть)"""
+    conn.execute(f'''
+        INSERT INTO sales_daily (day, product_name, status, orders, quantity, revenue_kopecks)
+        SELECT date({Order.EXPRESSIONS['created_ts']}, 'unixepoch'), product_name, status,
+               ? * COUNT(*), ? * SUM(quantity), ? * SUM({Order.EXPRESSIONS['total_kopecks']})
+        FROM orders
+        WHERE {condition}
+        GROUP BY 1, 2, 3
+        ON CONFLICT (day, product_name, status) DO UPDATE SET
+            orders = orders + excluded.orders,
+            quantity = quantity + excluded.quantity,
+            revenue_kopecks = revenue_kopecks + excluded.revenue_kopecks
+    ''', (sign, sign, sign, *params))
 
-    def log_request(self, user_id, request_text, response_text, command_used):
-        """Логирование запроса пользователя"""
-        try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO user_requests 
-                    (user_id, request_text, response_text, command_used)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_id, request_text, response_text, command_used))
-                conn.commit()
-        except Exception as e:
-            logger.error(f"Ошибка при логировании запроса: {e}")
 
-    def add_order(self, user_id, customer_name, product_name, quantity, total_price, notes=""):
-        """Добавление нового заказа"""
-        try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO orders
-                    (user_id, customer_name, product_name, quantity, total_price, notes)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (user_id, customer_name, product_name, quantity, total_price, notes))
-                conn.commit()
-                logger.info(f"Добавлен заказ для {customer_name}")
-                return cursor.lastrowid
-        except Exception as e:
-            logger.error(f"Ошибка при добавлении заказа: {e}")
-            return None
+def rollup_order(conn, order_id, sign=1):
+    """Добавить заказ в дневные агрегаты (sign=-1 - вычесть)"""
+    rollup_orders(conn, 'id = ?', (order_id,), sign)
+
+
+# Статусы заказа и допустимые переходы между ними
+ORDER_STATUSES = ('новый', 'в работе', 'выполнен', 'отменен')
+ORDER_TRANSITIONS = {
+    'новый': ('в работе', 'выполнен', 'отменен'),
+    'в работе': ('новый', 'выполнен', 'отменен'),
+    'выполнен': (),
+    'отменен': (),
+}
+
+# Числовой ранг приоритета задачи: меньше - важнее
+TASK_PRIORITY_RANKS = {
+    'высокий': 0,
+    'средний': 1,
+    'низкий': 2,
+}
+DEFAULT_TASK_PRIORITY_RANK = 1
+
+# Статусы незавершенных задач
+OPEN_TASK_STATUSES = ('к выполнению', 'в работе')
+
+
+def task_priority_rank(priority):
+    return TASK_PRIORITY_RANKS.get((priority or '').lower(), DEFAULT_TASK_PRIORITY_RANK)
+
+
+def task_order(task):
+    """Ключ сортировки задач как в ORDER BY priority_rank, due_date (NULL первыми)"""
+    return (task.priority_rank is not None, task.priority_rank or 0,
+            task.due_date is not None, task.due_date or '')
+
+class DatabaseReader:
+    """Запросы только на чтение.
+
+    Общие для рабочей БД и для снимка аналитики: наследник определяет,
+    откуда get_connection() берет соединение.
+    """
+
+    def get_connection(self):
+        raise NotImplementedError
 
     def get_orders(self, user_id=None, status=None, limit=10):
         """Получение списка заказов"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                query = """
-                    SELECT id, customer_name, product_name, quantity, total_price, status, created_at, notes
+                cursor.row_factory = Order.row_factory
+                query = f"""
+                    SELECT {Order.columns()}
                     FROM orders
                 """
                 params = []
@@ -150,7 +140,7 @@ class DatabaseManager:
                     params.append(status)
                 if conditions:
                     query += " WHERE " + " AND ".join(conditions)
-                query += " ORDER BY created_at DESC LIMIT ?"
+                query += " ORDER BY orders.created_ts DESC LIMIT ?"
                 params.append(limit)
                 cursor.execute(query, params)
                 return cursor.fetchall()
@@ -158,6 +148,54 @@ class DatabaseManager:
             logger.error(f"Ошибка при получении заказов: {e}")
             return []
 
+    def _iter_rows(self, row_factory, query, params, batch_size):
+        """Строки запроса порциями fetchmany: в памяти только одна порция"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+
+    def iter_orders(self, user_id=None, batch_size=ITER_BATCH):
+        """Все заказы (или заказы пользователя) от старых к новым для выгрузки"""
+        query = f"SELECT {Order.columns()} FROM orders"
+        params = ()
+        if user_id:
+            query += " WHERE user_id = ?"
+            params = (user_id,)
+        return self._iter_rows(Order.row_factory, query + " ORDER BY id", params, batch_size)
+
+    def iter_requests(self, user_id, batch_size=ITER_BATCH):
+        """Вся история запросов пользователя от старых к новым для выгрузки"""
+        return self._iter_rows(
+            UserRequest.row_factory,
+            f"SELECT {UserRequest.columns()} FROM user_requests WHERE user_id = ? ORDER BY id",
+            (user_id,), batch_size
+        )
+
+    def get_order(self, order_id):
+        """Получение заказа по ID"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = Order.row_factory
+                cursor.execute(f'''
+                    SELECT {Order.columns()}
+                    FROM orders
+                    WHERE id = ?
+                ''', (order_id,))
+                return cursor.fetchone()
+        except Exception as e:
+            logger.error(f"Ошибка при получении заказа: {e}")
+            return None
+
     def get_order_stats(self):
         """Получение статистики по заказам"""
         try:
@@ -167,14 +205,14 @@ class DatabaseManager:
                 total_orders = cursor.fetchone()[0]
                 cursor.execute('SELECT COUNT(DISTINCT customer_name) FROM orders')
                 unique_customers = cursor.fetchone()[0]
-                cursor.execute('SELECT SUM(total_price) FROM orders')
-                total_revenue = cursor.fetchone()[0] or 0
+                cursor.execute(f"SELECT SUM({Order.EXPRESSIONS['total_kopecks']}) FROM orders")
+                total_kopecks = cursor.fetchone()[0] or 0
                 cursor.execute('SELECT status, COUNT(*) FROM orders GROUP BY status')
                 status_stats = cursor.fetchall()
                 return {
                     'total_orders': total_orders,
                     'unique_customers': unique_customers,
-                    'total_revenue': total_revenue,
+                    'total_kopecks': total_kopecks,
                     'status_stats': status_stats
                 }
         except Exception as e:
@@ -201,16 +239,37 @@ class DatabaseManager:
             logger.error(f"Ошибка при получении статистики бота: {e}")
             return {}
 
+    def get_user(self, user_id):
+        """Получение пользователя по ID"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = User.row_factory
+                cursor.execute(f'''
+                    SELECT {User.columns()}
+                    FROM users
+                    WHERE user_id = ?
+                ''', (user_id,))
+                return cursor.fetchone()
+        except Exception as e:
+            logger.error(f"Ошибка при получении пользователя: {e}")
+            return None
+
     def get_user_requests(self, user_id, limit=10):
-        """Получение истории запросов пользователя"""
+        """Получение истории запросов пользователя (новые первыми).
+
+        Порядок по id, а не по created_at: его отдает индекс по user_id без
+        сортировки, а при одинаковом времени порядок остается стабильным.
+        """
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT request_text, command_used, created_at
+                cursor.row_factory = UserRequest.row_factory
+                cursor.execute(f'''
+                    SELECT {UserRequest.columns()}
                     FROM user_requests
                     WHERE user_id = ?
-                    ORDER BY created_at DESC
+                    ORDER BY id DESC
                     LIMIT ?
                 ''', (user_id, limit))
                 return cursor.fetchall()
@@ -218,54 +277,74 @@ class DatabaseManager:
             logger.error(f"Ошибка при получении истории запросов: {e}")
             return []
 
-    def add_task(self, title, description, assigned_to, priority, due_date):
-        """Добавление задачи для команды"""
-        try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO tasks
-                    (title, description, assigned_to, priority, due_date)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (title, description, assigned_to, priority, due_date))
-                conn.commit()
-                logger.info(f"Добавлена задача: {title}")
-                return cursor.lastrowid
-        except Exception as e:
-            logger.error(f"Ошибка при добавлении задачи: {e}")
-            return None
+    def _select_tasks(self, parts, limit, error_message):
+        """Выборка задач в порядке приоритета и срока.
 
-    def get_tasks(self, status=None):
-        """Получение списка задач"""
+        parts - список условий (where, params). Каждое выполняется отдельным
+        запросом, который индекс по (..., status, priority_rank, due_date)
+        отдает уже отсортированным, и результаты сливаются: один запрос с
+        status IN (...) SQLite досортировывал бы во временном B-дереве.
+        """
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                if status:
-                    cursor.execute('''
-                        SELECT * FROM tasks
-                        WHERE status = ?
-                        ORDER BY due_date ASC, priority DESC
-                    ''', (status,))
-                else:
-                    cursor.execute('''
-                        SELECT * FROM tasks
-                        ORDER BY due_date ASC, priority DESC
-                    ''')
-                return cursor.fetchall()
+                results = []
+                for where, params in parts:
+                    cursor = conn.cursor()
+                    cursor.row_factory = Task.row_factory
+                    cursor.execute(f'''
+                        SELECT {Task.columns()} FROM tasks
+                        WHERE {where}
+                        ORDER BY priority_rank ASC, due_date ASC
+                        LIMIT ?
+                    ''', (*params, limit))
+                    results.append(cursor.fetchall())
+                return list(islice(heapq.merge(*results, key=task_order), limit))
         except Exception as e:
-            logger.error(f"Ошибка при получении задач: {e}")
+            logger.error(f"{error_message}: {e}")
             return []
 
+    def get_tasks(self, status=None, limit=50):
+        """Получение списка задач: по статусу или все незавершенные"""
+        statuses = (status,) if status else OPEN_TASK_STATUSES
+        return self._select_tasks([('status = ?', (status,)) for status in statuses], limit,
+                                  "Ошибка при получении задач")
+
+    def get_assigned_tasks(self, assignees, limit=50):
+        """Незавершенные задачи, назначенные на любое из имен assignees"""
+        return self._select_tasks(
+            [('assigned_to = ? AND status = ?', (assignee, status))
+             for assignee in dict.fromkeys(assignees) for status in OPEN_TASK_STATUSES],
+            limit, "Ошибка при получении задач исполнителя"
+        )
+
+    def get_overdue_tasks(self, today, limit=50):
+        """Незавершенные задачи со сроком раньше today (дата YYYY-MM-DD)"""
+        # Индекс (status, due_date) отдает только задачи нужного интервала,
+        # сортируются уже они
+        return self._select_tasks(
+            [('status = ? AND due_date < ?', (status, today)) for status in OPEN_TASK_STATUSES],
+            limit, "Ошибка при получении просроченных задач"
+        )
+
+    def get_tasks_due_between(self, start_day, end_day, limit=50):
+        """Незавершенные задачи со сроком в интервале дат включительно"""
+        return self._select_tasks(
+            [('status = ? AND due_date BETWEEN ? AND ?', (status, start_day, end_day))
+             for status in OPEN_TASK_STATUSES],
+            limit, "Ошибка при получении задач на неделю"
+        )
+
     def find_orders_by_customer(self, customer_name):
         """Поиск заказов по имени клиента"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT id, customer_name, product_name, quantity, total_price, status, created_at, notes
+                cursor.row_factory = Order.row_factory
+                cursor.execute(f'''
+                    SELECT {Order.columns()}
                     FROM orders
                     WHERE customer_name LIKE ?
-                    ORDER BY created_at DESC
+                    ORDER BY orders.created_ts DESC
                 ''', (f'%{customer_name}%',))
                 return cursor.fetchall()
         except Exception as e:
@@ -277,13 +356,723 @@ class DatabaseManager:
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT id, customer_name, product_name, quantity, total_price, status, created_at, notes
+                cursor.row_factory = Order.row_factory
+                cursor.execute(f'''
+                    SELECT {Order.columns()}
                     FROM orders
-                    WHERE created_at >= ?
-                    ORDER BY created_at DESC
-                ''', (since_date.strftime('%Y-%m-%d %H:%M:%S'),))
+                    WHERE orders.created_ts >= ?
+                    ORDER BY orders.created_ts DESC
+                ''', (int(since_date.timestamp()),))
                 return cursor.fetchall()
         except Exception as e:
             logger.error(f"Ошибка при получении заказов по дате: {e}")
             return []
+
+    def get_sales(self, start_day, end_day, period='day', breakdown=None):
+        """Продажи по периодам из дневных агрегатов.
+
+        Возвращает строки (период, разрез, заказы, количество, выручка в копейках);
+        start_day и end_day - даты в формате YYYY-MM-DD включительно.
+        """
+        bucket = SALES_PERIODS[period]
+        key = SALES_BREAKDOWNS[breakdown]
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT {bucket} AS bucket, {key} AS breakdown,
+                           SUM(orders), SUM(quantity), SUM(revenue_kopecks)
+                    FROM sales_daily
+                    WHERE day BETWEEN ? AND ?
+                    GROUP BY bucket, breakdown
+                    ORDER BY bucket, breakdown
+                ''', (start_day, end_day))
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка при получении статистики продаж: {e}")
+            return []
+
+class DatabaseManager(DatabaseReader):
+    def __init__(self, db_path='gameboard_bot.db', journal=None, jobs=True):
+        self.db_path = db_path
+        # Журнал записей (journal.py) для периодов, когда БД не принимает записи
+        self.journal = journal
+        self.degraded = False
+        logger.info(f"🔄 Инициализация БД по пути: {os.path.abspath(self.db_path)}")
+        self.order_keys = TTLCache(maxsize=ORDER_KEYS_CACHE_SIZE, ttl=ORDER_KEYS_TTL)
+        self.request_history = HistoryCache(size=REQUEST_HISTORY_SIZE, max_users=REQUEST_HISTORY_USERS)
+        self._reset_texts()
+        self.init_db()
+        self._jobs_started = jobs
+        if jobs:
+            # Полный VACUUM идет до старта потока записи, пока БД никто не пишет
+            convert_auto_vacuum(self.db_path)
+        self.writer = DatabaseWriter(self.db_path)
+        self.writer.start()
+        if jobs:
+            self._start_migration()
+
+    def start_jobs(self):
+        """Перевод auto_vacuum и миграция старых строк, отложенные при jobs=False.
+
+        Резервная реплика (leader.py) открывает БД без них и вызывает этот
+        метод, став лидером, до начала polling: поток записи в этот момент
+        простаивает, поэтому полный VACUUM не задерживает записи.
+        """
+        if self._jobs_started:
+            return
+        self._jobs_started = True
+        convert_auto_vacuum(self.db_path)
+        self._start_migration()
+
+    def get_connection(self):
+        """Создание соединения с базой данных (для чтения)"""
+        logger.debug("📂 Подключение к БД: %s", self.db_path)
+        return sqlite3.connect(self.db_path)
+
+    def close(self):
+        """Дописать очередь записи и остановить поток записи"""
+        self.writer.stop()
+
+    def _write(self, func, *args, timeout=WRITE_TIMEOUT):
+        """Отправить команду в поток записи и дождаться результата"""
+        return self.writer.submit(func, *args).result(timeout=timeout)
+
+    # ---------- Здоровье и журнал ----------
+
+    def _restart_writer(self):
+        """Новый поток записи с новым соединением; старый дописывает очередь и завершается"""
+        if self.writer.is_alive():
+            self.writer.stop(timeout=0)
+        self.writer = DatabaseWriter(self.db_path)
+        self.writer.start()
+        self._reset_texts()
+
+    def check_health(self):
+        """Пробная запись в БД; после восстановления воспроизводит журнал.
+
+        Возвращает True, если БД принимает записи. Вызывается монитором
+        здоровья (health.py) в фоне.
+        """
+        if not self.writer.is_alive():
+            logger.warning("🔄 Поток записи в БД не работает, перезапуск")
+            self._restart_writer()
+        try:
+            self._write(lambda conn: conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone(),
+                        timeout=HEALTH_TIMEOUT)
+        except Exception as e:
+            if not self.degraded:
+                logger.error(f"❌ БД не принимает записи: {e}")
+            self.degraded = True
+            self._restart_writer()
+            return False
+
+        if self.journal is not None and self.journal.pending:
+            try:
+                self.journal.replay(self._replay_batch)
+            except Exception as e:
+                logger.error(f"❌ Ошибка воспроизведения журнала: {e}")
+                return False
+        if self.degraded:
+            self.degraded = False
+            logger.info("✅ БД снова принимает записи")
+        return True
+
+    def _replay_batch(self, entries):
+        """Применить пакет записей журнала одной транзакцией"""
+        requests = []
+
+        def apply(conn):
+            del requests[:]
+            for entry in entries:
+                conn.execute('SAVEPOINT journal_entry')
+                try:
+                    result = getattr(self, f"_apply_{entry['op']}")(conn, entry['ts'], *entry['args'])
+                    if entry['op'] == 'log_request':
+                        requests.append(result)
+                except DB_DOWN_ERRORS:
+                    raise
+                except Exception as e:
+                    # Запись, которую нельзя применить, не должна блокировать остальные
+                    conn.execute('ROLLBACK TO journal_entry')
+                    self._reset_texts()
+                    logger.error(f"❌ Запись журнала {entry.get('op')} пропущена: {e}")
+                conn.execute('RELEASE journal_entry')
+
+        self._write(apply, timeout=REPLAY_TIMEOUT)
+        for request in requests:
+            self._remember_request(request)
+
+    def init_db(self):
+        """Инициализация базы данных и создание таблиц"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+
+                # Действует только для новой БД; существующую переводит
+                # в этот режим convert_auto_vacuum при запуске
+                cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+                # WAL позволяет читать параллельно с единственным потоком записи
+                cursor.execute('PRAGMA journal_mode=WAL')
+
+                # Таблица пользователей
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS users (
+                        user_id INTEGER PRIMARY KEY,
+                        username TEXT,
+                        first_name TEXT,
+                        last_name TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+
+                # Таблица истории запросов
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS user_requests (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_id INTEGER,
+                        request_text TEXT,
+                        response_text TEXT,
+                        command_used TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (user_id) REFERENCES users (user_id)
+                    )
+                ''')
+                # Индекс (user_id, rowid) отдает последние запросы пользователя без сортировки
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_user_requests_user
+                    ON user_requests (user_id)
+                ''')
+
+                # Тексты ответов и команды повторяются, поэтому в user_requests
+                # хранятся их ID из общей таблицы; старые строки переводит
+                # фоновая миграция, а до тех пор текст читается из прежних колонок
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS request_texts (
+                        id INTEGER PRIMARY KEY,
+                        text TEXT NOT NULL UNIQUE
+                    )
+                ''')
+                self._ensure_column(cursor, 'user_requests', 'response_id', 'INTEGER')
+                self._ensure_column(cursor, 'user_requests', 'command_id', 'INTEGER')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_user_requests_unmigrated
+                    ON user_requests (id) WHERE response_text IS NOT NULL OR command_used IS NOT NULL
+                ''')
+
+                # Таблица заказов
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS orders (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_id INTEGER,
+                        customer_name TEXT NOT NULL,
+                        product_name TEXT NOT NULL,
+                        quantity INTEGER DEFAULT 1,
+                        total_price DECIMAL(10, 2),
+                        status TEXT DEFAULT 'новый',
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        notes TEXT,
+                        idempotency_key TEXT,
+                        total_kopecks INTEGER,
+                        created_ts INTEGER,
+                        updated_ts INTEGER,
+                        FOREIGN KEY (user_id) REFERENCES users (user_id)
+                    )
+                ''')
+
+                # Ключ идемпотентности защищает от повторной вставки того же заказа
+                self._ensure_column(cursor, 'orders', 'idempotency_key', 'TEXT')
+                cursor.execute('''
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_idempotency_key
+                    ON orders (idempotency_key)
+                ''')
+
+                # Сумма в копейках и время в секундах epoch вместо DECIMAL и
+                # текстовых дат; старые строки переводит фоновая миграция
+                self._ensure_column(cursor, 'orders', 'total_kopecks', 'INTEGER')
+                self._ensure_column(cursor, 'orders', 'created_ts', 'INTEGER')
+                self._ensure_column(cursor, 'orders', 'updated_ts', 'INTEGER')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_orders_created_ts
+                    ON orders (created_ts)
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_orders_status_created_ts
+                    ON orders (status, created_ts)
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_orders_unmigrated
+                    ON orders (id) WHERE created_ts IS NULL
+                ''')
+
+                # Таблица задач команды
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS tasks (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        title TEXT NOT NULL,
+                        description TEXT,
+                        assigned_to TEXT,
+                        priority TEXT DEFAULT 'средний',
+                        status TEXT DEFAULT 'к выполнению',
+                        due_date DATE,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        priority_rank INTEGER
+                    )
+                ''')
+
+                # Числовой ранг приоритета: текстовый приоритет сортируется по алфавиту
+                self._ensure_column(cursor, 'tasks', 'priority_rank', 'INTEGER')
+                # Ранг считается в Python: lower() в SQLite не меняет регистр
+                # кириллицы, и "Высокий" получил бы ранг по умолчанию. Заодно
+                # исправляются ранги, посчитанные так прежней версией
+                cursor.execute('SELECT id, priority, priority_rank FROM tasks')
+                cursor.executemany('UPDATE tasks SET priority_rank = ? WHERE id = ?', [
+                    (task_priority_rank(priority), task_id)
+                    for task_id, priority, rank in cursor.fetchall()
+                    if rank != task_priority_rank(priority)
+                ])
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_tasks_status_priority_due
+                    ON tasks (status, priority_rank, due_date)
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_tasks_assignee_status_priority_due
+                    ON tasks (assigned_to, status, priority_rank, due_date)
+                ''')
+                # Просроченные и задачи на неделю: поиск по интервалу сроков
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_tasks_status_due
+                    ON tasks (status, due_date)
+                ''')
+
+                # Дневные агрегаты продаж, обновляются при записи заказа.
+                # Прежняя версия хранила выручку в REAL - такие агрегаты перестраиваем
+                columns = self._table_columns(cursor, 'sales_daily')
+                if columns and 'revenue_kopecks' not in columns:
+                    cursor.execute('DROP TABLE sales_daily')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS sales_daily (
+                        day TEXT NOT NULL,
+                        product_name TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        orders INTEGER NOT NULL DEFAULT 0,
+                        quantity INTEGER NOT NULL DEFAULT 0,
+                        revenue_kopecks INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (day, product_name, status)
+                    ) WITHOUT ROWID
+                ''')
+                self._backfill_sales(cursor)
+
+                # Снимок незавершенных диалогов /add_order
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS order_sessions (
+                        user_id INTEGER PRIMARY KEY,
+                        payload TEXT NOT NULL
+                    )
+                ''')
+
+                conn.commit()
+                logger.info("✅ База данных успешно инициализирована")
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка при инициализации БД: {e}")
+            raise
+
+    @staticmethod
+    def _backfill_sales(cursor):
+        """Заполнить агрегаты по уже существующим заказам (один раз)"""
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM sales_daily)')
+        if cursor.fetchone()[0]:
+            return
+        cursor.execute(f'''
+            INSERT INTO sales_daily (day, product_name, status, orders, quantity, revenue_kopecks)
+            SELECT date({Order.EXPRESSIONS['created_ts']}, 'unixepoch'), product_name, status,
+                   COUNT(*), SUM(quantity), SUM({Order.EXPRESSIONS['total_kopecks']})
+            FROM orders
+            GROUP BY 1, 2, 3
+        ''')
+        if cursor.rowcount:
+            logger.info(f"🔧 Агрегаты продаж построены: {cursor.rowcount} строк")
+
+    @staticmethod
+    def _table_columns(cursor, table):
+        """Имена колонок таблицы (пустой список, если таблицы нет)"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        return [row[1] for row in cursor.fetchall()]
+
+    @classmethod
+    def _ensure_column(cls, cursor, table, column, declaration):
+        """Добавить колонку в существующую таблицу, если ее еще нет"""
+        if column not in cls._table_columns(cursor, table):
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+            logger.info(f"🔧 Добавлена колонка {table}.{column}")
+
+    def _reset_texts(self):
+        """Сбросить кэш ID текстов: после отката в нем могут быть ID отмененных вставок"""
+        self.text_ids = TTLCache(maxsize=TEXT_CACHE_SIZE, ttl=TEXT_CACHE_TTL)
+        self._text_rollbacks = 0
+
+    def _text_id(self, conn, text):
+        """ID текста в request_texts; новый текст добавляется. Вызывается в потоке записи"""
+        if text is None:
+            return None
+        if self.writer.rollbacks != self._text_rollbacks:
+            # Откат мог отменить вставку текстов, чьи ID уже в кэше
+            self._reset_texts()
+            self._text_rollbacks = self.writer.rollbacks
+        text_id = self.text_ids.get(text)
+        if text_id is None:
+            conn.execute('INSERT OR IGNORE INTO request_texts (text) VALUES (?)', (text,))
+            text_id = conn.execute('SELECT id FROM request_texts WHERE text = ?', (text,)).fetchone()[0]
+            self.text_ids.set(text, text_id)
+        return text_id
+
+    def _start_migration(self):
+        """Перевести старые заказы на копейки и epoch, а историю запросов -
+        на ID текстов, порциями в фоне"""
+        def migrate_batch(conn):
+            return conn.execute('''
+                UPDATE orders SET
+                    total_kopecks = COALESCE(total_kopecks, CAST(ROUND(COALESCE(total_price, 0) * 100) AS INTEGER)),
+                    created_ts = COALESCE(CAST(strftime('%s', created_at) AS INTEGER), 0),
+                    updated_ts = COALESCE(updated_ts, CAST(strftime('%s', COALESCE(updated_at, created_at)) AS INTEGER))
+                WHERE id IN (
+                    SELECT id FROM orders WHERE created_ts IS NULL ORDER BY id DESC LIMIT ?
+                )
+            ''', (MIGRATION_BATCH,)).rowcount
+
+        def migrate_requests(conn):
+            batch = f'''
+                SELECT id FROM user_requests
+                WHERE response_text IS NOT NULL OR command_used IS NOT NULL
+                ORDER BY id LIMIT {MIGRATION_BATCH}
+            '''
+            conn.execute(f'''
+                INSERT OR IGNORE INTO request_texts (text)
+                SELECT response_text FROM user_requests WHERE id IN ({batch}) AND response_text IS NOT NULL
+                UNION
+                SELECT command_used FROM user_requests WHERE id IN ({batch}) AND command_used IS NOT NULL
+            ''')
+            return conn.execute(f'''
+                UPDATE user_requests SET
+                    response_id = COALESCE(response_id,
+                        (SELECT id FROM request_texts WHERE text = user_requests.response_text)),
+                    command_id = COALESCE(command_id,
+                        (SELECT id FROM request_texts WHERE text = user_requests.command_used)),
+                    response_text = NULL,
+                    command_used = NULL
+                WHERE id IN ({batch})
+            ''').rowcount
+
+        def migrate(step, name):
+            migrated = 0
+            try:
+                while True:
+                    count = self._write(step)
+                    if not count:
+                        break
+                    migrated += count
+                    time.sleep(MIGRATION_PAUSE)
+            except Exception as e:
+                logger.error(f"❌ Ошибка миграции {name}: {e}")
+            return migrated
+
+        def run():
+            migrated = migrate(migrate_batch, 'заказов')
+            if migrated:
+                logger.info(f"🔧 Заказов переведено на копейки и epoch: {migrated}")
+            migrated = migrate(migrate_requests, 'истории запросов')
+            if migrated:
+                logger.info(f"🔧 Запросов переведено на общую таблицу текстов: {migrated}")
+
+        threading.Thread(target=run, name='orders-migration', daemon=True).start()
+
+    # ---------- Записи с журналом ----------
+    #
+    # Операции, которые при недоступной БД уходят в журнал (journal.py), а
+    # потом воспроизводятся по порядку: _apply_<op>(conn, ts, *args), где ts -
+    # время исходного вызова.
+
+    def _apply_add_user(self, conn, ts, user_id, username, first_name, last_name):
+        conn.execute('''
+            INSERT OR REPLACE INTO users 
+            (user_id, username, first_name, last_name, last_activity)
+            VALUES (?, ?, ?, ?, datetime(?, 'unixepoch'))
+        ''', (user_id, username, first_name, last_name, int(ts)))
+        logger.debug("Пользователь %s добавлен/обновлен", user_id)
+
+    def _apply_log_request(self, conn, ts, user_id, request_text, response_text, command_used):
+        created_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts))
+        cursor = conn.execute('''
+            INSERT INTO user_requests 
+            (user_id, request_text, response_id, command_id, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (user_id, request_text, self._text_id(conn, response_text),
+              self._text_id(conn, command_used), created_at))
+        # В буфер запрос попадает только после COMMIT (_remember_request):
+        # при откате транзакции он не должен появиться в /my_requests
+        return UserRequest(
+            cursor.lastrowid, user_id, request_text, response_text, command_used, created_at,
+        )
+
+    def _remember_request(self, request):
+        """Дописать закоммиченный запрос в буфер последних запросов"""
+        self.request_history.append(request.user_id, request)
+
+    def _apply_add_order(self, conn, ts, user_id, customer_name, product_name, quantity,
+                         total_kopecks, notes, idempotency_key):
+        cursor = conn.execute('''
+            INSERT INTO orders
+            (user_id, customer_name, product_name, quantity, total_kopecks, notes,
+             idempotency_key, created_ts, updated_ts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (idempotency_key) DO NOTHING
+        ''', (user_id, customer_name, product_name, quantity, int(total_kopecks), notes,
+              idempotency_key, int(ts), int(ts)))
+        if cursor.rowcount:
+            rollup_order(conn, cursor.lastrowid)
+            return cursor.lastrowid
+        return conn.execute(
+            'SELECT id FROM orders WHERE idempotency_key = ?', (idempotency_key,)
+        ).fetchone()[0]
+
+    def _to_journal(self, error, op, *args):
+        """Сохранить запись в журнал, если ошибка означает недоступность БД"""
+        if self.journal is None or not isinstance(error, DB_DOWN_ERRORS):
+            return False
+        if not self.degraded:
+            logger.error(f"❌ БД недоступна, записи идут в журнал: {error}")
+        self.degraded = True
+        self.journal.append(op, *args)
+        return True
+
+    def _journal_first(self, op, *args):
+        """Записать в журнал, если БД недоступна или журнал еще не воспроизведен:
+        новая запись не должна обогнать накопленные"""
+        if self.journal is None:
+            return False
+        if self.degraded:
+            self.journal.append(op, *args)
+            return True
+        return self.journal.try_append(op, *args)
+
+    def _journaled_async(self, op, *args, error_message, on_commit=None):
+        """Отправить запись в поток записи, не дожидаясь коммита (или в журнал).
+
+        on_commit(результат) вызывается в потоке записи после COMMIT, в
+        порядке команд.
+        """
+        if self._journal_first(op, *args):
+            return None
+
+        def done(future):
+            error = future.exception()
+            if error is None:
+                if on_commit is not None:
+                    on_commit(future.result())
+            elif not self._to_journal(error, op, *args):
+                logger.error(f"{error_message}: {error}")
+
+        future = self.writer.submit(getattr(self, f'_apply_{op}'), time.time(), *args)
+        future.add_done_callback(done)
+        return future
+
+    def add_user(self, user_id, username, first_name, last_name):
+        """Добавление/обновление пользователя"""
+        try:
+            return self._journaled_async('add_user', user_id, username, first_name, last_name,
+                                         error_message="Ошибка при добавлении пользователя")
+        except Exception as e:
+            logger.error(f"Ошибка при добавлении пользователя: {e}")
+
+    def log_request(self, user_id, request_text, response_text, command_used):
+        """Логирование запроса пользователя"""
+        try:
+            return self._journaled_async('log_request', user_id, request_text, response_text,
+                                         command_used, error_message="Ошибка при логировании запроса",
+                                         on_commit=self._remember_request)
+        except Exception as e:
+            logger.error(f"Ошибка при логировании запроса: {e}")
+
+    def get_recent_requests(self, user_id):
+        """Последние запросы пользователя из буфера в памяти.
+
+        Холодный буфер прогревается одним запросом к БД, выполненным в потоке
+        записи: так он видит все уже поставленные в очередь записи лога и не
+        пропускает и не дублирует их.
+        """
+        requests = self.request_history.get(user_id)
+        if requests is not None:
+            return requests
+
+        def warm(conn):
+            cursor = conn.cursor()
+            cursor.row_factory = UserRequest.row_factory
+            cursor.execute(f'''
+                SELECT {UserRequest.columns()}
+                FROM user_requests
+                WHERE user_id = ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (user_id, self.request_history.size))
+            requests = cursor.fetchall()
+            self.request_history.put(user_id, requests)
+            return requests
+
+        try:
+            return self._write(warm)
+        except Exception as e:
+            logger.error(f"Ошибка при получении истории запросов: {e}")
+            return []
+
+    def add_order(self, user_id, customer_name, product_name, quantity, total_kopecks, notes="",
+                  idempotency_key=None):
+        """Добавление нового заказа (сумма в копейках).
+
+        При повторе с тем же idempotency_key возвращается ID уже созданного
+        заказа: сначала из кэша в памяти, затем по уникальному индексу.
+        Если БД недоступна, заказ записывается в журнал и возвращается
+        ORDER_PENDING: в БД он попадет при воспроизведении журнала.
+        """
+        if idempotency_key is not None:
+            order_id = self.order_keys.get(idempotency_key)
+            if order_id is not None:
+                logger.info(f"Повтор заказа {idempotency_key}, ID: {order_id}")
+                return order_id
+
+        args = (user_id, customer_name, product_name, quantity, int(total_kopecks), notes,
+                order_key(idempotency_key) if self.journal is not None else idempotency_key)
+        try:
+            if self._journal_first('add_order', *args):
+                logger.info(f"Заказ для {customer_name} записан в журнал")
+                return ORDER_PENDING
+            order_id = self._write(self._apply_add_order, time.time(), *args)
+            if idempotency_key is not None:
+                self.order_keys.set(idempotency_key, order_id)
+            logger.info(f"Добавлен заказ для {customer_name}")
+            return order_id
+        except Exception as e:
+            if self._to_journal(e, 'add_order', *args):
+                logger.info(f"Заказ для {customer_name} записан в журнал")
+                return ORDER_PENDING
+            logger.error(f"Ошибка при добавлении заказа: {e}")
+            return None
+
+    def update_order_status(self, status, order_ids=None, id_range=None, current_status=None,
+                            older_than_days=None, user_id=None):
+        """Перевести заказы в новый статус одной транзакцией.
+
+        Заказы выбираются по списку order_ids, диапазону id_range=(от, до),
+        текущему статусу, возрасту и автору заказа user_id; условия
+        объединяются через AND. Меняются
+        только заказы, из статуса которых переход в status допустим
+        (ORDER_TRANSITIONS). Сколько бы заказов ни подошло, работа идет
+        фиксированным числом запросов: выборка id во временную таблицу, вычитание
+        из дневных агрегатов, один UPDATE и добавление в агрегаты с новым статусом.
+
+        Возвращает {'updated': число, 'skipped': {статус: число}} или None при ошибке.
+        """
+        if status not in ORDER_TRANSITIONS:
+            raise ValueError(f"Неизвестный статус заказа: {status}")
+        sources = [source for source, targets in ORDER_TRANSITIONS.items() if status in targets]
+
+        conditions = []
+        params = []
+        if order_ids is not None:
+            conditions.append(f"id IN ({', '.join('?' * len(order_ids))})")
+            params.extend(order_ids)
+        if id_range is not None:
+            conditions.append("id BETWEEN ? AND ?")
+            params.extend(id_range)
+        if current_status is not None:
+            conditions.append("status = ?")
+            params.append(current_status)
+        if older_than_days is not None:
+            conditions.append(f"{Order.EXPRESSIONS['created_ts']} < ?")
+            params.append(int(time.time() - older_than_days * 24 * 60 * 60))
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        condition = " AND ".join(conditions) or "1"
+
+        def update(conn):
+            now = int(time.time())
+            skipped = dict(conn.execute(f'''
+                SELECT status, COUNT(*) FROM orders
+                WHERE {condition} AND status NOT IN ({', '.join('?' * len(sources))})
+                GROUP BY status
+            ''', (*params, *sources)).fetchall())
+
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS status_batch (id INTEGER PRIMARY KEY)')
+            conn.execute('DELETE FROM status_batch')
+            conn.execute(f'''
+                INSERT INTO status_batch (id)
+                SELECT id FROM orders
+                WHERE {condition} AND status IN ({', '.join('?' * len(sources))})
+            ''', (*params, *sources))
+            batch = 'id IN (SELECT id FROM status_batch)'
+
+            rollup_orders(conn, batch, sign=-1)
+            updated = conn.execute(f'''
+                UPDATE orders SET
+                    status = ?,
+                    updated_ts = ?,
+                    updated_at = datetime(?, 'unixepoch')
+                WHERE {batch}
+            ''', (status, now, now)).rowcount
+            rollup_orders(conn, batch)
+            conn.execute('DELETE FROM sales_daily WHERE orders = 0')
+            conn.execute('DELETE FROM status_batch')
+            return {'updated': updated, 'skipped': skipped}
+
+        try:
+            result = self._write(update)
+            logger.info(f"Статус {result['updated']} заказов изменен на '{status}'")
+            return result
+        except Exception as e:
+            logger.error(f"Ошибка при изменении статуса заказов: {e}")
+            return None
+
+    def add_task(self, title, description, assigned_to, priority, due_date):
+        """Добавление задачи для команды"""
+        def insert(conn):
+            cursor = conn.execute('''
+                INSERT INTO tasks
+                (title, description, assigned_to, priority, priority_rank, due_date)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (title, description, assigned_to, priority, task_priority_rank(priority), due_date))
+            return cursor.lastrowid
+
+        try:
+            task_id = self._write(insert)
+            logger.info(f"Добавлена задача: {title}")
+            return task_id
+        except Exception as e:
+            logger.error(f"Ошибка при добавлении задачи: {e}")
+            return None
+
+    def save_sessions(self, rows):
+        """Замена снимка диалогов: rows - список (user_id, payload)"""
+        def replace(conn):
+            conn.execute('DELETE FROM order_sessions')
+            conn.executemany(
+                'INSERT INTO order_sessions (user_id, payload) VALUES (?, ?)', rows
+            )
+
+        try:
+            self._write(replace)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении снимка диалогов: {e}")
+
+    def load_sessions(self):
+        """Загрузка снимка диалогов"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT user_id, payload FROM order_sessions')
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке снимка диалогов: {e}")
+            return []
@@ -0,0 +1,49 @@
+import logging
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Telegram повторяет доставку обновления в пределах минут, час - с запасом
+UPDATE_TTL = 60 * 60
+MAX_UPDATES = 10000
+
+
+class UpdateDeduplicator:
+    """Отбрасывает повторно доставленные обновления по update_id.
+
+    Ставится перед диспетчеризацией telebot, поэтому повтор стоит одной
+    проверки в ограниченном по размеру и времени кэше и не доходит до
+    обработчиков и записи в БД. Один кэш может обслуживать несколько ботов:
+    update_id уникален только в пределах бота, поэтому ключ включает tenant.
+    """
+
+    def __init__(self, maxsize=MAX_UPDATES, ttl=UPDATE_TTL):
+        self._seen = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.duplicates = 0
+
+    def filter(self, updates, tenant=None):
+        fresh = []
+        for update in updates:
+            key = update.update_id if tenant is None else (tenant, update.update_id)
+            if self._seen.add(key):
+                fresh.append(update)
+            else:
+                self.duplicates += 1
+                logger.info("Пропущено повторное обновление %s", update.update_id)
+        return fresh
+
+    def install(self, bot, tenant=None):
+        """Встроить фильтр в bot.process_new_updates"""
+        process_new_updates = bot.process_new_updates
+
+        def process_unique_updates(updates):
+            # telebot сдвигает offset внутри process_new_updates; если все
+            # обновления оказались повторами, сдвигаем его сами
+            if updates:
+                bot.last_update_id = max(bot.last_update_id, max(u.update_id for u in updates))
+            updates = self.filter(updates, tenant)
+            if updates:
+                process_new_updates(updates)
+
+        bot.process_new_updates = process_unique_updates
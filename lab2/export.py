@@ -0,0 +1,173 @@
+import io
+import re
+import csv
+import time
+import zipfile
+import threading
+from tempfile import SpooledTemporaryFile
+from xml.sax.saxutils import escape
+
+from cache import TTLCache
+
+# Форматы выгрузки
+EXPORT_FORMATS = ('csv', 'xlsx')
+# Выгрузка держится в памяти до SPOOL_SIZE байт, дальше уходит во временный файл
+SPOOL_SIZE = 1024 * 1024
+# Bot API принимает от бота документы не больше 50 МБ
+EXPORT_MAX_SIZE = 50 * 1024 * 1024
+# Пользователь может запускать выгрузку не чаще раза в EXPORT_COOLDOWN секунд,
+# а одновременно выполняется не больше EXPORT_CONCURRENCY выгрузок
+EXPORT_COOLDOWN = 60
+EXPORT_CONCURRENCY = 2
+EXPORT_USERS = 10000
+
+# Символы, с которых табличные редакторы начинают формулу
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+# Управляющие символы, недопустимые в XML
+XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+XLSX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="xl/workbook.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>'
+)
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+    '</Relationships>'
+)
+XLSX_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+XLSX_SHEET_END = '</sheetData></worksheet>'
+
+
+class ExportTooLarge(Exception):
+    """Выгрузка больше, чем Bot API принимает от бота"""
+
+
+def csv_value(value):
+    """Значение ячейки CSV; текст, похожий на формулу, не выполняется редактором"""
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = escape(XML_ILLEGAL.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def write_csv(file, columns, rows):
+    """CSV с BOM, чтобы Excel сразу открыл его в UTF-8"""
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow([csv_value(value) for value in row])
+        count += 1
+    text.flush()
+    text.detach()
+    return count
+
+
+def write_xlsx(file, columns, rows, sheet='Export'):
+    """Минимальная книга XLSX с одним листом.
+
+    Лист пишется в архив потоком построчно (ячейки с inline-строками, без
+    таблицы общих строк), поэтому openpyxl не нужен и память не растет с
+    числом строк.
+    """
+    count = 0
+    with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as book:
+        book.writestr('[Content_Types].xml', XLSX_CONTENT_TYPES)
+        book.writestr('_rels/.rels', XLSX_RELS)
+        book.writestr('xl/workbook.xml', XLSX_WORKBOOK.format(name=escape(sheet)))
+        book.writestr('xl/_rels/workbook.xml.rels', XLSX_WORKBOOK_RELS)
+        with book.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as xml:
+            xml.write(XLSX_SHEET_START.encode())
+            xml.write(('<row>' + ''.join(map(xlsx_cell, columns)) + '</row>').encode())
+            for row in rows:
+                xml.write(('<row>' + ''.join(map(xlsx_cell, row)) + '</row>').encode())
+                count += 1
+            xml.write(XLSX_SHEET_END.encode())
+    return count
+
+
+def export_rows(columns, rows, fmt, max_size=EXPORT_MAX_SIZE):
+    """Записать строки во временный файл: (файл с позицией в начале, число строк).
+
+    rows - итератор, который читает курсор порциями: в памяти одновременно
+    только порция строк и до SPOOL_SIZE байт файла.
+    """
+    file = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    try:
+        writer = write_xlsx if fmt == 'xlsx' else write_csv
+        count = writer(file, columns, rows)
+        if file.tell() > max_size:
+            raise ExportTooLarge(f"выгрузка {file.tell() // (1024 * 1024)} МБ больше "
+                                 f"{max_size // (1024 * 1024)} МБ")
+        file.seek(0)
+        return file, count
+    except Exception:
+        file.close()
+        raise
+
+
+class ExportLimiter:
+    """Ограничение выгрузок: одна на пользователя за cooldown секунд и не
+    больше concurrency одновременно на все приложение"""
+
+    def __init__(self, cooldown=EXPORT_COOLDOWN, concurrency=EXPORT_CONCURRENCY):
+        self.cooldown = cooldown
+        self.started = 0
+        self.refused = 0
+        self._recent = TTLCache(maxsize=EXPORT_USERS, ttl=cooldown)
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    def acquire(self, user_id):
+        """Занять слот выгрузки: 0, если можно начинать, иначе сколько секунд ждать"""
+        now = time.monotonic()
+        if self.cooldown and not self._recent.add(user_id, now):
+            self.refused += 1
+            return max(1, int(self.cooldown - (now - self._recent.get(user_id, now))))
+        if not self._slots.acquire(blocking=False):
+            # Слот не получен - попытка не засчитывается в лимит пользователя
+            self._recent.pop(user_id)
+            self.refused += 1
+            return self.cooldown or 1
+        self.started += 1
+        return 0
+
+    def release(self):
+        self._slots.release()
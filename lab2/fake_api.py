@@ -0,0 +1,422 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+logger = logging.getLogger(__name__)
+
+# Локальная заглушка Telegram Bot API для сквозных и нагрузочных тестов.
+# Бот подключается к ней через TELEGRAM_API_URL=http://127.0.0.1:8081
+FAKE_API_HOST = '127.0.0.1'
+FAKE_API_PORT = 8081
+FAKE_API_TOKEN = '123456:fake-token'
+# Long polling getUpdates ждет не дольше этого, даже если бот просит больше
+LONG_POLL_LIMIT = 30
+UPDATES_LIMIT = 100
+# Сколько ждать ответов после отправки последнего обновления в режиме load
+LOAD_WAIT = 30
+LOAD_USERS = 50
+
+# Обновления, из которых собирается поток в режиме load без файла сценария
+DEFAULT_SCRIPT = [
+    {'text': '/start'},
+    {'text': '/help'},
+    {'text': '/products'},
+    {'text': '/orders'},
+    {'text': '/stats'},
+    {'text': 'Сколько стоит мафия?'},
+    {'text': 'привет'},
+    {'inline': 'мафия'},
+]
+
+
+def percentile(values, share):
+    """Значение, ниже которого лежит доля share отсортированных значений"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class FakeTelegram:
+    """Состояние заглушки: очереди обновлений по токенам ботов и учет ответов.
+
+    Реализует getUpdates (с long polling и подтверждением через offset),
+    sendMessage, sendDocument, answerCallbackQuery, answerInlineQuery,
+    setWebhook/deleteWebhook и getMe - столько, сколько нужно telebot.
+    Каждый ответ задерживается на latency + случайное значение до jitter
+    секунд, а методы отправки с вероятностью error_rate возвращают 429 Too
+    Many Requests с retry_after, как настоящий API при превышении лимитов.
+
+    Время ответа бота считается от постановки обновления в очередь до
+    первого ответа на него: sendMessage с reply_parameters на это сообщение
+    или answer* с ID запроса.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, retry_after=1, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.requests = Counter()
+        self.throttled = 0
+        self.sent = []
+        self.latencies = []
+
+        self._random = random.Random(seed)
+        self._updates = {}
+        self._webhooks = {}
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._awaiting = {}
+        self._lock = threading.Condition()
+        self._methods = {
+            'sendMessage': self._send_message,
+            'sendDocument': self._send_document,
+            'answerCallbackQuery': self._answer_callback_query,
+            'answerInlineQuery': self._answer_inline_query,
+            'setWebhook': self._set_webhook,
+            'deleteWebhook': self._delete_webhook,
+            'getMe': self._get_me,
+        }
+
+    # ---------- Поток обновлений ----------
+
+    def push_update(self, token, update):
+        """Поставить обновление в очередь бота; update_id назначается здесь"""
+        with self._lock:
+            update['update_id'] = self._next_update_id
+            self._next_update_id += 1
+            self._updates.setdefault(token, []).append(update)
+            self._lock.notify_all()
+        return update['update_id']
+
+    def _user(self, user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}',
+                'username': f'user{user_id}', 'language_code': 'ru'}
+
+    def push_message(self, token, user_id, text):
+        """Текстовое сообщение в личный чат; команды получают entity bot_command"""
+        with self._lock:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+            self._awaiting[('message', user_id, message_id)] = time.perf_counter()
+        message = {'message_id': message_id, 'date': int(time.time()),
+                   'chat': {'id': user_id, 'type': 'private'},
+                   'from': self._user(user_id), 'text': text}
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0,
+                                    'length': len(text.split()[0])}]
+        return self.push_update(token, {'message': message})
+
+    def push_callback(self, token, user_id, data):
+        """Нажатие inline-кнопки"""
+        with self._lock:
+            query_id = f'cb{self._next_message_id}'
+            self._next_message_id += 1
+            self._awaiting[('callback', query_id)] = time.perf_counter()
+        return self.push_update(token, {'callback_query': {
+            'id': query_id, 'from': self._user(user_id), 'chat_instance': str(user_id), 'data': data
+        }})
+
+    def push_inline(self, token, user_id, query):
+        """Inline-запрос @бот ..."""
+        with self._lock:
+            query_id = f'iq{self._next_message_id}'
+            self._next_message_id += 1
+            self._awaiting[('inline', query_id)] = time.perf_counter()
+        return self.push_update(token, {'inline_query': {
+            'id': query_id, 'from': self._user(user_id), 'query': query, 'offset': ''
+        }})
+
+    def push(self, token, item, user_id):
+        """Шаг сценария: {"text": ...}, {"callback": ...} или {"inline": ...};
+        "user" в шаге задает отправителя вместо user_id"""
+        user_id = item.get('user', user_id)
+        if 'callback' in item:
+            return self.push_callback(token, user_id, item['callback'])
+        if 'inline' in item:
+            return self.push_inline(token, user_id, item['inline'])
+        return self.push_message(token, user_id, item['text'])
+
+    def play(self, token, script, count, rate=0.0, users=LOAD_USERS):
+        """Отправить count шагов сценария по кругу от users пользователей,
+        rate обновлений в секунду (0 - без пауз). Возвращает время отправки."""
+        started = time.perf_counter()
+        for i in range(count):
+            if rate:
+                delay = started + i / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            self.push(token, script[i % len(script)], 1000 + i % users)
+        return time.perf_counter() - started
+
+    def pending_replies(self):
+        with self._lock:
+            return len(self._awaiting)
+
+    def wait_replies(self, timeout=LOAD_WAIT):
+        """Дождаться ответов на все отправленные обновления"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._awaiting:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._lock.wait(remaining)
+        return True
+
+    # ---------- Методы API ----------
+
+    def handle(self, token, method, params):
+        """Выполнить метод API: (HTTP-статус, тело ответа)"""
+        with self._lock:
+            self.requests[method] += 1
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+        if method == 'getUpdates':
+            return self._get_updates(token, params)
+        if self.error_rate and method != 'getMe' and self._random.random() < self.error_rate:
+            with self._lock:
+                self.throttled += 1
+            return 429, {'ok': False, 'error_code': 429,
+                         'description': f'Too Many Requests: retry after {self.retry_after}',
+                         'parameters': {'retry_after': self.retry_after}}
+        handler = self._methods.get(method)
+        if handler is None:
+            return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found'}
+        return 200, {'ok': True, 'result': handler(token, params)}
+
+    def _get_updates(self, token, params):
+        if self._webhooks.get(token):
+            return 409, {'ok': False, 'error_code': 409,
+                         'description': "Conflict: can't use getUpdates method while webhook is active"}
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or UPDATES_LIMIT)
+        timeout = min(float(params.get('timeout') or 0), LONG_POLL_LIMIT)
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while True:
+                # offset подтверждает все обновления до него
+                queue = [update for update in self._updates.get(token, [])
+                         if update['update_id'] >= offset]
+                self._updates[token] = queue
+                remaining = deadline - time.monotonic()
+                if queue or remaining <= 0:
+                    return 200, {'ok': True, 'result': queue[:limit]}
+                self._lock.wait(remaining)
+
+    def _reply_to(self, params):
+        """ID сообщения, на которое отвечает sendMessage/sendDocument"""
+        if params.get('reply_parameters'):
+            return json.loads(params['reply_parameters']).get('message_id')
+        return params.get('reply_to_message_id')
+
+    def _answered(self, key):
+        with self._lock:
+            started = self._awaiting.pop(key, None)
+            if started is not None:
+                self.latencies.append(time.perf_counter() - started)
+                self._lock.notify_all()
+
+    def _send(self, token, params, content):
+        chat_id = int(params['chat_id'])
+        reply_to = self._reply_to(params)
+        if reply_to is not None:
+            self._answered(('message', chat_id, int(reply_to)))
+        with self._lock:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+            self.sent.append((chat_id, content))
+        return {'message_id': message_id, 'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': self._get_me(token, params), **content}
+
+    def _send_message(self, token, params):
+        return self._send(token, params, {'text': params.get('text', '')})
+
+    def _send_document(self, token, params):
+        return self._send(token, params, {'document': {
+            'file_id': f'doc{self._next_message_id}', 'file_unique_id': f'doc{self._next_message_id}',
+            'file_name': params.get('document_name', 'document')
+        }})
+
+    def _answer_callback_query(self, token, params):
+        self._answered(('callback', params.get('callback_query_id')))
+        return True
+
+    def _answer_inline_query(self, token, params):
+        self._answered(('inline', params.get('inline_query_id')))
+        return True
+
+    def _set_webhook(self, token, params):
+        self._webhooks[token] = params.get('url') or None
+        return True
+
+    def _delete_webhook(self, token, params):
+        self._webhooks.pop(token, None)
+        return True
+
+    def _get_me(self, token, params):
+        return {'id': int(token.split(':')[0]), 'is_bot': True, 'first_name': 'FakeBot',
+                'username': 'fake_bot'}
+
+    def stats(self, elapsed=None):
+        """Сводка для нагрузочного теста: ответы, пропускная способность и
+        перцентили времени ответа"""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            stats = {
+                'requests': dict(self.requests),
+                'throttled': self.throttled,
+                'sent': len(self.sent),
+                'answered': len(latencies),
+                'unanswered': len(self._awaiting),
+            }
+        stats['p50_ms'] = percentile(latencies, 0.50) * 1000
+        stats['p95_ms'] = percentile(latencies, 0.95) * 1000
+        stats['p99_ms'] = percentile(latencies, 0.99) * 1000
+        stats['max_ms'] = latencies[-1] * 1000 if latencies else 0.0
+        if elapsed:
+            stats['throughput'] = len(latencies) / elapsed
+        return stats
+
+
+class FakeTelegramServer:
+    """HTTP-сервер заглушки в фоновом потоке: пути /bot<токен>/<метод>,
+    параметры в строке запроса (так их передает telebot), JSON или форме"""
+
+    def __init__(self, telegram=None, host=FAKE_API_HOST, port=FAKE_API_PORT):
+        self.telegram = telegram or FakeTelegram()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """Адрес для TELEGRAM_API_URL"""
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _handler_class(self):
+        telegram = self.telegram
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive: telebot переиспользует соединения сессии requests
+            protocol_version = 'HTTP/1.1'
+
+            def _handle(self):
+                url = urlsplit(self.path)
+                parts = url.path.strip('/').split('/')
+                if len(parts) != 2 or not parts[0].startswith('bot'):
+                    self._reply(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+                    return
+                params = dict(parse_qsl(url.query))
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                content_type = self.headers.get('Content-Type', '')
+                if body and content_type.startswith('application/json'):
+                    params.update(json.loads(body))
+                elif body and content_type.startswith('application/x-www-form-urlencoded'):
+                    params.update(parse_qsl(body.decode()))
+                try:
+                    status, payload = telegram.handle(parts[0][3:], parts[1], params)
+                except (KeyError, ValueError) as e:
+                    status, payload = 400, {'ok': False, 'error_code': 400,
+                                            'description': f'Bad Request: {e}'}
+                self._reply(status, payload)
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload, ensure_ascii=False).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _handle
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-api', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def load_script(path):
+    """Сценарий из файла: одна строка JSON на шаг, как в DEFAULT_SCRIPT"""
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def format_stats(stats):
+    lines = [f"📤 Ответов: {stats['answered']}, без ответа: {stats['unanswered']}, "
+             f"сообщений от бота: {stats['sent']}, 429: {stats['throttled']}"]
+    if 'throughput' in stats:
+        lines.append(f"🚀 Пропускная способность: {stats['throughput']:.1f} обновл./с")
+    lines.append(f"⏱ Время ответа: p50 {stats['p50_ms']:.0f} мс, p95 {stats['p95_ms']:.0f} мс, "
+                 f"p99 {stats['p99_ms']:.0f} мс, максимум {stats['max_ms']:.0f} мс")
+    lines.append("📨 Запросы: " + ', '.join(f"{method} {count}"
+                                           for method, count in sorted(stats['requests'].items())))
+    return "\n".join(lines)
+
+
+def main():
+    """Заглушка Telegram Bot API из командной строки:
+
+    python fake_api.py serve                       - только сервер
+    python fake_api.py load N [rate] [сценарий]    - N обновлений, rate в секунду
+
+    Бот запускается отдельно с BOT_TOKEN=$FAKE_API_TOKEN и
+    TELEGRAM_API_URL=http://127.0.0.1:8081. Порт, задержка, доля ответов 429
+    и токен берутся из FAKE_API_PORT, FAKE_API_LATENCY, FAKE_API_JITTER,
+    FAKE_API_ERROR_RATE и FAKE_API_TOKEN.
+    """
+    args = sys.argv[1:]
+    if not args or args[0] not in ('serve', 'load') or (args[0] == 'load' and len(args) < 2):
+        print(main.__doc__)
+        sys.exit(2)
+    telegram = FakeTelegram(
+        latency=float(os.getenv('FAKE_API_LATENCY', 0)),
+        jitter=float(os.getenv('FAKE_API_JITTER', 0)),
+        error_rate=float(os.getenv('FAKE_API_ERROR_RATE', 0))
+    )
+    server = FakeTelegramServer(telegram, port=int(os.getenv('FAKE_API_PORT', FAKE_API_PORT))).start()
+    token = os.getenv('FAKE_API_TOKEN', FAKE_API_TOKEN)
+    print(f"🧪 Заглушка Bot API: {server.url}")
+    try:
+        if args[0] == 'serve':
+            while True:
+                time.sleep(1)
+        count = int(args[1])
+        rate = float(args[2]) if len(args) > 2 else 0.0
+        script = load_script(args[3]) if len(args) > 3 else DEFAULT_SCRIPT
+        started = time.perf_counter()
+        telegram.play(token, script, count, rate)
+        telegram.wait_replies(LOAD_WAIT)
+        print(format_stats(telegram.stats(time.perf_counter() - started)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
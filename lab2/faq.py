@@ -0,0 +1,213 @@
+import math
+import time
+import logging
+import threading
+from collections import Counter
+
+from search import words
+
+logger = logging.getLogger(__name__)
+
+# Параметры BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Ниже этой оценки ответ считается случайным совпадением
+MIN_SCORE = 2.0
+# Как часто сверять индекс с каталогом (секунды)
+INDEX_CHECK_INTERVAL = 30
+
+# Служебные слова, которые не помогают найти ответ
+STOP_WORDS = frozenset('''
+    а без бы в во вам вас вы да для до его ее ей если есть же за и из или им
+    их к как ли мне мы на над не нет ни но о об от по под при про с со так то
+    у уже что чтобы это эта этот я ваш ваша ваши мой моя мои можно нужно
+'''.split())
+
+# Окончания для упрощенного стемминга русских слов, от длинных к коротким
+REFLEXIVE_ENDINGS = ('ся', 'сь')
+ENDINGS = tuple(sorted('''
+    иями ями ами ого его ому ему ыми ими ешь ете ите ует уют ать ять ить еть
+    ов ев ей ий ый ой ем им ым ом их ых ую юю ая яя ою ею ам ям ах ях ия ья
+    ие ье ии ые ое ее ть ет ут ют ат ят ит
+'''.split(), key=len, reverse=True))
+VOWELS = 'аеиоуыэюяйь'
+MIN_STEM = 3
+
+# Русские ключевые слова для полей company_info.json
+COMPANY_FIELDS = {
+    'name': 'название компании',
+    'description': 'о компании чем занимаетесь',
+    'phone': 'телефон позвонить',
+    'email': 'почта email написать',
+    'address': 'адрес где находитесь город',
+    'industry': 'сфера деятельности',
+    'foundation_year': 'год основания',
+    'team_size': 'размер команды сотрудников',
+    'mission': 'миссия цель компании',
+    'key_activities': 'чем занимаетесь услуги',
+    'delivery_info': 'доставка',
+}
+
+
+def stem(word):
+    """Упрощенный стемминг: отрезать возвратную частицу, окончание и гласную"""
+    for ending in REFLEXIVE_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            word = word[:-len(ending)]
+            break
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            word = word[:-len(ending)]
+            break
+    if word[-1] in VOWELS and len(word) > MIN_STEM:
+        word = word[:-1]
+    return word
+
+
+def terms(text):
+    return [stem(word) for word in words(text) if word not in STOP_WORDS and not word.isdigit()]
+
+
+class Passage:
+    """Фрагмент для поиска: индексируемый текст и готовый ответ"""
+
+    __slots__ = ('source', 'text', 'answer')
+
+    def __init__(self, source, text, answer):
+        self.source = source
+        self.text = text
+        self.answer = answer
+
+
+def passages_for(source, data):
+    """Фрагменты одного набора данных каталога"""
+    if source == 'faq':
+        return [Passage(source, f"{item['question']} {item['answer']}", item['answer'])
+                for item in data if isinstance(item, dict) and 'answer' in item]
+    if source == 'products':
+        result = []
+        for key, product in data.get('products', {}).items():
+            name = product.get('name', key)
+            price = product.get('price')
+            price_text = f"{price} руб." if isinstance(price, (int, float)) else str(price or 'уточняйте')
+            answer = (f"🎯 {name}\n💰 Цена: {price_text}\n📝 {product.get('description', '')}\n"
+                      f"⏱ Срок: {product.get('delivery_time', 'уточняйте')}")
+            text = ' '.join([key, name, 'цена стоимость', str(product.get('description', ''))]
+                            + product.get('features', []))
+            result.append(Passage(source, text, answer))
+        promotions = data.get('current_promotions', [])
+        if promotions:
+            answer = "🎁 Акции:\n" + '\n'.join(f"• {promotion}" for promotion in promotions)
+            result.append(Passage(source, 'акции скидки ' + ' '.join(promotions), answer))
+        return result
+    if source == 'events':
+        return [Passage(source, f"{name} {event.get('type', '')} {event.get('description', '')}",
+                        f"📅 {name} ({event.get('date', '')})\n📝 {event.get('description', '')}")
+                for name, event in data.items()]
+    if source == 'company_info':
+        result = []
+        for field, value in data.items():
+            if isinstance(value, list):
+                value = '\n'.join(f"• {item}" for item in value)
+            elif isinstance(value, dict):
+                value = '\n'.join(f"• {item}" for item in value.values())
+            elif str(value).startswith('Не указан'):
+                continue
+            keywords = COMPANY_FIELDS.get(field, field.replace('_', ' '))
+            result.append(Passage(source, f"{keywords} {value}", f"🏢 {value}"))
+        return result
+    return []
+
+
+class FaqEngine:
+    """Ответы на свободные вопросы по обратному индексу с оценкой BM25.
+
+    Фрагменты берутся из FAQ, товаров, событий и описания компании. Индекс
+    обновляется по наборам: когда каталог отдает новые данные одного
+    набора, из индекса удаляются и заново добавляются только его фрагменты.
+    """
+
+    SOURCES = ('faq', 'products', 'events', 'company_info')
+
+    def __init__(self, catalog, min_score=MIN_SCORE, check_interval=INDEX_CHECK_INTERVAL):
+        self.catalog = catalog
+        self.min_score = min_score
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._checked_at = None
+        self._sources = {}
+        self._passages = {}
+        self._lengths = {}
+        self._postings = {}
+        self._by_source = {source: [] for source in self.SOURCES}
+        self._next_id = 0
+        self._total_length = 0
+        self.rebuilds = 0
+
+    # ---------- Индекс ----------
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            for source in self.SOURCES:
+                data = self.catalog.get(source)
+                if self._sources.get(source) is not data:
+                    self._replace_source(source, data)
+                    self._sources[source] = data
+            self._checked_at = now
+
+    def _replace_source(self, source, data):
+        for passage_id in self._by_source[source]:
+            for term in set(terms(self._passages[passage_id].text)):
+                postings = self._postings[term]
+                del postings[passage_id]
+                if not postings:
+                    del self._postings[term]
+            self._total_length -= self._lengths.pop(passage_id)
+            del self._passages[passage_id]
+
+        ids = []
+        for passage in passages_for(source, data):
+            passage_id = self._next_id
+            self._next_id += 1
+            counts = Counter(terms(passage.text))
+            for term, count in counts.items():
+                self._postings.setdefault(term, {})[passage_id] = count
+            self._passages[passage_id] = passage
+            self._lengths[passage_id] = sum(counts.values())
+            self._total_length += self._lengths[passage_id]
+            ids.append(passage_id)
+        self._by_source[source] = ids
+        self.rebuilds += 1
+        logger.debug(f"🔎 Индекс FAQ: обновлен набор {source} ({len(ids)} фрагментов)")
+
+    # ---------- Поиск ----------
+
+    def search(self, query, limit=3):
+        """Лучшие фрагменты: список (оценка, Passage) по убыванию оценки"""
+        self._refresh()
+        with self._lock:
+            count = len(self._passages)
+            if not count:
+                return []
+            avg_length = self._total_length / count
+            scores = Counter()
+            for term in set(terms(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for passage_id, tf in postings.items():
+                    norm = 1 - BM25_B + BM25_B * self._lengths[passage_id] / avg_length
+                    scores[passage_id] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+            return [(score, self._passages[passage_id])
+                    for passage_id, score in scores.most_common(limit)]
+
+    def answer(self, query):
+        """Ответ из лучшего фрагмента или None, если уверенного совпадения нет"""
+        results = self.search(query, limit=1)
+        if results and results[0][0] >= self.min_score:
+            return results[0][1].answer
+        return None
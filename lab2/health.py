@@ -0,0 +1,64 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Как часто проверять БД (секунды)
+HEALTH_CHECK_INTERVAL = 10
+
+
+class HealthMonitor:
+    """Фоновая проверка БД с повторным подключением.
+
+    Раз в interval секунд вызывает check(): для бота это
+    Application.check_db(), которая открывает БД, если она еще не открыта,
+    делает пробную запись и после восстановления воспроизводит журнал.
+    Пока проверки не проходят, записи копятся в журнале (journal.py).
+    """
+
+    def __init__(self, check, interval=HEALTH_CHECK_INTERVAL):
+        self.check = check
+        self.interval = interval
+        self.healthy = None
+        self.checks = 0
+        self.failures = 0
+        self.changed_at = None
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_check(self):
+        """Одна проверка; возвращает True, если БД принимает записи"""
+        try:
+            healthy = bool(self.check())
+        except Exception as e:
+            logger.error(f"❌ Ошибка проверки БД: {e}")
+            healthy = False
+        self.checks += 1
+        if not healthy:
+            self.failures += 1
+        if healthy != self.healthy:
+            if self.healthy is not None:
+                logger.info(f"{'✅ БД восстановлена' if healthy else '❌ БД недоступна, работа через журнал'}")
+            self.healthy = healthy
+            self.changed_at = time.time()
+        return healthy
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(self.interval):
+                self.run_check()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name='db-health', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
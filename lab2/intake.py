@@ -0,0 +1,270 @@
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Уровни приоритета: меньше - важнее
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_NAMES = {PRIORITY_HIGH: 'high', PRIORITY_NORMAL: 'normal', PRIORITY_LOW: 'low'}
+
+# Приоритеты команд по умолчанию; остальные команды - PRIORITY_NORMAL,
+# обычный текст - PRIORITY_LOW, ответы в диалоге заказа - PRIORITY_HIGH
+DEFAULT_PRIORITIES = {
+    'add_order': PRIORITY_HIGH,
+    'order': PRIORITY_HIGH,
+    'cancel': PRIORITY_HIGH,
+    'debug': PRIORITY_LOW,
+}
+
+QUEUE_SIZE = 200
+WORKERS = 4
+
+# Ответ при сбросе обновления и пауза между такими ответами одному чату
+SHED_REPLY = "⏳ Бот сейчас перегружен, повторите запрос через минуту."
+SHED_REPLY_INTERVAL = 30
+
+# Сколько последних замеров ожидания в очереди хранить для перцентилей
+LATENCY_WINDOW = 1000
+
+
+def parse_priorities(value):
+    """Разбор строки вида "add_order:0,order:0,debug:2" из переменной окружения"""
+    priorities = dict(DEFAULT_PRIORITIES)
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        command, _, level = item.partition(':')
+        try:
+            level = int(level)
+            if level not in PRIORITY_NAMES:
+                raise ValueError
+        except ValueError:
+            logger.error(f"Неверный приоритет команды: {item}")
+            continue
+        priorities[command.strip().lstrip('/').lower()] = level
+    return priorities
+
+
+# Имя источника обновлений, когда очередью пользуется один бот
+DEFAULT_TENANT = 'default'
+
+
+class IntakeTenant:
+    """Бот-источник в общей очереди: свой диспетчер, лимит очереди и метрики"""
+
+    def __init__(self, name, process, send_reply=None, in_dialog=None, limit=None):
+        self.name = name
+        self.process = process
+        self.send_reply = send_reply
+        self.in_dialog = in_dialog or (lambda user_id: False)
+        self.limit = limit
+
+        self.queued = 0
+        self.accepted = 0
+        self.processed = 0
+        self.shed = {level: 0 for level in PRIORITY_NAMES}
+        self.waits = {level: deque(maxlen=LATENCY_WINDOW) for level in PRIORITY_NAMES}
+
+
+class UpdateIntake:
+    """Ограниченная очередь обновлений с приоритетами и сбросом нагрузки.
+
+    Polling кладет обновления в очередь, рабочие потоки забирают их в порядке
+    приоритета и передают в диспетчер telebot. Когда очередь заполнена,
+    сбрасывается обновление с самым низким приоритетом (самое свежее из них),
+    а его автору отправляется короткий готовый ответ без вызова обработчиков.
+
+    Одну очередь и ее рабочие потоки могут делить несколько ботов (tenant).
+    У каждого свой диспетчер и метрики, а limit ограничивает число его
+    обновлений в очереди: бот, превысивший лимит, вытесняет только свои.
+    """
+
+    def __init__(self, priorities=None, maxsize=QUEUE_SIZE, workers=WORKERS):
+        self.priorities = priorities if priorities is not None else dict(DEFAULT_PRIORITIES)
+        self.maxsize = maxsize
+        self.workers = workers
+        self.tenants = {}
+
+        self._queues = {level: deque() for level in PRIORITY_NAMES}
+        self._size = 0
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopping = False
+
+        self._reply_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shed-reply')
+        self._replied = TTLCache(maxsize=10000, ttl=SHED_REPLY_INTERVAL)
+
+        self.accepted = 0
+        self.processed = 0
+        self.shed = {level: 0 for level in PRIORITY_NAMES}
+        self._waits = {level: deque(maxlen=LATENCY_WINDOW) for level in PRIORITY_NAMES}
+
+    def add_tenant(self, name, process, send_reply=None, in_dialog=None, limit=None):
+        tenant = IntakeTenant(name, process, send_reply, in_dialog, limit)
+        with self._cond:
+            self.tenants[name] = tenant
+        return tenant
+
+    # ---------- Классификация ----------
+
+    def classify(self, update, tenant=None):
+        message = update.message
+        if message is None or not message.text:
+            return PRIORITY_NORMAL
+        if message.text.startswith('/'):
+            command = message.text.split()[0][1:].split('@')[0].lower()
+            return self.priorities.get(command, PRIORITY_NORMAL)
+        if message.from_user is not None and tenant is not None and \
+                tenant.in_dialog(message.from_user.id):
+            return PRIORITY_HIGH
+        return PRIORITY_LOW
+
+    # ---------- Очередь ----------
+
+    def submit(self, updates, tenant=DEFAULT_TENANT):
+        tenant = self.tenants[tenant]
+        shed = []
+        with self._cond:
+            for update in updates:
+                level = self.classify(update, tenant)
+                if tenant.limit is not None and tenant.queued >= tenant.limit:
+                    victim = self._evict(level, tenant)
+                elif self._size >= self.maxsize:
+                    victim = self._evict(level)
+                else:
+                    victim = False
+                if victim is None:
+                    # Новое обновление не важнее самых неважных в очереди
+                    shed.append((level, tenant, update))
+                    continue
+                if victim:
+                    shed.append(victim)
+                self._queues[level].append((time.monotonic(), tenant, update))
+                self._size += 1
+                tenant.queued += 1
+                tenant.accepted += 1
+                self.accepted += 1
+                self._cond.notify()
+
+        for level, victim_tenant, update in shed:
+            self._shed(level, victim_tenant, update)
+
+    def _evict(self, level, tenant=None):
+        """Убрать из очереди самое свежее из самых неважных обновлений, если
+        оно менее важно, чем level; tenant - искать только среди его обновлений"""
+        for lowest in sorted(self._queues, reverse=True):
+            if lowest <= level:
+                return None
+            queue = self._queues[lowest]
+            for i in range(len(queue) - 1, -1, -1):
+                _, owner, update = queue[i]
+                if tenant is None or owner is tenant:
+                    del queue[i]
+                    self._size -= 1
+                    owner.queued -= 1
+                    return lowest, owner, update
+        return None
+
+    def _take(self):
+        with self._cond:
+            while not self._size and not self._stopping:
+                self._cond.wait()
+            if not self._size:
+                return None, None
+            for level, queue in self._queues.items():
+                if queue:
+                    enqueued_at, tenant, update = queue.popleft()
+                    self._size -= 1
+                    tenant.queued -= 1
+                    wait = time.monotonic() - enqueued_at
+                    self._waits[level].append(wait)
+                    tenant.waits[level].append(wait)
+                    return tenant, update
+
+    def _worker(self):
+        while True:
+            tenant, update = self._take()
+            if update is None:
+                return
+            try:
+                tenant.process([update])
+            except Exception as e:
+                logger.error(f"Ошибка обработки обновления {update.update_id} ({tenant.name}): {e}")
+            with self._cond:
+                self.processed += 1
+                tenant.processed += 1
+
+    def _shed(self, level, tenant, update):
+        self.shed[level] += 1
+        tenant.shed[level] += 1
+        logger.warning(f"⚠️ Перегрузка: сброшено обновление {update.update_id} "
+                       f"({tenant.name}, {PRIORITY_NAMES[level]})")
+        message = update.message
+        if message is None or tenant.send_reply is None:
+            return
+        if self._replied.add((tenant.name, message.chat.id)):
+            self._reply_pool.submit(self._send_shed_reply, tenant, message.chat.id)
+
+    def _send_shed_reply(self, tenant, chat_id):
+        try:
+            tenant.send_reply(chat_id, SHED_REPLY)
+        except Exception as e:
+            logger.error(f"Ошибка отправки ответа о перегрузке: {e}")
+
+    # ---------- Жизненный цикл ----------
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'intake-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Обработать оставшиеся обновления и остановить рабочие потоки"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._reply_pool.shutdown(wait=False)
+
+    def install(self, bot, tenant=DEFAULT_TENANT, in_dialog=None, limit=None):
+        """Поставить очередь между polling и диспетчером telebot"""
+        self.add_tenant(tenant, bot.process_new_updates, send_reply=bot.send_message,
+                        in_dialog=in_dialog, limit=limit)
+        bot.process_new_updates = lambda updates: self.submit(updates, tenant)
+        self.start()
+
+    # ---------- Метрики ----------
+
+    def stats(self, tenant=None):
+        """Метрики всей очереди или одного бота"""
+        with self._cond:
+            if tenant is None:
+                source = self
+                depth = {PRIORITY_NAMES[l]: len(q) for l, q in self._queues.items()}
+                waits = {l: sorted(w) for l, w in self._waits.items()}
+            else:
+                source = self.tenants[tenant]
+                depth = {PRIORITY_NAMES[l]: sum(1 for _, owner, _ in q if owner is source)
+                         for l, q in self._queues.items()}
+                waits = {l: sorted(w) for l, w in source.waits.items()}
+        p95 = {}
+        for level, values in waits.items():
+            if values:
+                p95[PRIORITY_NAMES[level]] = values[min(len(values) - 1, int(len(values) * 0.95))]
+        return {
+            'depth': depth,
+            'accepted': source.accepted,
+            'processed': source.processed,
+            'shed': {PRIORITY_NAMES[l]: count for l, count in source.shed.items()},
+            'wait_p95': p95,
+        }
@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Сколько записей журнала применять одной транзакцией при воспроизведении
+REPLAY_BATCH = 200
+
+# add_order возвращает это значение вместо ID, если заказ записан в журнал
+ORDER_PENDING = 'pending'
+
+
+def journal_path(db_path):
+    """Файл журнала рядом с БД: gameboard_bot.db -> gameboard_bot.journal"""
+    return os.path.splitext(db_path)[0] + '.journal'
+
+
+def order_key(idempotency_key):
+    """Ключ идемпотентности заказа из журнала: без него повторное
+    воспроизведение после сбоя создало бы заказ дважды"""
+    return idempotency_key or uuid.uuid4().hex
+
+
+class WriteJournal:
+    """Журнал записей, которые не удалось выполнить в БД.
+
+    Одна строка JSON на запись {"op", "args", "ts"}; файл только дописывается
+    и сбрасывается на диск (fsync) после каждой записи. replay() применяет
+    записи по порядку пакетами и после каждого пакета сохраняет смещение в
+    файле .offset, поэтому прерванное воспроизведение продолжается с того же
+    места. Пока журнал не воспроизведен полностью, новые записи тоже идут в
+    него (try_append), чтобы не обогнать накопленные.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset_path = path + '.offset'
+        self.appended = 0
+        self.replayed = 0
+        self._pending = None
+        self._tail_checked = False
+        self._lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+
+    @property
+    def pending(self):
+        """Есть ли записи, которые еще не попали в БД"""
+        if self._pending is None:
+            with self._lock:
+                self._pending = os.path.exists(self.path) and \
+                    os.path.getsize(self.path) > self._read_offset()
+        return self._pending
+
+    def append(self, op, *args):
+        """Дописать запись в журнал"""
+        line = json.dumps({'op': op, 'args': args, 'ts': time.time()}, ensure_ascii=False)
+        with self._lock:
+            self._append(line)
+
+    def try_append(self, op, *args):
+        """Дописать запись, только если журнал еще не воспроизведен"""
+        if not self.pending:
+            return False
+        line = json.dumps({'op': op, 'args': args, 'ts': time.time()}, ensure_ascii=False)
+        with self._lock:
+            if not self._pending:
+                return False
+            self._append(line)
+        return True
+
+    def _append(self, line):
+        if not self._tail_checked:
+            # После сбоя последняя строка может быть оборвана: новая запись
+            # начинается с новой строки, чтобы не склеиться с ней
+            if os.path.exists(self.path) and os.path.getsize(self.path):
+                with open(self.path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        line = '\n' + line
+            self._tail_checked = True
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending = True
+        self.appended += 1
+
+    def _read_offset(self):
+        try:
+            with open(self.offset_path) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_offset(self, offset):
+        tmp_path = self.offset_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(offset))
+        os.replace(tmp_path, self.offset_path)
+
+    def _read(self, offset, limit):
+        """Записи начиная со смещения: (записи, новое смещение)"""
+        entries = []
+        if not os.path.exists(self.path):
+            return entries, offset
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                # Оборванная строка остается после сбоя во время записи
+                if not line.endswith(b'\n'):
+                    break
+                offset += len(line)
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    logger.error(f"❌ Поврежденная запись журнала пропущена: {line[:100]!r}")
+                    continue
+                if len(entries) >= limit:
+                    break
+        return entries, offset
+
+    def replay(self, apply, batch_size=REPLAY_BATCH):
+        """Применить накопленные записи: apply(записи) выполняет пакет одной
+        транзакцией. Ошибка apply останавливает воспроизведение, а пакет
+        будет повторен при следующем вызове. Возвращает число записей."""
+        if not self._replay_lock.acquire(blocking=False):
+            return 0
+        try:
+            replayed = 0
+            offset = self._read_offset()
+            while True:
+                with self._lock:
+                    entries, next_offset = self._read(offset, batch_size)
+                    if next_offset == offset:
+                        # Все записано в БД: журнал начинается заново
+                        for path in (self.path, self.offset_path):
+                            if os.path.exists(path):
+                                os.remove(path)
+                        self._pending = False
+                        break
+                if entries:
+                    apply(entries)
+                offset = next_offset
+                self._write_offset(offset)
+                replayed += len(entries)
+                self.replayed += len(entries)
+            if replayed:
+                logger.info(f"📓 Из журнала в БД записано: {replayed}")
+            return replayed
+        finally:
+            self._replay_lock.release()
+
+
+class OfflineWrites:
+    """Записи, пока БД не удалось открыть: все они уходят в журнал.
+
+    Повторяет методы записи DatabaseManager, которые вызывают обработчики
+    независимо от доступности БД.
+    """
+
+    degraded = True
+
+    def __init__(self, journal):
+        self.journal = journal
+
+    def add_user(self, user_id, username, first_name, last_name):
+        self.journal.append('add_user', user_id, username, first_name, last_name)
+
+    def log_request(self, user_id, request_text, response_text, command_used):
+        self.journal.append('log_request', user_id, request_text, response_text, command_used)
+
+    def add_order(self, user_id, customer_name, product_name, quantity, total_kopecks, notes="",
+                  idempotency_key=None):
+        self.journal.append('add_order', user_id, customer_name, product_name, quantity,
+                            int(total_kopecks), notes, order_key(idempotency_key))
+        return ORDER_PENDING
@@ -0,0 +1,187 @@
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Срок аренды лидерства (секунды): резервная реплика становится лидером не
+# позже чем через LEASE_TTL после падения лидера; продление - втрое чаще
+LEASE_TTL = 10
+
+
+class LeaderLease:
+    """Аренда лидерства в общей SQLite БД реплик.
+
+    Лидер раз в renew_interval продлевает строку в таблице leases. Другие
+    реплики пытаются занять ее тем же запросом, но условие ON CONFLICT
+    позволяет перезаписать только свою или просроченную аренду. Лидер,
+    не сумевший продлить аренду до ее истечения, сам слагает полномочия.
+    """
+
+    def __init__(self, db_path, name='leader', holder=None, ttl=LEASE_TTL,
+                 renew_interval=None):
+        self.db_path = db_path
+        self.name = name
+        self.holder = holder or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.ttl = ttl
+        self.renew_interval = renew_interval or ttl / 3
+        self.is_leader = False
+        self.elections = 0
+
+        self._expires_at = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.renew_interval)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        return conn
+
+    def try_acquire(self):
+        """Занять или продлить аренду; True, если реплика - лидер"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('''
+                    INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+                    ON CONFLICT (name) DO UPDATE SET
+                        holder = excluded.holder,
+                        expires_at = excluded.expires_at
+                    WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+                ''', (self.name, self.holder, now + self.ttl, now))
+                holder, = conn.execute(
+                    'SELECT holder FROM leases WHERE name = ?', (self.name,)
+                ).fetchone()
+        finally:
+            conn.close()
+
+        if holder == self.holder:
+            self._expires_at = now + self.ttl
+            return True
+        return False
+
+    def release(self):
+        """Освободить аренду, чтобы резервная реплика не ждала ее истечения"""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM leases WHERE name = ? AND holder = ?',
+                             (self.name, self.holder))
+        finally:
+            conn.close()
+        self._expires_at = 0
+
+    def start(self, on_elected, on_demoted):
+        """Следить за арендой в фоне и вызывать колбэки при смене роли"""
+        def loop():
+            while True:
+                try:
+                    leader = self.try_acquire()
+                except Exception as e:
+                    logger.error(f"❌ Ошибка продления аренды лидера: {e}")
+                    # Без связи с БД остаемся лидером только до истечения аренды
+                    leader = self.is_leader and time.time() < self._expires_at - self.renew_interval
+
+                if leader != self.is_leader:
+                    self.is_leader = leader
+                    if leader:
+                        self.elections += 1
+                        logger.info(f"👑 Реплика {self.holder} стала лидером")
+                        self._notify(on_elected)
+                    else:
+                        logger.warning(f"⚠️ Реплика {self.holder} больше не лидер")
+                        self._notify(on_demoted)
+
+                if self._stop.wait(self.renew_interval):
+                    return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name='leader-lease', daemon=True)
+        self._thread.start()
+
+    def _notify(self, callback):
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"❌ Ошибка смены роли реплики: {e}")
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if self.is_leader:
+            self.is_leader = False
+            try:
+                self.release()
+            except Exception as e:
+                logger.error(f"❌ Ошибка освобождения аренды лидера: {e}")
+
+
+class ReplicaRunner:
+    """Запуск реплики бота: polling и фоновые задачи только у лидера.
+
+    Резервная реплика заранее создает БД, каталог и клиент Telegram и ждет
+    аренды. Обновления, полученные уже после потери лидерства (например,
+    из незавершенного long polling), отбрасываются без подтверждения, и
+    новый лидер получит их от Telegram повторно.
+    """
+
+    def __init__(self, application, lease):
+        self.application = application
+        self.lease = lease
+        self._polling = None
+        self._stopped = threading.Event()
+
+    def run(self):
+        application = self.application
+        application.catalog
+        application.db
+        bot = application.bot
+
+        process_new_updates = bot.process_new_updates
+
+        def process_if_leader(updates):
+            if self.lease.is_leader:
+                process_new_updates(updates)
+            else:
+                logger.info(f"Реплика не лидер, пропущено обновлений: {len(updates)}")
+
+        bot.process_new_updates = process_if_leader
+
+        self.lease.start(self._on_elected, self._on_demoted)
+        try:
+            while not self._stopped.wait(1):
+                pass
+        finally:
+            self.lease.stop()
+            application.stop_polling()
+            application.close()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _on_elected(self):
+        self.application.start_jobs()
+        # polling() в отличие от infinity_polling() можно запускать повторно
+        # после stop_polling(), если реплика снова станет лидером
+        self._polling = threading.Thread(
+            target=self.application.bot.polling, kwargs={'non_stop': True},
+            name='polling', daemon=True
+        )
+        self._polling.start()
+
+    def _on_demoted(self):
+        self.application.stop_polling()
+        self.application.stop_jobs()
@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import queue
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Поля контекста (update_id, tenant), которые добавляются к записям потока
+_context = threading.local()
+
+
+@contextmanager
+def log_context(**fields):
+    """Добавлять поля ко всем записям лога этого потока внутри блока"""
+    previous = getattr(_context, 'fields', {})
+    _context.fields = {**previous, **fields}
+    try:
+        yield
+    finally:
+        _context.fields = previous
+
+
+def parse_sampling(value):
+    """Разбор строки вида "database:0.1,intake:0.5": доля сохраняемых записей"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        name, _, rate = item.partition(':')
+        try:
+            rates[name.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            print(f"Неверная доля выборки логов: {item}", file=sys.stderr)
+    return rates
+
+
+class ContextFilter(logging.Filter):
+    """Копирует поля контекста потока в запись, пока она еще в этом потоке"""
+
+    def filter(self, record):
+        record.context = getattr(_context, 'fields', {})
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю записей уровня INFO и ниже от частых логгеров.
+
+    Доля задается для логгера и действует на его потомков; предупреждения
+    и ошибки проходят всегда.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def _rate(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler, который не форматирует сообщение в потоке обработчика.
+
+    Стандартный prepare() собирает строку сообщения до постановки в очередь;
+    здесь запись уходит как есть, а msg % args выполняет поток QueueListener.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'thread': record.threadName,
+        }
+        entry.update(getattr(record, 'context', {}))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ContextTextFormatter(logging.Formatter):
+    """Текстовый формат с полями контекста в конце строки"""
+
+    def format(self, record):
+        line = super().format(record)
+        context = getattr(record, 'context', {})
+        if context:
+            line += ' [' + ' '.join(f'{key}={value}' for key, value in context.items()) + ']'
+        return line
+
+
+def setup_logging(level=None, fmt=None, sampling=None, stream=None):
+    """Настроить логирование через очередь; возвращает запущенный QueueListener.
+
+    Потоки бота только кладут запись в очередь, а форматирование и запись
+    в stdout выполняет отдельный поток. Параметры по умолчанию берутся из
+    LOG_LEVEL, LOG_FORMAT (json или text) и LOG_SAMPLING.
+    """
+    level = level or os.getenv('LOG_LEVEL', 'INFO')
+    fmt = fmt or os.getenv('LOG_FORMAT', 'json')
+    rates = parse_sampling(os.getenv('LOG_SAMPLING') if sampling is None else sampling)
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else ContextTextFormatter(TEXT_FORMAT))
+
+    handler = DeferredQueueHandler(queue.SimpleQueue())
+    handler.addFilter(SamplingFilter(rates))
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener = QueueListener(handler.queue, output)
+    listener.start()
+    return listener
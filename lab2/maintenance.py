@@ -0,0 +1,231 @@
+import sys
+import time
+import sqlite3
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Как часто планировщик просыпается и оценивает нагрузку (секунды)
+CHECK_INTERVAL = 60
+# Окно оценки нагрузки и порог "тихого" периода (обновлений в минуту)
+TRAFFIC_WINDOW = 5 * 60
+LOW_TRAFFIC_RATE = 5
+# Бюджет времени одного шага обслуживания (секунды)
+STEP_BUDGET = 0.5
+# Сколько страниц освобождать за один вызов incremental_vacuum
+VACUUM_PAGES = 256
+# Периоды задач (секунды)
+TASK_PERIODS = {
+    'checkpoint': 60 * 60,
+    'optimize': 6 * 60 * 60,
+    'vacuum': 24 * 60 * 60,
+    'quick_check': 24 * 60 * 60,
+}
+HISTORY_SIZE = 20
+
+
+def convert_auto_vacuum(db_path):
+    """Перевести БД в режим auto_vacuum=INCREMENTAL.
+
+    Режим меняется только полным VACUUM, который переписывает весь файл и
+    не укладывается ни в какой бюджет, поэтому выполняется офлайн: при
+    запуске бота до старта потока записи или командой
+    python maintenance.py [путь к БД]. Возвращает True, если БД уже в
+    нужном режиме или переведена.
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            return True
+        started = time.perf_counter()
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('VACUUM')
+        logger.info(f"🧹 БД переведена в режим auto_vacuum=INCREMENTAL "
+                    f"({time.perf_counter() - started:.1f} с)")
+        return True
+    except sqlite3.Error as e:
+        logger.error(f"❌ Не удалось перевести БД в режим auto_vacuum=INCREMENTAL: {e}")
+        return False
+    finally:
+        conn.close()
+
+
+class MaintenanceResult:
+    __slots__ = ('task', 'started_at', 'duration', 'done', 'details')
+
+    def __init__(self, task, started_at, duration, done, details):
+        self.task = task
+        self.started_at = started_at
+        self.duration = duration
+        self.done = done
+        self.details = details
+
+
+class MaintenanceScheduler:
+    """Фоновое обслуживание SQLite в периоды низкой нагрузки.
+
+    Раз в CHECK_INTERVAL планировщик оценивает частоту входящих обновлений
+    и, если она ниже LOW_TRAFFIC_RATE, по одной выполняет созревшие задачи,
+    проверяя нагрузку перед каждой: WAL checkpoint (TRUNCATE), PRAGMA
+    optimize, incremental_vacuum и quick_check. Каждая задача работает на отдельном соединении и
+    ограничена STEP_BUDGET через progress handler; прерванная задача
+    остается в очереди и продолжится в следующий тихий период.
+    """
+
+    def __init__(self, db_path, traffic=None, periods=None, check_interval=CHECK_INTERVAL,
+                 low_traffic_rate=LOW_TRAFFIC_RATE, step_budget=STEP_BUDGET):
+        self.db_path = db_path
+        self.traffic = traffic or (lambda: 0)
+        self.periods = periods if periods is not None else dict(TASK_PERIODS)
+        self.check_interval = check_interval
+        self.low_traffic_rate = low_traffic_rate
+        self.step_budget = step_budget
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.last_run = {}
+
+        self._samples = deque()
+        self._samples_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---------- Нагрузка ----------
+
+    def traffic_rate(self):
+        """Обновлений в минуту за последние TRAFFIC_WINDOW секунд или None,
+        пока замеров недостаточно"""
+        count = self.traffic()
+        # Вызывается и из фонового потока, и из /maintenance
+        with self._samples_lock:
+            now = time.monotonic()
+            self._samples.append((now, count))
+            while len(self._samples) > 2 and now - self._samples[1][0] >= TRAFFIC_WINDOW:
+                self._samples.popleft()
+            started, first = self._samples[0]
+            last = self._samples[-1][1]
+        if now - started < 1:
+            return None
+        return (last - first) * 60 / (now - started)
+
+    def is_quiet(self):
+        rate = self.traffic_rate()
+        return rate is not None and rate < self.low_traffic_rate
+
+    # ---------- Задачи ----------
+
+    def due_tasks(self):
+        now = time.time()
+        return [task for task, period in self.periods.items()
+                if now - self.last_run.get(task, 0) >= period]
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.step_budget, isolation_level=None)
+        deadline = time.monotonic() + self.step_budget
+        # Ненулевой результат прерывает текущий запрос с OperationalError
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+        return conn, deadline
+
+    def _checkpoint(self, conn, deadline):
+        busy, wal_pages, moved = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        if busy:
+            return False, f"WAL занят читателями, перенесено {moved} из {wal_pages} страниц"
+        return True, f"WAL сброшен, перенесено страниц: {moved}"
+
+    def _optimize(self, conn, deadline):
+        conn.execute('PRAGMA optimize')
+        return True, "статистика планировщика обновлена"
+
+    def _vacuum(self, conn, deadline):
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            # Полный VACUUM в фоне не выполняется: он не укладывается в бюджет
+            return True, "режим не INCREMENTAL, нужен офлайн-перевод (python maintenance.py)"
+        freed = 0
+        while time.monotonic() < deadline:
+            free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if not free:
+                return True, f"освобождено страниц: {freed}"
+            conn.execute(f'PRAGMA incremental_vacuum({min(free, VACUUM_PAGES)})').fetchall()
+            freed += min(free, VACUUM_PAGES)
+        return False, f"освобождено страниц: {freed}, продолжение в следующий раз"
+
+    def _quick_check(self, conn, deadline):
+        problems = [row[0] for row in conn.execute('PRAGMA quick_check(10)')]
+        if problems == ['ok']:
+            return True, "ok"
+        logger.error(f"❌ quick_check нашел проблемы: {problems}")
+        return True, "проблемы: " + '; '.join(problems)
+
+    TASKS = {
+        'checkpoint': _checkpoint,
+        'optimize': _optimize,
+        'vacuum': _vacuum,
+        'quick_check': _quick_check,
+    }
+
+    def run_task(self, task):
+        """Выполнить одну задачу в пределах бюджета и записать результат"""
+        with self._lock:
+            started_at = time.time()
+            started = time.perf_counter()
+            conn, deadline = self._connect()
+            try:
+                done, details = self.TASKS[task](self, conn, deadline)
+            except sqlite3.OperationalError as e:
+                done = False
+                details = "прервано по времени" if 'interrupt' in str(e) else f"ошибка: {e}"
+            finally:
+                conn.close()
+            if done:
+                self.last_run[task] = started_at
+            result = MaintenanceResult(task, started_at, time.perf_counter() - started, done, details)
+            self.history.append(result)
+            logger.info(f"🧹 Обслуживание БД: {task} - {details} ({result.duration * 1000:.0f} мс)")
+            return result
+
+    def run_due(self, force=False):
+        """Выполнить созревшие задачи (все, если force), пока нагрузка низкая"""
+        results = []
+        for task in (list(self.periods) if force else self.due_tasks()):
+            if not force and not self.is_quiet():
+                break
+            results.append(self.run_task(task))
+        return results
+
+    # ---------- Жизненный цикл ----------
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(self.check_interval):
+                try:
+                    if self.due_tasks() and self.is_quiet():
+                        self.run_due()
+                except Exception as e:
+                    logger.error(f"❌ Ошибка обслуживания БД: {e}")
+
+        self.traffic_rate()
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name='db-maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+
+def main():
+    """Офлайн-перевод БД в режим auto_vacuum=INCREMENTAL: python maintenance.py [путь к БД]"""
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    db_path = sys.argv[1] if len(sys.argv) > 1 else 'gameboard_bot.db'
+    if not convert_auto_vacuum(db_path):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
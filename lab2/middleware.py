@@ -0,0 +1,191 @@
+import time
+import logging
+import threading
+from functools import wraps
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Профиль пользователя, который не менялся, обновляется в БД не чаще раза
+# в USER_REFRESH_INTERVAL секунд (от этого зависит точность last_activity)
+USER_REFRESH_INTERVAL = 5 * 60
+USER_CACHE_SIZE = 10000
+# Обработка дольше этого времени попадает в лог как медленная (секунды)
+SLOW_UPDATE = 1.0
+ERROR_REPLY = "❌ Произошла ошибка при обработке запроса"
+
+# Сообщение, которое обрабатывается в текущем потоке
+_current = threading.local()
+
+
+def command_name(text):
+    """Команда из текста сообщения: "/order@bot 12" -> "order", текст -> "text_message" """
+    if not text or not text.startswith('/'):
+        return 'text_message'
+    return text.split()[0][1:].split('@')[0].lower()
+
+
+class UpdateRecord:
+    """Обрабатываемое сообщение и итог обработки для лога запросов и метрик"""
+
+    __slots__ = ('message', 'command', 'response_text', 'error_reply', 'error',
+                 'started', 'duration')
+
+    def __init__(self, message, error_reply=ERROR_REPLY):
+        self.message = message
+        self.command = command_name(message.text)
+        self.response_text = ''
+        self.error_reply = error_reply
+        self.error = None
+        self.started = None
+        self.duration = None
+
+
+def note(response_text, command=None):
+    """Итог обработки для лога запросов текущего сообщения.
+
+    Обработчики вызывают note() вместо log_request: запись в БД делает
+    конвейер один раз после обработки. Если обработчик вызывает другой
+    (handle_all_messages -> send_orders), в лог попадает последний итог.
+    """
+    record = getattr(_current, 'record', None)
+    if record is not None:
+        record.response_text = response_text
+        if command is not None:
+            record.command = command
+
+
+class Middleware:
+    """Шаг конвейера: before() - до обработчика, after() - после, в обратном порядке"""
+
+    def before(self, application, record):
+        pass
+
+    def after(self, application, record):
+        pass
+
+
+class TimingMiddleware(Middleware):
+    """Время обработки сообщений и число ошибок"""
+
+    def __init__(self, slow=SLOW_UPDATE):
+        self.slow = slow
+        self.handled = 0
+        self.errors = 0
+        self.slow_updates = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        # Обработчики выполняются в нескольких потоках очереди входящих обновлений
+        self._lock = threading.Lock()
+
+    def before(self, application, record):
+        record.started = time.perf_counter()
+
+    def after(self, application, record):
+        record.duration = time.perf_counter() - record.started
+        slow = record.duration >= self.slow
+        with self._lock:
+            self.handled += 1
+            self.total_time += record.duration
+            self.max_time = max(self.max_time, record.duration)
+            if record.error is not None:
+                self.errors += 1
+            if slow:
+                self.slow_updates += 1
+        if slow:
+            logger.warning(f"🐢 /{record.command} обработано за {record.duration * 1000:.0f} мс")
+        else:
+            logger.debug("⏱ %s обработано за %.1f мс", record.command, record.duration * 1000)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'handled': self.handled,
+                'errors': self.errors,
+                'slow': self.slow_updates,
+                'avg_ms': self.total_time * 1000 / self.handled if self.handled else 0.0,
+                'max_ms': self.max_time * 1000,
+            }
+
+
+class BookkeepingMiddleware(Middleware):
+    """Учет пользователя и лог запроса: ровно одна запись каждого вида на сообщение.
+
+    Upsert пользователя пропускается, если его профиль не менялся за
+    последние USER_REFRESH_INTERVAL секунд.
+    """
+
+    def __init__(self, refresh_interval=USER_REFRESH_INTERVAL):
+        self._profiles = TTLCache(maxsize=USER_CACHE_SIZE, ttl=refresh_interval)
+
+    def after(self, application, record):
+        user = record.message.from_user
+        writes = application.writes
+        profile = (user.username, user.first_name, user.last_name)
+        if self._profiles.get(user.id) != profile:
+            writes.add_user(user.id, user.username, user.first_name, user.last_name)
+            self._profiles.set(user.id, profile)
+        writes.log_request(user.id, record.message.text, record.response_text, record.command)
+
+
+class ErrorMiddleware(Middleware):
+    """Ошибка обработчика: запись в лог и ответ пользователю"""
+
+    def after(self, application, record):
+        if record.error is None:
+            return
+        logger.error(f"Error in {record.command}: {record.error}",
+                     exc_info=(type(record.error), record.error, record.error.__traceback__))
+        record.response_text = f"Ошибка: {record.error}"
+        application.bot.reply_to(record.message, record.error_reply)
+
+
+def default_middleware():
+    return [TimingMiddleware(), BookkeepingMiddleware(), ErrorMiddleware()]
+
+
+class Pipeline:
+    """Конвейер middleware вокруг обработчиков сообщений.
+
+    Обработчик только вычисляет и отправляет ответ и сообщает итог через
+    note(); учет пользователя, лог запроса, замер времени и обработка
+    ошибок выполняются здесь один раз на сообщение. Текст ответа при ошибке
+    задается обработчику через handler(error=...).
+    """
+
+    def __init__(self, middleware=None):
+        self.middleware = list(middleware) if middleware is not None else default_middleware()
+
+    def wrap(self, application, func):
+        error_reply = getattr(func, 'error_reply', ERROR_REPLY)
+
+        @wraps(func)
+        def wrapped(message):
+            record = UpdateRecord(message, error_reply)
+            previous = getattr(_current, 'record', None)
+            _current.record = record
+            try:
+                for middleware in self.middleware:
+                    middleware.before(application, record)
+                try:
+                    func(message)
+                except Exception as e:
+                    record.error = e
+                for middleware in reversed(self.middleware):
+                    try:
+                        middleware.after(application, record)
+                    except Exception as e:
+                        logger.error(f"❌ Ошибка middleware {type(middleware).__name__}: {e}")
+            finally:
+                _current.record = previous
+
+        return wrapped
+
+    def stats(self):
+        """Метрики всех шагов, у которых они есть"""
+        stats = {}
+        for middleware in self.middleware:
+            if hasattr(middleware, 'stats'):
+                stats.update(middleware.stats())
+        return stats
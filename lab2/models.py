@@ -0,0 +1,118 @@
+class Row:
+    """Базовый класс компактной строки результата с __slots__.
+
+    Наследник перечисляет колонки в COLUMNS в порядке аргументов
+    конструктора, а запросы строят список колонок из COLUMNS, поэтому
+    класс и SELECT меняются согласованно, а обработчики обращаются к
+    полям по имени, а не по позиции в кортеже.
+    """
+
+    __slots__ = ()
+    COLUMNS = ()
+    # SQL-выражения для колонок, которые нельзя выбрать просто по имени
+    EXPRESSIONS = {}
+
+    @classmethod
+    def columns(cls):
+        """Список колонок для SELECT"""
+        return ', '.join(
+            f'{cls.EXPRESSIONS[column]} AS {column}' if column in cls.EXPRESSIONS else column
+            for column in cls.COLUMNS
+        )
+
+    @classmethod
+    def row_factory(cls, cursor, row):
+        """Фабрика строк для sqlite3: cursor.row_factory = Order.row_factory"""
+        return cls(*row)
+
+    def to_dict(self):
+        return {column: getattr(self, column) for column in self.COLUMNS}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        fields = ', '.join(f'{column}={getattr(self, column)!r}' for column in self.COLUMNS)
+        return f'{type(self).__name__}({fields})'
+
+
+class Order(Row):
+    """Заказ: сумма в копейках, время - секунды Unix epoch"""
+
+    __slots__ = COLUMNS = (
+        'id', 'user_id', 'customer_name', 'product_name', 'quantity',
+        'total_kopecks', 'status', 'created_ts', 'updated_ts', 'notes',
+    )
+    # Пока фоновая миграция не дошла до старой строки, значения вычисляются
+    # из прежних колонок total_price и created_at/updated_at
+    EXPRESSIONS = {
+        'total_kopecks': "COALESCE(total_kopecks, CAST(ROUND(COALESCE(total_price, 0) * 100) AS INTEGER))",
+        'created_ts': "COALESCE(created_ts, CAST(strftime('%s', created_at) AS INTEGER))",
+        'updated_ts': "COALESCE(updated_ts, CAST(strftime('%s', COALESCE(updated_at, created_at)) AS INTEGER))",
+    }
+
+    def __init__(self, id, user_id, customer_name, product_name, quantity,
+                 total_kopecks, status, created_ts, updated_ts, notes):
+        self.id = id
+        self.user_id = user_id
+        self.customer_name = customer_name
+        self.product_name = product_name
+        self.quantity = quantity
+        self.total_kopecks = total_kopecks
+        self.status = status
+        self.created_ts = created_ts
+        self.updated_ts = updated_ts
+        self.notes = notes
+
+
+class Task(Row):
+    __slots__ = COLUMNS = (
+        'id', 'title', 'description', 'assigned_to', 'priority',
+        'status', 'due_date', 'created_at', 'priority_rank',
+    )
+
+    def __init__(self, id, title, description, assigned_to, priority,
+                 status, due_date, created_at, priority_rank):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.assigned_to = assigned_to
+        self.priority = priority
+        self.status = status
+        self.due_date = due_date
+        self.created_at = created_at
+        self.priority_rank = priority_rank
+
+
+class User(Row):
+    __slots__ = COLUMNS = (
+        'user_id', 'username', 'first_name', 'last_name', 'created_at', 'last_activity',
+    )
+
+    def __init__(self, user_id, username, first_name, last_name, created_at, last_activity):
+        self.user_id = user_id
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+        self.created_at = created_at
+        self.last_activity = last_activity
+
+
+class UserRequest(Row):
+    __slots__ = COLUMNS = (
+        'id', 'user_id', 'request_text', 'response_text', 'command_used', 'created_at',
+    )
+    # Ответ и команда хранятся как ID в request_texts; в строках, до которых
+    # еще не дошла фоновая миграция, - текстом в прежних колонках
+    EXPRESSIONS = {
+        'response_text': "COALESCE(response_text, (SELECT text FROM request_texts WHERE id = response_id))",
+        'command_used': "COALESCE(command_used, (SELECT text FROM request_texts WHERE id = command_id))",
+    }
+
+    def __init__(self, id, user_id, request_text, response_text, command_used, created_at):
+        self.id = id
+        self.user_id = user_id
+        self.request_text = request_text
+        self.response_text = response_text
+        self.command_used = command_used
+        self.created_at = created_at
@@ -0,0 +1,132 @@
+from datetime import datetime
+
+# Схемы наборов данных из data/*.json. Используется подмножество словаря
+# JSON Schema: type, properties, required, additionalProperties (схема для
+# произвольных ключей объекта), items и format: date.
+
+STRING = {'type': 'string'}
+STRINGS = {'type': 'array', 'items': STRING}
+# Цена - число рублей или текст вроде "Уточнять"
+PRICE = {'type': ['number', 'string']}
+
+SCHEMAS = {
+    'contacts': {
+        'type': 'object',
+        'additionalProperties': {
+            'type': 'object',
+            'required': ['position'],
+            'properties': {
+                'position': STRING,
+                'phone': STRING,
+                'email': STRING,
+                'comment': STRING,
+            },
+        },
+    },
+    'events': {
+        'type': 'object',
+        'additionalProperties': {
+            'type': 'object',
+            'required': ['date', 'type', 'description'],
+            'properties': {
+                'date': {'type': 'string', 'format': 'date'},
+                'type': STRING,
+                'description': STRING,
+                'status': STRING,
+            },
+        },
+    },
+    'company_info': {
+        'type': 'object',
+        'required': ['name'],
+        'properties': {
+            'name': STRING,
+            'description': STRING,
+            'phone': STRING,
+            'email': STRING,
+            'address': STRING,
+            'industry': STRING,
+            'foundation_year': STRING,
+            'team_size': STRING,
+            'mission': STRING,
+            'key_activities': STRINGS,
+            'delivery_info': {'type': 'object', 'additionalProperties': STRING},
+        },
+    },
+    'products': {
+        'type': 'object',
+        'required': ['products'],
+        'properties': {
+            'products': {
+                'type': 'object',
+                'additionalProperties': {
+                    'type': 'object',
+                    'required': ['name', 'price'],
+                    'properties': {
+                        'name': STRING,
+                        'price': PRICE,
+                        'original_price': PRICE,
+                        'discount': STRING,
+                        'description': STRING,
+                        'delivery_time': STRING,
+                        'features': STRINGS,
+                    },
+                },
+            },
+            'current_promotions': STRINGS,
+        },
+    },
+    'faq': {
+        'type': 'array',
+        'items': {
+            'type': 'object',
+            'required': ['question', 'answer'],
+            'properties': {
+                'question': STRING,
+                'answer': STRING,
+            },
+        },
+    },
+}
+
+TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'number': (int, float),
+}
+
+
+def _is_type(value, name):
+    # bool - подкласс int, но ценой быть не может
+    return isinstance(value, TYPES[name]) and not (name == 'number' and isinstance(value, bool))
+
+
+def validate(data, schema, path='$'):
+    """Проверка данных по схеме; список ошибок вида "путь: описание" """
+    types = schema.get('type')
+    if types is not None:
+        types = [types] if isinstance(types, str) else types
+        if not any(_is_type(data, name) for name in types):
+            return [f"{path}: ожидается {' или '.join(types)}, получено {type(data).__name__}"]
+
+    errors = []
+    if isinstance(data, dict):
+        for key in schema.get('required', ()):
+            if key not in data:
+                errors.append(f"{path}: нет обязательного поля {key!r}")
+        properties = schema.get('properties', {})
+        extra = schema.get('additionalProperties')
+        for key, value in data.items():
+            field_schema = properties.get(key, extra)
+            if field_schema is not None:
+                errors.extend(validate(value, field_schema, f"{path}.{key}"))
+    elif isinstance(data, list) and 'items' in schema:
+        for i, value in enumerate(data):
+            errors.extend(validate(value, schema['items'], f"{path}[{i}]"))
+    elif schema.get('format') == 'date':
+        try:
+            datetime.strptime(data, '%Y-%m-%d')
+        except ValueError:
+            errors.append(f"{path}: дата должна быть в формате ГГГГ-ММ-ДД, получено {data!r}")
+    return errors
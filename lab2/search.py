@@ -0,0 +1,169 @@
+import re
+import time
+import logging
+import threading
+from collections import defaultdict
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Сколько результатов отдавать на один inline-запрос (Telegram допускает 50)
+MAX_RESULTS = 20
+# Как часто сверять индекс с каталогом (секунды): между проверками запросы
+# не обращаются к файлам вовсе
+INDEX_CHECK_INTERVAL = 30
+# Мемоизация ответов по тексту запроса: каждая нажатая клавиша - новый префикс
+QUERY_CACHE_SIZE = 5000
+QUERY_CACHE_TTL = 300
+# Доля совпавших триграмм слова, при которой слово считается найденным
+TRIGRAM_THRESHOLD = 0.5
+
+WORD_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    return str(text).lower().replace('ё', 'е')
+
+
+def words(text):
+    return WORD_RE.findall(normalize(text))
+
+
+def trigrams(word):
+    padded = f' {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchItem:
+    """Элемент поиска: товар, событие или контакт с готовым текстом ответа"""
+
+    __slots__ = ('id', 'kind', 'title', 'description', 'text', 'keywords')
+
+    def __init__(self, id, kind, title, description, text, keywords):
+        self.id = id
+        self.kind = kind
+        self.title = title
+        self.description = description
+        self.text = text
+        self.keywords = keywords
+
+
+def catalog_items(catalog):
+    """Элементы поиска из наборов данных каталога"""
+    items = []
+    products = catalog.products.get('products', {})
+    for key, product in products.items():
+        name = product.get('name', key)
+        price = product.get('price')
+        price_text = f"{price} руб." if isinstance(price, (int, float)) else str(price or 'цена по запросу')
+        items.append(SearchItem(
+            f'product:{key}', 'product', f"🎲 {name}",
+            f"{price_text} • {product.get('delivery_time', '')}",
+            f"🎯 {name}\n💰 Цена: {price_text}\n📝 {product.get('description', '')}\n"
+            f"⏱ Срок: {product.get('delivery_time', 'уточняйте')}\n\nЗаказать: /add_order",
+            ' '.join([key, name, product.get('description', '')] + product.get('features', [])),
+        ))
+    for name, event in catalog.events.items():
+        items.append(SearchItem(
+            f'event:{name}', 'event', f"📅 {name}",
+            f"{event.get('date', '')} • {event.get('description', '')}",
+            f"📅 {name}\n🗓 {event.get('date', '')} ({event.get('type', '')})\n"
+            f"📝 {event.get('description', '')}",
+            ' '.join([name, event.get('type', ''), event.get('description', '')]),
+        ))
+    for name, contact in catalog.contacts.items():
+        items.append(SearchItem(
+            f'contact:{name}', 'contact', f"👤 {name}",
+            f"{contact.get('position', '')} • {contact.get('email', '')}",
+            f"👤 {name}\n💼 {contact.get('position', '')}\n📞 {contact.get('phone', '')}\n"
+            f"📧 {contact.get('email', '')}\n💬 {contact.get('comment', '')}",
+            ' '.join([name, contact.get('position', ''), contact.get('comment', '')]),
+        ))
+    return items
+
+
+class CatalogSearch:
+    """Индекс для inline-поиска по товарам, событиям и контактам.
+
+    Каждое слово элемента попадает в индекс всеми префиксами (набор данных
+    небольшой), поэтому ввод с клавиатуры находит совпадения с первых
+    букв. Слова длиннее трех букв, не найденные по префиксу, ищутся по
+    триграммам, что прощает опечатки и окончания. Ответы мемоизируются по
+    тексту запроса; индекс пересобирается, когда каталог отдает новые данные.
+    """
+
+    def __init__(self, catalog, check_interval=INDEX_CHECK_INTERVAL):
+        self.catalog = catalog
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._source = None
+        self._checked_at = None
+        # (элементы, префикс -> позиции, триграмма -> позиции, кэш ответов)
+        # подменяются целиком, чтобы параллельный запрос не увидел смесь версий
+        self._index = ([], {}, {}, TTLCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL))
+        self.builds = 0
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return
+            # Каталог возвращает те же объекты, пока файлы не изменились
+            source = (self.catalog.products, self.catalog.events, self.catalog.contacts)
+            if self._source is None or any(a is not b for a, b in zip(source, self._source)):
+                self._build(catalog_items(self.catalog))
+                self._source = source
+            self._checked_at = now
+
+    def _build(self, items):
+        prefixes = defaultdict(set)
+        grams = defaultdict(set)
+        for position, item in enumerate(items):
+            for word in set(words(item.title) + words(item.keywords)):
+                for end in range(1, len(word) + 1):
+                    prefixes[word[:end]].add(position)
+                for gram in trigrams(word):
+                    grams[gram].add(position)
+        self._index = (items, dict(prefixes), dict(grams),
+                       TTLCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL))
+        self.builds += 1
+        logger.debug(f"🔎 Индекс поиска построен: {len(items)} элементов")
+
+    @staticmethod
+    def _match_word(word, prefixes, grams):
+        matched = prefixes.get(word)
+        if matched or len(word) < 3:
+            return matched or set()
+        counts = defaultdict(int)
+        word_grams = trigrams(word)
+        for gram in word_grams:
+            for position in grams.get(gram, ()):
+                counts[position] += 1
+        needed = len(word_grams) * TRIGRAM_THRESHOLD
+        return {position for position, count in counts.items() if count >= needed}
+
+    def search(self, query, limit=MAX_RESULTS):
+        """Элементы, подходящие под все слова запроса; пустой запрос - все подряд"""
+        self._refresh()
+        items, prefixes, grams, cache = self._index
+        key = (' '.join(words(query)), limit)
+        results = cache.get(key)
+        if results is not None:
+            return results
+
+        query_words = key[0].split()
+        if query_words:
+            positions = None
+            for word in query_words:
+                matched = self._match_word(word, prefixes, grams)
+                positions = matched if positions is None else positions & matched
+                if not positions:
+                    break
+            results = [items[position] for position in sorted(positions)[:limit]]
+        else:
+            results = items[:limit]
+        cache.set(key, results)
+        return results
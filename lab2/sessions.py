@@ -0,0 +1,126 @@
+import json
+import time
+import logging
+import threading
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Время жизни незавершенного диалога и лимит одновременных диалогов
+SESSION_TTL = 15 * 60
+MAX_SESSIONS = 1000
+
+# Шаги диалога оформления заказа
+STEP_CUSTOMER = 'customer'
+STEP_PRODUCT = 'product'
+STEP_QUANTITY = 'quantity'
+STEP_CONFIRM = 'confirm'
+
+
+class OrderSession:
+    """Состояние диалога /add_order одного пользователя"""
+
+    def __init__(self, step=STEP_CUSTOMER, customer_name=None, product_key=None,
+                 quantity=None, updated_at=None):
+        self.step = step
+        self.customer_name = customer_name
+        self.product_key = product_key
+        self.quantity = quantity
+        self.updated_at = updated_at or time.time()
+
+    def to_dict(self):
+        return {
+            'step': self.step,
+            'customer_name': self.customer_name,
+            'product_key': self.product_key,
+            'quantity': self.quantity,
+            'updated_at': self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class SessionStore:
+    """Хранилище диалогов в памяти с TTL и ограничением по количеству.
+
+    Обработчики читают и пишут только в память. При включенных снимках
+    живые сессии периодически сохраняются в SQLite через поток записи и
+    восстанавливаются при старте, чтобы диалоги переживали перезапуск.
+    """
+
+    def __init__(self, ttl=SESSION_TTL, maxsize=MAX_SESSIONS):
+        self.ttl = ttl
+        self._sessions = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._snapshot_stop = threading.Event()
+        self._snapshot_thread = None
+
+    def get(self, user_id):
+        return self._sessions.get(user_id)
+
+    def save(self, user_id, session):
+        session.updated_at = time.time()
+        self._sessions.set(user_id, session)
+
+    def discard(self, user_id):
+        return self._sessions.pop(user_id)
+
+    def __contains__(self, user_id):
+        return user_id in self._sessions
+
+    def __len__(self):
+        return len(self._sessions)
+
+    # ---------- Снимки в SQLite ----------
+
+    def snapshot(self, db):
+        """Сохранить все живые сессии в БД"""
+        rows = [(user_id, json.dumps(session.to_dict(), ensure_ascii=False))
+                for user_id, session, _ in self._sessions.items()]
+        db.save_sessions(rows)
+        return len(rows)
+
+    def restore(self, db):
+        """Загрузить сессии из последнего снимка, пропуская просроченные"""
+        now = time.time()
+        restored = 0
+        for user_id, payload in db.load_sessions():
+            try:
+                session = OrderSession.from_dict(json.loads(payload))
+            except Exception as e:
+                logger.error(f"Ошибка восстановления сессии {user_id}: {e}")
+                continue
+            remaining = self.ttl - (now - session.updated_at)
+            if remaining > 0:
+                self._sessions.set(user_id, session, ttl=remaining)
+                restored += 1
+        logger.info(f"Восстановлено диалогов: {restored}")
+        return restored
+
+    def start_snapshots(self, db, interval):
+        """Запустить периодическое сохранение снимков в фоне"""
+        def loop():
+            while not self._snapshot_stop.wait(interval):
+                try:
+                    self.snapshot(db)
+                except Exception as e:
+                    logger.error(f"Ошибка сохранения снимка сессий: {e}")
+
+        self._snapshot_thread = threading.Thread(target=loop, name='session-snapshots', daemon=True)
+        self._snapshot_thread.start()
+
+    def stop_snapshots(self, db, save=True):
+        """Остановить фоновые снимки и сохранить финальный"""
+        if self._snapshot_thread is None:
+            return
+        self._snapshot_stop.set()
+        self._snapshot_thread.join()
+        self._snapshot_thread = None
+        if not save:
+            return
+        try:
+            self.snapshot(db)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения снимка сессий: {e}")
@@ -0,0 +1,141 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+from backup import copy_database
+from database import DatabaseReader
+
+logger = logging.getLogger(__name__)
+
+# Как часто обновлять снимок и сколько страниц копировать за шаг backup
+SNAPSHOT_INTERVAL = 60
+PAGES_PER_STEP = 1024
+STEP_SLEEP = 0.005
+# Сколько раз запись в рабочую БД может перезапустить снятие снимка;
+# дальше попытка прекращается, а читатели пользуются прежним снимком
+MAX_RESTARTS = 3
+
+# Допустимый возраст снимка (секунды) для команд, которые можно обслуживать
+# из него; команды без записи всегда читают рабочую БД
+DEFAULT_FRESHNESS = {
+    'stats': 300,
+    'orders': 60,
+    'find_order': 120,
+    'recent_orders': 120,
+}
+
+
+def parse_freshness(value):
+    """Разбор строки вида "stats:600,orders:30" из переменной окружения"""
+    freshness = dict(DEFAULT_FRESHNESS)
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        command, _, seconds = item.partition(':')
+        try:
+            freshness[command.strip().lstrip('/').lower()] = float(seconds)
+        except ValueError:
+            logger.error(f"Неверная свежесть снимка: {item}")
+    return freshness
+
+
+class SnapshotReader(DatabaseReader):
+    """Чтение из файла снимка в режиме только для чтения"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def get_connection(self):
+        return sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+
+
+class AnalyticsSnapshot:
+    """Периодическая копия рабочей БД для тяжелых запросов на чтение.
+
+    Копия снимается через sqlite3 backup API порциями страниц с паузами,
+    в WAL-режиме это не блокирует поток записи. Готовый файл атомарно
+    подменяет предыдущий снимок, поэтому читатели всегда видят целую копию.
+    """
+
+    def __init__(self, db_path, path=None, interval=SNAPSHOT_INTERVAL, freshness=None):
+        self.db_path = db_path
+        self.path = path or os.path.splitext(db_path)[0] + '.snapshot.db'
+        self.interval = interval
+        self.freshness = freshness if freshness is not None else dict(DEFAULT_FRESHNESS)
+        self.reader = SnapshotReader(self.path)
+        self.refreshes = 0
+        self.failures = 0
+        self.last_duration = None
+        self.last_error = None
+
+        self._taken_at = os.path.getmtime(self.path) if os.path.exists(self.path) else None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def age(self):
+        """Возраст снимка в секундах или None, если снимка еще нет"""
+        if self._taken_at is None:
+            return None
+        return time.time() - self._taken_at
+
+    def is_fresh(self, command):
+        max_age = self.freshness.get(command)
+        age = self.age()
+        return max_age is not None and age is not None and age <= max_age
+
+    def refresh(self):
+        """Снять новый снимок рабочей БД.
+
+        Если запись в рабочую БД перезапускает копирование больше
+        MAX_RESTARTS раз, бросает BackupError и оставляет прежний снимок.
+        """
+        with self._lock:
+            started = time.perf_counter()
+            tmp_path = self.path + '.tmp'
+            try:
+                # Снимок читается только на чтение, WAL ему не нужен
+                copy_database(self.db_path, tmp_path, pages=PAGES_PER_STEP, sleep=STEP_SLEEP,
+                              max_restarts=MAX_RESTARTS)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = e
+                raise
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self.last_error = None
+
+            self._taken_at = time.time()
+            self.last_duration = time.perf_counter() - started
+            self.refreshes += 1
+            logger.debug(f"📸 Снимок аналитики обновлен за {self.last_duration * 1000:.0f} мс")
+
+    def start(self):
+        """Снять первый снимок при необходимости и обновлять его в фоне"""
+        if self._thread is not None:
+            return
+
+        def loop():
+            while True:
+                age = self.age()
+                if age is None or age >= self.interval:
+                    try:
+                        self.refresh()
+                    except Exception as e:
+                        logger.error(f"❌ Ошибка обновления снимка аналитики "
+                                     f"(неудач: {self.failures}): {e}")
+                    age = 0
+                if self._stop.wait(self.interval - age):
+                    return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name='analytics-snapshot', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
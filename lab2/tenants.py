@@ -0,0 +1,133 @@
+import os
+import json
+import logging
+import threading
+
+from application import Application
+from dedup import UpdateDeduplicator
+from intake import UpdateIntake, parse_priorities, QUEUE_SIZE, WORKERS
+from sessions import MAX_SESSIONS
+
+logger = logging.getLogger(__name__)
+
+# Файл с описанием ботов; путь задается переменной TENANTS_CONFIG
+TENANTS_CONFIG = 'tenants.json'
+
+
+def load_tenants(path):
+    """Чтение и проверка конфигурации ботов.
+
+    Формат: {"tenants": [{"name": "gameboard", "token_env": "BOT_TOKEN",
+    "data_folder": "data", "db_path": "gameboard_bot.db", "queue_limit": 50,
+    "max_sessions": 200, "snapshot_interval": 0}, ...]}. Токен задается
+    напрямую ("token") или именем переменной окружения ("token_env").
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    tenants = []
+    names = set()
+    for item in config.get('tenants', []):
+        name = item.get('name')
+        if not name or name in names:
+            raise ValueError(f"Бот без имени или с повторяющимся именем: {name!r}")
+        names.add(name)
+
+        token = item.get('token') or os.getenv(item.get('token_env', ''))
+        if not token:
+            raise ValueError(f"Не задан токен бота {name}")
+
+        tenants.append({
+            'name': name,
+            'token': token,
+            'data_folder': item.get('data_folder', os.path.join('tenants', name, 'data')),
+            'db_path': item.get('db_path', os.path.join('tenants', name, 'bot.db')),
+            'queue_limit': item.get('queue_limit'),
+            'max_sessions': item.get('max_sessions', MAX_SESSIONS),
+            'snapshot_interval': item.get('snapshot_interval'),
+        })
+    if not tenants:
+        raise ValueError(f"В {path} не описано ни одного бота")
+    return tenants
+
+
+class TenantRuntime:
+    """Несколько ботов в одном процессе.
+
+    У каждого бота свой токен, папка данных и БД (свое Application), а
+    очередь обновлений с рабочими потоками и кэш дедупликации общие. Каждый
+    бот опрашивает Telegram в своем потоке; обработка идет в общем пуле с
+    лимитом очереди на бота, метрики ведутся по каждому боту отдельно.
+    """
+
+    def __init__(self, tenants, handlers, priorities=None,
+                 maxsize=QUEUE_SIZE, workers=WORKERS):
+        self.intake = UpdateIntake(priorities=priorities, maxsize=maxsize, workers=workers)
+        self.dedup = UpdateDeduplicator()
+        self.apps = {}
+        for tenant in tenants:
+            self.apps[tenant['name']] = Application(
+                token=tenant['token'],
+                data_folder=tenant['data_folder'],
+                db_path=tenant['db_path'],
+                handlers=handlers,
+                name=tenant['name'],
+                intake=self.intake,
+                dedup=self.dedup,
+                queue_limit=tenant['queue_limit'],
+                max_sessions=tenant['max_sessions'],
+                snapshot_interval=tenant['snapshot_interval']
+            )
+        self._threads = []
+
+    @classmethod
+    def from_env(cls, handlers):
+        return cls(
+            load_tenants(os.getenv('TENANTS_CONFIG', TENANTS_CONFIG)),
+            handlers,
+            priorities=parse_priorities(os.getenv('INTAKE_PRIORITIES')),
+            maxsize=int(os.getenv('INTAKE_QUEUE_SIZE', QUEUE_SIZE)),
+            workers=int(os.getenv('INTAKE_WORKERS', WORKERS))
+        )
+
+    def start(self):
+        """Создать компоненты всех ботов и запустить polling каждого в своем потоке"""
+        for name, application in self.apps.items():
+            db_folder = os.path.dirname(application.db_path)
+            if db_folder:
+                os.makedirs(db_folder, exist_ok=True)
+            application.catalog
+            application.db
+            application.snapshot
+            application.maintenance
+            application.backups
+            application.health
+            application.bot
+            thread = threading.Thread(target=application.bot.infinity_polling,
+                                      name=f'polling-{name}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            logger.info(f"🤖 Бот {name} запущен "
+                        f"(БД: {'доступна' if application.db_available else 'недоступна'})")
+
+    def run(self):
+        """Запустить всех ботов и ждать остановки процесса"""
+        self.start()
+        try:
+            while any(thread.is_alive() for thread in self._threads):
+                for thread in self._threads:
+                    thread.join(timeout=1)
+        finally:
+            self.close()
+
+    def close(self):
+        for application in self.apps.values():
+            application.stop_polling()
+        # Сначала дорабатывает общая очередь, затем закрываются БД ботов
+        self.intake.stop()
+        for application in self.apps.values():
+            application.close()
+
+    def stats(self):
+        """Метрики очереди по каждому боту"""
+        return {name: self.intake.stats(name) for name in self.apps}
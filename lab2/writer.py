@@ -0,0 +1,127 @@
+import queue
+import sqlite3
+import logging
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# Сколько команд записи максимум объединяется в одну транзакцию
+MAX_BATCH = 200
+
+_STOP = object()
+
+
+class DatabaseWriter(threading.Thread):
+    """Единственный поток, который пишет в SQLite.
+
+    Обработчики не открывают собственных пишущих соединений, а отправляют
+    команды в очередь. Поток забирает все накопившиеся команды и выполняет
+    их одной транзакцией (group commit), каждую внутри своего SAVEPOINT,
+    чтобы ошибка одной команды не откатывала остальные. Результат команды
+    (например, lastrowid) возвращается через Future после COMMIT.
+    """
+
+    def __init__(self, db_path, max_batch=MAX_BATCH):
+        super().__init__(name='db-writer', daemon=True)
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.commands = 0
+        self.batches = 0
+        self.largest_batch = 0
+        # Число откатов: по нему кэши ID, выданных внутри транзакции, узнают,
+        # что вставка могла быть отменена
+        self.rollbacks = 0
+
+    def submit(self, func, *args):
+        """Поставить команду func(conn, *args) в очередь записи"""
+        future = Future()
+        self.queue.put((future, func, args))
+        return future
+
+    def stop(self, timeout=None):
+        """Дописать накопленные команды и остановить поток"""
+        self.queue.put(_STOP)
+        self.join(timeout)
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'commands': self.commands,
+            'batches': self.batches,
+            'largest_batch': self.largest_batch,
+            'rollbacks': self.rollbacks,
+        }
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        return conn
+
+    def run(self):
+        conn = self._connect()
+        try:
+            while True:
+                item = self.queue.get()
+                if item is _STOP:
+                    break
+
+                batch = [item]
+                stopping = False
+                while len(batch) < self.max_batch:
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+
+                self._execute(conn, batch)
+                if stopping:
+                    break
+        finally:
+            conn.close()
+            logger.info("🛑 Поток записи в БД остановлен")
+
+    def _execute(self, conn, batch):
+        results = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for future, func, args in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute('SAVEPOINT command')
+                try:
+                    result = func(conn, *args)
+                    conn.execute('RELEASE command')
+                    results.append((future, result, None))
+                except Exception as e:
+                    self.rollbacks += 1
+                    conn.execute('ROLLBACK TO command')
+                    conn.execute('RELEASE command')
+                    results.append((future, None, e))
+            conn.execute('COMMIT')
+        except Exception as e:
+            logger.error(f"❌ Ошибка групповой записи в БД: {e}")
+            self.rollbacks += 1
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for future, _, _ in batch:
+                if future.running() or future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+            return
+
+        self.commands += len(batch)
+        self.batches += 1
+        self.largest_batch = max(self.largest_batch, len(batch))
+
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)